@@ -12,7 +12,8 @@ import {
     PresentationControls,
     Stage,
     Bounds,
-    Grid
+    Grid,
+    useGLTF
 } from '@react-three/drei';
 import { Box as BoxIcon, Maximize, MousePointer2, Info, Move, Image as ImageIcon } from 'lucide-react';
 import { BlueprintRoom } from '../types';
@@ -90,6 +91,35 @@ const Room3D: React.FC<Room3DProps> = ({ room, index }) => {
 };
 
 
+// Walls and floor slabs extruded by the BIM engine, delivered as one binary glTF buffer
+const BimMesh: React.FC<{ url: string }> = ({ url }) => {
+    const { scene } = useGLTF(url);
+    return <primitive object={scene} />;
+};
+
+// Reads the NDJSON stream of /api/bim/convert: partial events go to onEvent as the
+// detectors finish, the promise resolves with the final model.
+async function readBimStream(response: Response, onEvent: (event: any) => void): Promise<any> {
+    const reader = response.body!.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value, { stream: !done });
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (!line) continue;
+            const event = JSON.parse(line);
+            if (event.event === 'result') return event;
+            if (event.event === 'error') throw new Error(event.error || 'Algorithmic engine failed');
+            onEvent(event);
+        }
+        if (done) throw new Error('BIM stream ended without a result');
+    }
+}
+
 const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blueprint: initialBlueprint }) => {
     const [rooms, setRooms] = React.useState<BlueprintRoom[]>(initialBlueprint?.rooms || [
         { name: 'Living Room', x: 0, y: 0, width: 6, height: 8 },
@@ -101,6 +131,7 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
     const [isAnalyzing, setIsAnalyzing] = React.useState(false);
     const [engine, setEngine] = React.useState<'ai' | 'algorithmic'>('ai');
     const [bimMetadata, setBimMetadata] = React.useState<any>(null);
+    const [bimMesh, setBimMesh] = React.useState<string | null>(null);
     const fileInputRef = React.useRef<HTMLInputElement>(null);
 
     // Sync with initialBlueprint if it changes
@@ -131,8 +162,8 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
 
                         const response = await fetch('http://localhost:5000/api/bim/convert', {
                             method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({ image: base64, scaleFactor: 0.05 })
+                            headers: { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' },
+                            body: JSON.stringify({ image: base64, scaleFactor: 0.05, stream: true })
                         });
 
                         console.log('BIM Response status:', response.status, response.statusText);
@@ -143,7 +174,13 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
                             throw new Error(error.error || 'Algorithmic engine failed');
                         }
 
-                        const result = await response.json();
+                        // Show the rooms as soon as they are detected, before openings and metrics
+                        const result = await readBimStream(response, (event) => {
+                            console.log('BIM partial result:', event.event);
+                            if (event.event === 'rooms' && event.rooms.length > 0) {
+                                processBimResult({ rooms: event.rooms }, true);
+                            }
+                        });
                         console.log('BIM Result received:', result);
                         processBimResult(result);
                     }
@@ -165,48 +202,56 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
         }
     };
 
-    const processBimResult = (result: any) => {
+    // partial results only update the rooms and never alert; a final model with a mesh
+    // (walls and slabs) replaces the scene even when no rooms were detected
+    const processBimResult = (result: any, partial = false) => {
         console.log("Processing Engine Result:", result);
 
-        if (result && result.rooms && Array.isArray(result.rooms) && result.rooms.length > 0) {
-            const validRooms = result.rooms
-                .map((r: any) => {
-                    let x = Number(r.x);
-                    let y = Number(r.y);
-                    let width = Number(r.width);
-                    let height = Number(r.height);
-
-                    // If we have corners but no dimensions, calculate bounding box
-                    if (r.corners && r.corners.length > 0 && (isNaN(width) || isNaN(height))) {
-                        const xs = r.corners.map((p: any) => p[0]);
-                        const ys = r.corners.map((p: any) => p[1]);
-                        const minX = Math.min(...xs);
-                        const maxX = Math.max(...xs);
-                        const minY = Math.min(...ys);
-                        const maxY = Math.max(...ys);
-
-                        x = minX;
-                        y = minY;
-                        width = maxX - minX;
-                        height = maxY - minY;
-                    }
+        const hasRooms = result && result.rooms && Array.isArray(result.rooms) && result.rooms.length > 0;
+        const validRooms = (hasRooms ? result.rooms : [])
+            .map((r: any) => {
+                let x = Number(r.x);
+                let y = Number(r.y);
+                let width = Number(r.width);
+                let height = Number(r.height);
+
+                // If we have corners but no dimensions, calculate bounding box
+                if (r.corners && r.corners.length > 0 && (isNaN(width) || isNaN(height))) {
+                    const xs = r.corners.map((p: any) => p[0]);
+                    const ys = r.corners.map((p: any) => p[1]);
+                    const minX = Math.min(...xs);
+                    const maxX = Math.max(...xs);
+                    const minY = Math.min(...ys);
+                    const maxY = Math.max(...ys);
+
+                    x = minX;
+                    y = minY;
+                    width = maxX - minX;
+                    height = maxY - minY;
+                }
+
+                return {
+                    name: String(r.name || 'Room'),
+                    x: x || 0,
+                    y: y || 0,
+                    width: width || 4,
+                    height: height || 4
+                };
+            })
+            .filter((r: any) => r.width > 0 && r.height > 0);
+
+        if (partial) {
+            if (validRooms.length > 0) setRooms(validRooms);
+            return;
+        }
 
-                    return {
-                        name: String(r.name || 'Room'),
-                        x: x || 0,
-                        y: y || 0,
-                        width: width || 4,
-                        height: height || 4
-                    };
-                })
-                .filter((r: any) => r.width > 0 && r.height > 0);
-
-            if (validRooms.length > 0) {
-                setRooms(validRooms);
-                setBimMetadata(result.metadata || null);
-            } else {
-                alert("Extracted data was invalid. Try a different resolution.");
-            }
+        const mesh = result && typeof result.mesh === 'string' ? result.mesh : null;
+        if (validRooms.length > 0 || mesh) {
+            setRooms(validRooms);
+            setBimMetadata(result.metadata || null);
+            setBimMesh(mesh);
+        } else if (hasRooms) {
+            alert("Extracted data was invalid. Try a different resolution.");
         } else {
             alert("No rooms detected in this blueprint.");
         }
@@ -221,6 +266,7 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
             { name: 'Bathroom', x: 6, y: 5, width: 4, height: 3 },
         ]);
         setBimMetadata(null);
+        setBimMesh(null);
     };
 
     // Calculate center to offset the view
@@ -399,6 +445,7 @@ const Blueprint3D: React.FC<{ blueprint?: { rooms: BlueprintRoom[] } }> = ({ blu
                                 {rooms.map((room, idx) => (
                                     <Room3D key={`${room.name}-${idx}`} room={room} index={idx} />
                                 ))}
+                                {bimMesh && <BimMesh url={bimMesh} />}
                             </group>
                         </Bounds>
 
@@ -0,0 +1,677 @@
+"""
+Benchmarks for the Blueprint to 3D BIM converter.
+
+    python scripts/bim_benchmark.py merge [--sizes 250 1000 2000]
+    python scripts/bim_benchmark.py modes plan1.png plan2.png [--pyramid 4] [--tile-size 1024]
+    python scripts/bim_benchmark.py profiles plans/*.png [--repeats 3]
+    python scripts/bim_benchmark.py export plans/*.png [--precision 3]
+    python scripts/bim_benchmark.py stages [--sizes 1 4 16 140] [--noise 0.3]
+    python scripts/bim_benchmark.py golden [scripts/bim_golden.json] [--record]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from blueprint_to_3d_bim import (
+    DETECTOR_PARAMS, EXPORT_FORMATS, PREPROCESS_PROFILES, AdvancedBlueprintProcessor, BlueprintPipeline,
+    BlueprintTo3DBIM
+)
+
+
+def legacy_merge_parallel_lines(lines: np.ndarray,
+                                angle_threshold: float = 5.0,
+                                distance_threshold: float = 10.0) -> List:
+    """The original pairwise merge, kept as the reference for benchmarks"""
+    if lines is None or len(lines) == 0:
+        return []
+
+    lines = lines.reshape(-1, 4)
+    merged = []
+    used = set()
+
+    def point_to_line_distance(point, line):
+        x0, y0 = point
+        x1, y1, x2, y2 = line
+        num = abs((y2-y1)*x0 - (x2-x1)*y0 + x2*y1 - y2*x1)
+        den = np.sqrt((y2-y1)**2 + (x2-x1)**2)
+        return num / den if den != 0 else float('inf')
+
+    for i, line1 in enumerate(lines):
+        if i in used:
+            continue
+        x1, y1, x2, y2 = line1
+        angle1 = np.arctan2(y2 - y1, x2 - x1) * 180 / np.pi
+        similar_lines = [line1]
+        for j, line2 in enumerate(lines[i+1:], start=i+1):
+            if j in used:
+                continue
+            x3, y3, x4, y4 = line2
+            angle2 = np.arctan2(y4 - y3, x4 - x3) * 180 / np.pi
+            angle_diff = abs(angle1 - angle2)
+            if angle_diff > 180:
+                angle_diff = 360 - angle_diff
+            if angle_diff < angle_threshold:
+                dist = point_to_line_distance((x3, y3), (x1, y1, x2, y2))
+                if dist < distance_threshold:
+                    similar_lines.append(line2)
+                    used.add(j)
+        if len(similar_lines) > 1:
+            pts = np.array(similar_lines).reshape(-1, 2)
+            merged_line = [pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()]
+        else:
+            merged_line = line1.tolist()
+        merged.append(merged_line)
+        used.add(i)
+
+    return merged
+
+
+def synthetic_hough_lines(n: int, size: int = 4000, seed: int = 0) -> np.ndarray:
+    """Noisy, fragmented wall segments shaped like cv2.HoughLinesP output"""
+    rng = np.random.default_rng(seed)
+    n_walls = max(1, n // 8)
+    angles = rng.choice([0.0, np.pi / 2, np.pi / 4, rng.uniform(0, np.pi)], n_walls)
+    centers = rng.uniform(0, size, (n_walls, 2))
+    wall = rng.integers(0, n_walls, n)
+    t = rng.uniform(-300, 300, n)
+    length = rng.uniform(50, 200, n)
+    theta = angles[wall] + rng.normal(0, 0.01, n)
+    normal_jitter = rng.normal(0, 2.0, n)
+    u = np.column_stack([np.cos(theta), np.sin(theta)])
+    nrm = np.column_stack([-np.sin(theta), np.cos(theta)])
+    start = centers[wall] + u * t[:, None] + nrm * normal_jitter[:, None]
+    end = start + u * length[:, None]
+    return np.round(np.hstack([start, end])).astype(np.int32).reshape(-1, 1, 4)
+
+
+def synthetic_plan(megapixels: float = 1.0, rooms: int = None, wall_density: float = 0.0,
+                   doors: int = None, windows: int = None, noise: float = 0.0,
+                   scale_factor: float = 0.05, seed: int = 0) -> Tuple[np.ndarray, Dict]:
+    """Parametric floor plan on a sheet of about megapixels (A-series aspect ratio)
+    
+    The footprint is split into rooms by repeatedly bisecting the largest
+    room (default: 8 per megapixel). wall_density adds that many dangling
+    partition stubs per room. Doors (default: one per room) are swing arcs
+    at gaps in interior walls, windows (default: one per two rooms) triple
+    lines in gaps of the exterior wall. Symbols are stroked max(2 px, 0.1 m)
+    wide like on the sample sheets, so preprocessing's 3x3 opening keeps
+    door arcs; window lines are spaced by their stroke and merge into a bar
+    at coarse scales. noise in [0, 1] adds blur, scanner grain and speckles. Returns the
+    BGR image and its ground truth: wall, room, door and window counts, door
+    hinge and window positions in meters, and wall_gaps, the number of door
+    and window gaps (each may split a wall into two detected segments).
+    """
+    rng = np.random.default_rng(seed)
+    width = int(round(np.sqrt(megapixels * 1e6 * np.sqrt(2))))
+    height = int(round(width / np.sqrt(2)))
+    rooms = max(1, int(round(8 * megapixels))) if rooms is None else rooms
+    doors = rooms if doors is None else doors
+    windows = rooms // 2 if windows is None else windows
+    px = lambda meters: max(1, int(round(meters / scale_factor)))
+    exterior, interior, margin, swing = px(0.3), px(0.15), px(3.0), px(0.9)
+    symbol = max(2, px(0.1))
+    img = np.full((height, width), 255, dtype=np.uint8)
+    
+    # Bisect the largest room across its longer side until there are enough
+    x0, y0, x1, y1 = margin, margin, width - margin, height - margin
+    cells = [(x0, y0, x1, y1)]
+    partitions = []
+    while len(cells) < rooms:
+        cells.sort(key=lambda c: (c[2] - c[0]) * (c[3] - c[1]))
+        cx0, cy0, cx1, cy1 = cells[-1]
+        vertical = cx1 - cx0 >= cy1 - cy0
+        span = cx1 - cx0 if vertical else cy1 - cy0
+        if span < 2 * px(2.5):
+            break  # sheet too small for more rooms of a usable size
+        cells.pop()
+        cut = int(rng.uniform(0.35, 0.65) * span)
+        if vertical:
+            cells += [(cx0, cy0, cx0 + cut, cy1), (cx0 + cut, cy0, cx1, cy1)]
+            partitions.append(((cx0 + cut, cy0), (cx0 + cut, cy1)))
+        else:
+            cells += [(cx0, cy0, cx1, cy0 + cut), (cx0, cy0 + cut, cx1, cy1)]
+            partitions.append(((cx0, cy0 + cut), (cx1, cy0 + cut)))
+    
+    cv2.rectangle(img, (x0, y0), (x1, y1), 0, exterior)
+    for start, end in partitions:
+        cv2.line(img, start, end, 0, interior)
+    
+    # Closets and half-height partitions: stubs from a room side that end free
+    stubs = int(round(wall_density * len(cells)))
+    for k in range(stubs):
+        cx0, cy0, cx1, cy1 = cells[rng.integers(len(cells))]
+        length = int(rng.uniform(0.2, 0.45) * min(cx1 - cx0, cy1 - cy0))
+        if rng.random() < 0.5:
+            x = int(rng.uniform(cx0 + swing, cx1 - swing))
+            cv2.line(img, (x, cy0), (x, cy0 + length), 0, interior)
+        else:
+            y = int(rng.uniform(cy0 + swing, cy1 - swing))
+            cv2.line(img, (cx0, y), (cx0 + length, y), 0, interior)
+    
+    # Doors: a gap in an interior wall with the quarter-circle swing from its hinge
+    door_positions = []
+    usable = [(a, b) for a, b in partitions if abs(b[0] - a[0]) + abs(b[1] - a[1]) > 4 * swing]
+    for k in range(doors if usable else 0):
+        (ax, ay), (bx, by) = usable[rng.permutation(len(usable))[0] if k >= len(usable) else k]
+        t = int(rng.uniform(swing, abs(bx - ax) + abs(by - ay) - 2 * swing))
+        if ax == bx:
+            hinge, gap_end, leaf_end = (ax, ay + t), (ax, ay + t + swing), (ax + swing, ay + t)
+        else:
+            hinge, gap_end, leaf_end = (ax + t, ay), (ax + t + swing, ay), (ax + t, ay + swing)
+        cv2.line(img, hinge, gap_end, 255, interior + 2)
+        cv2.line(img, hinge, leaf_end, 0, symbol)
+        cv2.ellipse(img, hinge, (swing, swing), 0, 0, 90, 0, symbol)
+        door_positions.append((hinge[0] * scale_factor, hinge[1] * scale_factor))
+    
+    # Windows: a gap in the exterior wall bridged by both wall faces and the glass
+    window_positions = []
+    span, half = px(1.8), exterior // 2
+    for k in range(windows):
+        side = rng.integers(4)
+        if side < 2:
+            x, y = int(rng.uniform(x0 + span, x1 - 2 * span)), (y0, y1)[side]
+            cv2.line(img, (x, y), (x + span, y), 255, exterior + 2)
+            for offset in (-half, 0, half):
+                cv2.line(img, (x, y + offset), (x + span, y + offset), 0, symbol)
+            window_positions.append((x * scale_factor, (y - half) * scale_factor))
+        else:
+            x, y = (x0, x1)[side - 2], int(rng.uniform(y0 + span, y1 - 2 * span))
+            cv2.line(img, (x, y), (x, y + span), 255, exterior + 2)
+            for offset in (-half, 0, half):
+                cv2.line(img, (x + offset, y), (x + offset, y + span), 0, symbol)
+            window_positions.append(((x - half) * scale_factor, y * scale_factor))
+    
+    if noise > 0:
+        img = cv2.GaussianBlur(img, (0, 0), 0.5 + noise)
+        cv2.setRNGSeed(seed)
+        grain = np.empty(img.shape, dtype=np.int16)
+        cv2.randn(grain, 0, 25 * noise)
+        grain += img
+        img = np.clip(grain, 0, 255).astype(np.uint8)
+        del grain
+        img[rng.random(img.shape, dtype=np.float32) < 0.002 * noise] = 0
+    
+    truth = {
+        'walls': 4 + len(partitions) + stubs,
+        'rooms': len(cells),
+        'doors': door_positions,
+        'windows': window_positions,
+        'wall_gaps': len(door_positions) + len(window_positions),
+    }
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), truth
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS counter of this process (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb(field: str = 'VmHWM') -> float:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_stage(run, repeats: int = 3):
+    """Best-of-repeats latency of run() and the memory its single traced run peaks at
+    
+    Returns (result, ms, traced MB, RSS MB). Traced MB is the tracemalloc
+    peak, which covers NumPy arrays and OpenCV outputs. RSS MB is the
+    process's resident high-water mark during the run, which also catches
+    native temporaries. It is None where the mark cannot be reset (non-Linux).
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    del result
+    
+    resettable = _reset_peak_rss()
+    tracemalloc.start()
+    result = run()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, traced_peak / 2 ** 20, _rss_mb() if resettable else None
+
+
+def bench_stages(sizes: List[float], noise: float = 0.0, wall_density: float = 0.0,
+                 repeats: int = 3, scale_factor: float = 0.05, seed: int = 0):
+    """Latency and peak memory of every stage on synthetic plans of each size (megapixels)"""
+    processor = AdvancedBlueprintProcessor(scale_factor=scale_factor)
+    p = processor.params
+    print(f"{'sheet':>12} {'stage':<22} {'ms':>9} {'traced MB':>10} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            img, truth = synthetic_plan(megapixels, noise=noise, wall_density=wall_density,
+                                        scale_factor=scale_factor, seed=seed)
+            sheet = f"{img.shape[1]}x{img.shape[0]}"
+            results = {}
+            
+            def stage(name, run):
+                result, ms, traced, rss = measure_stage(run, repeats)
+                results[name] = result
+                rss_text = f"{rss:>12.1f}" if rss is not None else f"{'n/a':>12}"
+                print(f"{sheet:>12} {name:<22} {ms:>9.1f} {traced:>10.1f} {rss_text}")
+                return result
+            
+            ink = stage('binarize', lambda: processor.binarize(img))
+            binary = stage('preprocess_image', lambda: processor.preprocess_image(img, ink=ink))
+            walls = stage('detect_walls', lambda: processor.detect_walls(binary))
+            lines = cv2.HoughLinesP(processor.detect_edges(binary), rho=1, theta=np.pi / 180,
+                                    threshold=p['hough_threshold'],
+                                    minLineLength=p['hough_min_line_length'],
+                                    maxLineGap=p['hough_max_line_gap'])
+            if lines is not None:
+                stage('_merge_parallel_lines', lambda: processor._merge_parallel_lines(
+                    lines, p['merge_angle_threshold'], p['merge_distance_threshold']))
+            rooms = stage('detect_rooms', lambda: processor.detect_rooms(binary))
+            doors = stage('detect_doors', lambda: processor.detect_doors(ink, walls))
+            windows = stage('detect_windows', lambda: processor.detect_windows(binary, walls))
+            bim_model = processor.create_3d_model(walls, rooms, doors=doors, windows=windows)
+            bim_model.metadata.update({
+                'room_metrics': processor.calculate_room_metrics(bim_model.rooms),
+                'material_quantities': processor.estimate_material_quantities(bim_model),
+            })
+            output_path = os.path.join(tmp, 'model.json')
+            
+            def export():
+                with contextlib.redirect_stdout(io.StringIO()):  # keep the table readable
+                    processor.export_to_json(bim_model, output_path)
+            stage('export_to_json', export)
+            
+            tolerance = p['door_min_distance']
+            recall = {kind: _nearest_matches(np.array(truth[kind]).reshape(-1, 2),
+                                             np.array([o.position for o in found]).reshape(-1, 2),
+                                             tolerance) / max(1, len(truth[kind]))
+                      for kind, found in (('doors', doors), ('windows', windows))}
+            print(f"{sheet:>12} {'detected/truth':<22} walls {len(walls)}/{truth['walls']}, "
+                  f"rooms {len(rooms)}/{truth['rooms']}, doors {len(doors)}/{len(truth['doors'])} "
+                  f"(recall {recall['doors']:.0%}), windows {len(windows)}/{len(truth['windows'])} "
+                  f"(recall {recall['windows']:.0%})")
+
+
+def _golden_run(entry: Dict, base_dir: str, repeats: int) -> Tuple[Dict[str, list], float, Dict]:
+    """Detect one golden plan; returns the detections, best latency (ms) and its ground truth if any"""
+    scale_factor = entry.get('scale_factor', 0.05)
+    processor = AdvancedBlueprintProcessor(scale_factor=scale_factor,
+                                           params=PREPROCESS_PROFILES[entry.get('profile', 'accurate')])
+    truth = entry.get('truth')
+    if 'synthetic' in entry:
+        img, truth = synthetic_plan(scale_factor=scale_factor, **entry['synthetic'])
+        # synthetic window symbols are too fine to survive at golden scales
+        truth = {kind: value for kind, value in truth.items() if kind != 'windows'}
+    else:
+        img = processor.load_blueprint(os.path.join(base_dir, entry['image']))
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        detected = BlueprintPipeline(processor, image=img.copy()).run_detectors()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return detected, best, truth
+
+
+def _truth_checks(detected: Dict[str, list], truth: Dict, count_tolerance: float,
+                  min_recall: float, position_tolerance: float) -> Dict[str, Tuple[bool, str]]:
+    """Check detections against a plan's ground truth, for each kind it lists
+    
+    Walls may number anywhere from the drawn walls to that plus one per
+    door or window gap (wall_gaps), rooms must match the truth count; both
+    widened by count_tolerance (at least one). Doors and windows are lists
+    of true positions in meters: they need a count within tolerance and a
+    recall of at least min_recall, counting a true position as found when a
+    detection lies within position_tolerance meters of it.
+    """
+    def slack(n):
+        return max(1, int(round(count_tolerance * n)))
+    
+    checks = {}
+    if 'walls' in truth:
+        n, expected = len(detected['walls']), truth['walls']
+        lo, hi = expected - slack(expected), expected + truth.get('wall_gaps', 0) + slack(expected)
+        checks['walls'] = (lo <= n <= hi, f"walls {n}, truth {lo}-{hi}")
+    if 'rooms' in truth:
+        n, expected = len(detected['rooms']), truth['rooms']
+        checks['rooms'] = (abs(n - expected) <= slack(expected), f"rooms {n}, truth {expected}")
+    for kind in ('doors', 'windows'):
+        if kind not in truth:
+            continue
+        n, expected = len(detected[kind]), len(truth[kind])
+        if not expected:
+            checks[kind] = (n <= slack(0), f"{kind} {n}, truth 0")
+            continue
+        found = _nearest_matches(np.array(truth[kind]).reshape(-1, 2),
+                                 np.array([o.position for o in detected[kind]]).reshape(-1, 2),
+                                 position_tolerance)
+        recall = found / expected
+        checks[kind] = (abs(n - expected) <= slack(expected) and recall >= min_recall,
+                        f"{kind} {n}, truth {expected}, recall {recall:.0%} (min {min_recall:.0%})")
+    return checks
+
+
+def bench_golden(manifest_path: str, record: bool = False) -> List[str]:
+    """Replay the golden corpus and return its failures
+    
+    Plans are checked against their ground truth (see _truth_checks): the
+    truth synthetic_plan returns, or the truth an image plan records, with
+    a per-plan min_recall floor for door and window recall. Synthetic
+    windows are not checked: at the golden scales their triple lines merge
+    into a bar barely wider than the wall, so the count is only reported.
+    Image plan kinds without truth are non-regression baselines, failing
+    when a count drifts by more than count_tolerance of the baseline. Any
+    plan fails when its best-of-repeats latency exceeds its baseline by more
+    than latency_tolerance. record rewrites the image baselines and all
+    latency baselines from this run (never the truth); latency baselines
+    are machine-specific and should be recorded on the machine that checks
+    them.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    count_tolerance = manifest.get('count_tolerance', 0.1)
+    latency_tolerance = manifest.get('latency_tolerance', 0.5)
+    position_tolerance = manifest.get('position_tolerance', 1.0)
+    repeats = manifest.get('repeats', 3)
+    
+    failures = []
+    print(f"{'plan':<24} {'ms':>9} {'baseline':>9}  checks")
+    for entry in manifest['plans']:
+        detected, ms, truth = _golden_run(entry, base_dir, repeats)
+        truth = truth or {}
+        counts = {kind: len(detected[kind]) for kind in ('walls', 'rooms', 'doors', 'windows')}
+        baseline = entry.get('latency_ms')
+        min_recall = entry.get('min_recall', manifest.get('min_recall', 0.75))
+        checks = _truth_checks(detected, truth, count_tolerance, min_recall, position_tolerance)
+        if 'image' in entry:
+            expected = entry.get('baseline', {})
+            checks.update({kind: (kind not in expected or
+                                  abs(value - expected[kind]) <= count_tolerance * expected[kind],
+                                  f"{kind} {value}, baseline {expected.get(kind, '-')}")
+                           for kind, value in counts.items() if kind not in truth})
+        else:
+            checks.update({kind: (True, f"{kind} {value}, not checked")
+                           for kind, value in counts.items() if kind not in checks})
+        cells = []
+        for kind, (ok, text) in checks.items():
+            cells.append(f"{text} [{'ok' if ok else 'FAIL'}]")
+            if not ok and not (record and kind not in truth):
+                failures.append(f"{entry['name']}: {text}")
+        print(f"{entry['name']:<24} {ms:>9.1f} {baseline or '-':>9}  {'; '.join(cells)}")
+        if record:
+            if 'image' in entry:
+                entry['baseline'] = {kind: value for kind, value in counts.items() if kind not in truth}
+            entry['latency_ms'] = round(ms, 1)
+        elif baseline and ms > baseline * (1 + latency_tolerance):
+            failures.append(f"{entry['name']}: {ms:.1f} ms (baseline {baseline} ms)")
+    
+    if record:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+        print(f"Recorded {len(manifest['plans'])} plans to {manifest_path}")
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return failures
+
+
+def bench_merge(sizes: List[int], repeats: int = 3):
+    """Compare the vectorized merge with the legacy pairwise implementation"""
+    converter = BlueprintTo3DBIM()
+    print(f"{'segments':>9} {'legacy ms':>11} {'vector ms':>11} {'speedup':>8} "
+          f"{'legacy out':>11} {'vector out':>11}")
+    for n in sizes:
+        lines = synthetic_hough_lines(n)
+
+        start = time.perf_counter()
+        legacy = legacy_merge_parallel_lines(lines)
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            merged = converter._merge_parallel_lines(lines)
+            best = min(best, (time.perf_counter() - start) * 1000)
+
+        print(f"{n:>9} {legacy_ms:>11.1f} {best:>11.2f} {legacy_ms / best:>7.0f}x "
+              f"{len(legacy):>11} {len(merged):>11}")
+
+
+def _nearest_matches(ref: np.ndarray, cand: np.ndarray, tolerance: float) -> int:
+    """Number of reference points with a candidate point within tolerance"""
+    if len(ref) == 0 or len(cand) == 0:
+        return 0
+    dist = np.linalg.norm(ref[:, None, :] - cand[None, :, :], axis=2)
+    return int((dist.min(axis=1) <= tolerance).sum())
+
+
+def _relative_error(ref: float, cand: float) -> float:
+    """|cand - ref| / ref; inf when only the candidate is non-zero"""
+    if ref:
+        return abs(cand - ref) / ref
+    return float('inf') if cand else 0.0
+
+
+def _fraction(matched: int, total: int) -> float:
+    """matched / total, vacuously 1.0 when there is nothing to match"""
+    return matched / total if total else 1.0
+
+
+def compare_detections(reference: Dict[str, list], candidate: Dict[str, list],
+                       tolerance: float = 1.0) -> Dict:
+    """Drift of a candidate detection from a reference one (both in meters)
+    
+    Walls are compared by total length and by how many reference endpoints
+    have a candidate endpoint within tolerance; doors and windows by recall
+    and precision of their positions within tolerance. Relative errors are
+    inf when the reference is empty but the candidate is not; recall and
+    precision over nothing are vacuously 100%.
+    """
+    def wall_length(walls):
+        return sum(float(np.hypot(w.end_point[0] - w.start_point[0],
+                                  w.end_point[1] - w.start_point[1])) for w in walls)
+
+    def endpoints(walls):
+        return np.array([p for w in walls for p in (w.start_point, w.end_point)]).reshape(-1, 2)
+
+    def positions(items):
+        return np.array([item.position for item in items]).reshape(-1, 2)
+
+    ref_len, cand_len = wall_length(reference['walls']), wall_length(candidate['walls'])
+    ref_area = sum(r.area for r in reference['rooms'])
+    cand_area = sum(r.area for r in candidate['rooms'])
+    report = {
+        'counts': {k: (len(reference[k]), len(candidate[k]))
+                   for k in ('walls', 'rooms', 'doors', 'windows')},
+        'wall_length_error': _relative_error(ref_len, cand_len),
+        'floor_area_error': _relative_error(ref_area, cand_area),
+        'wall_endpoint_recall': _fraction(_nearest_matches(endpoints(reference['walls']),
+                                                           endpoints(candidate['walls']), tolerance),
+                                          2 * len(reference['walls'])),
+    }
+    for kind in ('doors', 'windows'):
+        ref, cand = positions(reference[kind]), positions(candidate[kind])
+        report[f'{kind}_recall'] = _fraction(_nearest_matches(ref, cand, tolerance), len(ref))
+        report[f'{kind}_precision'] = _fraction(_nearest_matches(cand, ref, tolerance), len(cand))
+    return report
+
+
+def bench_modes(paths: List[str], pyramid: int = 4, tile_size: int = 1024,
+                scale_factor: float = 0.05):
+    """Latency and accuracy of the pyramid and tiled modes against the full-resolution path"""
+    processor = AdvancedBlueprintProcessor(scale_factor=scale_factor)
+    for path in paths:
+        img = processor.load_blueprint(path)
+        print(f"\n{path} ({img.shape[1]}x{img.shape[0]})")
+
+        start = time.perf_counter()
+        reference = BlueprintPipeline(processor, image=img).run_detectors()
+        reference_ms = (time.perf_counter() - start) * 1000
+        print(f"  {'full':<12} {reference_ms:>9.0f} ms")
+
+        modes = {}
+        if pyramid:
+            modes[f'pyramid/{pyramid}'] = lambda: processor.detect_pyramid(img, pyramid)
+        if tile_size:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            modes[f'tiled/{tile_size}'] = lambda: processor.detect_tiled(gray, tile_size)
+        for name, run in modes.items():
+            start = time.perf_counter()
+            candidate = run()
+            elapsed = (time.perf_counter() - start) * 1000
+            report = compare_detections(reference, candidate, processor.params['door_min_distance'])
+            counts = ' '.join(f"{k}={r}->{c}" for k, (r, c) in report['counts'].items())
+            print(f"  {name:<12} {elapsed:>9.0f} ms  x{reference_ms / elapsed:.1f}  {counts}")
+            print(f"  {'':<12} wall length {report['wall_length_error']:.1%}, "
+                  f"endpoint recall {report['wall_endpoint_recall']:.0%}, "
+                  f"floor area {report['floor_area_error']:.1%}, "
+                  f"doors R/P {report['doors_recall']:.0%}/{report['doors_precision']:.0%}, "
+                  f"windows R/P {report['windows_recall']:.0%}/{report['windows_precision']:.0%}")
+
+
+def bench_profiles(paths: List[str], repeats: int = 3, scale_factor: float = 0.05):
+    """Latency of each preprocessing profile and its drift from 'accurate'"""
+    totals = {name: {'prep_ms': 0.0, 'total_ms': 0.0, 'reports': []} for name in PREPROCESS_PROFILES}
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"skipping unreadable {path}")
+            continue
+        results = {}
+        for name, overrides in PREPROCESS_PROFILES.items():
+            processor = AdvancedBlueprintProcessor(scale_factor=scale_factor, params=overrides)
+            best_prep = best_total = float('inf')
+            for _ in range(repeats):
+                pipeline = BlueprintPipeline(processor, image=img.copy())
+                start = time.perf_counter()
+                detected = pipeline.run_detectors()
+                best_total = min(best_total, (time.perf_counter() - start) * 1000)
+                best_prep = min(best_prep, sum(pipeline.timings.get(stage, 0.0)
+                                               for stage in ('enhanced', 'gray', 'binary')))
+            results[name] = detected
+            totals[name]['prep_ms'] += best_prep
+            totals[name]['total_ms'] += best_total
+        for name in PREPROCESS_PROFILES:
+            totals[name]['reports'].append(
+                compare_detections(results['accurate'], results[name],
+                                   DETECTOR_PARAMS['door_min_distance']))
+
+    n = max(1, len(totals['accurate']['reports']))
+    print(f"{'profile':<10} {'prep ms':>9} {'total ms':>9} {'walls':>7} {'rooms':>7} {'doors':>7} "
+          f"{'wall len':>9} {'endpts':>7} {'area':>7} {'door R/P':>9}")
+    for name, total in totals.items():
+        reports = total['reports']
+        if not reports:
+            continue
+        def mean(key):
+            return sum(r[key] for r in reports) / len(reports)
+        def count_drift(kind):
+            return sum(c - r for r, c in (rep['counts'][kind] for rep in reports))
+        print(f"{name:<10} {total['prep_ms'] / n:>9.1f} {total['total_ms'] / n:>9.1f} "
+              f"{count_drift('walls'):>+7} {count_drift('rooms'):>+7} {count_drift('doors'):>+7} "
+              f"{mean('wall_length_error'):>9.1%} {mean('wall_endpoint_recall'):>7.0%} "
+              f"{mean('floor_area_error'):>7.1%} "
+              f"{mean('doors_recall'):>4.0%}/{mean('doors_precision'):<4.0%}")
+
+
+def bench_export(paths: List[str], precision: int = 3, repeats: int = 5,
+                 scale_factor: float = 0.05):
+    """Output size and serialization time of every export format"""
+    processor = AdvancedBlueprintProcessor(scale_factor=scale_factor)
+    print(f"{'image':<36} {'format':<12} {'bytes':>9} {'ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in paths:
+            detected = BlueprintPipeline(processor, image_path=path).run_detectors()
+            bim_model = processor.create_3d_model(detected['walls'], detected['rooms'],
+                                                  doors=detected['doors'], windows=detected['windows'])
+            bim_model.metadata.update({
+                'room_metrics': processor.calculate_room_metrics(bim_model.rooms),
+                'material_quantities': processor.estimate_material_quantities(bim_model),
+            })
+            for output_format in EXPORT_FORMATS:
+                output_path = os.path.join(tmp, f'model.{output_format}')
+                best = float('inf')
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    if output_format == 'json':
+                        with open(output_path, 'w') as f:
+                            f.write(processor.to_json(bim_model))
+                    elif output_format == 'json-stream':
+                        with open(output_path, 'w') as f:
+                            processor.write_json_stream(bim_model, f, precision)
+                    else:
+                        processor.export_to_npz(bim_model, output_path)
+                    best = min(best, (time.perf_counter() - start) * 1000)
+                print(f"{os.path.basename(path):<36} {output_format:<12} "
+                      f"{os.path.getsize(output_path):>9} {best:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BIM converter benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+    merge = sub.add_parser('merge', help="Benchmark _merge_parallel_lines")
+    merge.add_argument('--sizes', type=int, nargs='+', default=[250, 1000, 2000])
+    modes = sub.add_parser('modes', help="Compare pyramid/tiled modes with the full-resolution path")
+    modes.add_argument('images', nargs='+')
+    modes.add_argument('--pyramid', type=int, default=4)
+    modes.add_argument('--tile-size', type=int, default=1024)
+    modes.add_argument('--scale-factor', type=float, default=0.05)
+    profiles = sub.add_parser('profiles', help="Latency and drift of the preprocessing profiles")
+    profiles.add_argument('images', nargs='+')
+    profiles.add_argument('--repeats', type=int, default=3)
+    profiles.add_argument('--scale-factor', type=float, default=0.05)
+    export = sub.add_parser('export', help="Output size and serialization time per export format")
+    export.add_argument('images', nargs='+')
+    export.add_argument('--precision', type=int, default=3)
+    export.add_argument('--repeats', type=int, default=5)
+    export.add_argument('--scale-factor', type=float, default=0.05)
+    stages = sub.add_parser('stages', help="Per-stage latency and peak memory on synthetic plans")
+    stages.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 16],
+                        help="Sheet sizes in megapixels (an A0 scan at 300 dpi is about 140)")
+    stages.add_argument('--noise', type=float, default=0.0)
+    stages.add_argument('--wall-density', type=float, default=0.0)
+    stages.add_argument('--repeats', type=int, default=3)
+    stages.add_argument('--scale-factor', type=float, default=0.05)
+    stages.add_argument('--seed', type=int, default=0)
+    golden = sub.add_parser('golden', help="Replay the golden corpus, failing on regressions")
+    golden.add_argument('manifest', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bim_golden.json'))
+    golden.add_argument('--record', action='store_true',
+                        help="Store this run's counts and latencies as the new baseline")
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        bench_merge(args.sizes)
+    elif args.command == 'modes':
+        bench_modes(args.images, args.pyramid, args.tile_size, args.scale_factor)
+    elif args.command == 'profiles':
+        bench_profiles(args.images, args.repeats, args.scale_factor)
+    elif args.command == 'export':
+        bench_export(args.images, args.precision, args.repeats, args.scale_factor)
+    elif args.command == 'stages':
+        bench_stages(args.sizes, args.noise, args.wall_density, args.repeats, args.scale_factor,
+                     args.seed)
+    elif args.command == 'golden':
+        if bench_golden(args.manifest, args.record):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
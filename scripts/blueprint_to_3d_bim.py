@@ -6,15 +6,101 @@ for construction planning and visualization.
 
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import argparse
+import base64
+import cProfile
+import glob
+import hashlib
+import io
 import json
 import os
 import sys
-from dataclasses import dataclass, asdict
+import time
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait as wait_connections
+from dataclasses import dataclass
 from typing import List, Tuple, Dict, Optional
-from scipy import ndimage
+from scipy import fft as sp_fft
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then left out
+    resource = None
+
+
+# Tunable detector parameters. Every value here feeds the conversion cache key,
+# so anything that changes detection output must live in this dict.
+DETECTOR_PARAMS = {
+    'enhance_method': 'clahe_lab',          # clahe_lab | clahe_gray | none
+    'denoise_method': 'bilateral',          # bilateral | median | gaussian | none
+    'threshold_method': 'adaptive_gaussian',  # adaptive_gaussian | adaptive_mean | otsu
+    'bilateral_d': 9,
+    'bilateral_sigma': 75,
+    'denoise_ksize': 5,
+    'adaptive_block_size': 11,
+    'adaptive_c': 2,
+    'adaptive_c_grain_factor': 5.0,  # adaptive_c rises to this many times the measured grain; 0 disables
+    'morph_kernel': 3,
+    'clahe_clip_limit': 3.0,
+    'clahe_grid': 8,
+    'canny_low': 50,
+    'canny_high': 150,
+    'hough_threshold': 100,
+    'hough_min_line_length': 50,
+    'hough_max_line_gap': 10,
+    'merge_angle_threshold': 5.0,
+    'merge_distance_threshold': 10.0,
+    'wall_max_thickness': 0.6,      # meters; thickest wall the distance transform looks for
+    'room_min_area': 1000,
+    'room_max_area_ratio': 0.8,
+    'room_min_width': 0.5,          # meters; narrower enclosed regions are wall cavities, not rooms
+    'room_gap_close': 1.2,          # meters; door openings up to this wide are closed for rooms
+    'door_radii_m': (0.6, 0.9, 1.2),  # meters; door kernels span min..max
+    'door_orientations': 4,
+    'door_match_threshold': 0.85,   # swing stroke coverage minus ink in the swept area and beyond the arc
+    'door_stroke_tolerance': 1,     # pixels the drawn swing may stray from the kernel
+    'door_min_distance': 1.0,
+    'opening_wall_tolerance': 1.0,  # meters from a wall for a door/window to be kept
+    'wall_snap_tolerance': 0.3,     # meters; wall ends this close join one junction
+    'wall_gap_bridge': 2.5,         # meters; widest opening closed when tracing rooms
+    'room_method': 'contours',      # contours | wall_graph
+    'text_downscale': 4,            # factor of the pass that finds annotation windows inside rooms
+    'text_window_pad': 3,           # downscaled pixels of context kept around each annotation
+}
+
+# Named speed/quality trade-offs for enhancement and preprocessing, applied as
+# DETECTOR_PARAMS overrides. 'accurate' is the reference behaviour.
+PREPROCESS_PROFILES = {
+    'fast': {
+        'enhance_method': 'none',
+        'denoise_method': 'none',
+        'threshold_method': 'otsu',
+    },
+    'balanced': {
+        'enhance_method': 'none',
+        'denoise_method': 'bilateral',
+        'bilateral_d': 5,
+        'threshold_method': 'adaptive_gaussian',
+    },
+    'accurate': {},
+}
+
+
+# Output formats understood by BlueprintTo3DBIM.export
+EXPORT_FORMATS = ('json', 'json-stream', 'npz')
+
+# Values of DETECTOR_PARAMS['room_method']: image contours or closed wall cycles
+ROOM_METHODS = ('contours', 'wall_graph')
+
+# Progress events of a streamed conversion, in the order they are emitted
+STREAM_EVENTS = ('walls', 'rooms', 'openings', 'metrics')
+
+# Files picked up when a batch input is a directory
+BATCH_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pdf')
 
 
 @dataclass
@@ -48,227 +134,1701 @@ class Window:
     height: float = 1.5
     wall_index: int = -1
     
+def _column_rows(columns: List[np.ndarray], precision: int = None, chunk: int = 4096):
+    """Yield rows of Python values from parallel columns, converting a chunk at a time
+    
+    Float columns are rounded to precision decimals when it is given.
+    """
+    for start in range(0, len(columns[0]), chunk):
+        parts = []
+        for column in columns:
+            part = column[start:start + chunk]
+            if precision is not None and part.dtype.kind == 'f':
+                part = np.round(part, precision)
+            parts.append(part.tolist())
+        yield from zip(*parts)
+
+
+class WallTable:
+    """Struct-of-arrays storage for walls
+    
+    coords is an N x 4 array of (x1, y1, x2, y2) in meters, thickness and
+    height are per-wall columns. Indexing and iteration yield Wall views, so
+    code written against List[Wall] keeps working; edits to a view are not
+    written back, change the columns instead.
+    """
+    
+    def __init__(self, coords: np.ndarray = None, thickness: np.ndarray = None,
+                 height: np.ndarray = None):
+        self.coords = np.asarray(coords if coords is not None else (), dtype=np.float64).reshape(-1, 4)
+        n = len(self.coords)
+        self.thickness = np.broadcast_to(np.asarray(0.2 if thickness is None else thickness,
+                                                    dtype=np.float64), (n,)).copy()
+        self.height = np.broadcast_to(np.asarray(3.0 if height is None else height,
+                                                 dtype=np.float64), (n,)).copy()
+    
+    @classmethod
+    def from_walls(cls, walls) -> 'WallTable':
+        """Build a table from Wall objects (a table is returned as is)"""
+        if isinstance(walls, cls):
+            return walls
+        walls = list(walls or [])
+        return cls([(*w.start_point, *w.end_point) for w in walls],
+                   [w.thickness for w in walls], [w.height for w in walls])
+    
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> 'WallTable':
+        """Build a table from the dicts written by to_records"""
+        return cls([(*r['start_point'], *r['end_point']) for r in records],
+                   [r['thickness'] for r in records], [r['height'] for r in records])
+    
+    def __len__(self) -> int:
+        return len(self.coords)
+    
+    @classmethod
+    def concatenate(cls, tables: List['WallTable']) -> 'WallTable':
+        return cls(np.concatenate([t.coords for t in tables]) if tables else None,
+                   np.concatenate([t.thickness for t in tables]) if tables else None,
+                   np.concatenate([t.height for t in tables]) if tables else None)
+    
+    def __getitem__(self, index):
+        # Slices and index or mask arrays select a sub-table
+        if isinstance(index, (slice, np.ndarray)):
+            return WallTable(self.coords[index], self.thickness[index], self.height[index])
+        x1, y1, x2, y2 = self.coords[index].tolist()
+        return Wall(start_point=(x1, y1), end_point=(x2, y2),
+                    thickness=float(self.thickness[index]), height=float(self.height[index]))
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def lengths(self) -> np.ndarray:
+        """Length of every wall in meters"""
+        return np.hypot(self.coords[:, 2] - self.coords[:, 0], self.coords[:, 3] - self.coords[:, 1])
+    
+    def iter_records(self, precision: int = None):
+        """Yield wall dicts in the layout of asdict(Wall), floats rounded to precision"""
+        for (x1, y1, x2, y2), t, h in _column_rows([self.coords, self.thickness, self.height],
+                                                   precision):
+            yield {'start_point': [x1, y1], 'end_point': [x2, y2], 'thickness': t, 'height': h}
+    
+    def to_records(self, precision: int = None) -> List[Dict]:
+        return list(self.iter_records(precision))
+
+
+class RoomTable:
+    """Struct-of-arrays storage for rooms
+    
+    Corners of all rooms live in one ragged M x 2 vertex buffer; the corners
+    of room i are vertices[offsets[i]:offsets[i + 1]]. Indexing and iteration
+    yield Room views.
+    """
+    
+    def __init__(self, names: List[str] = None, vertices: np.ndarray = None,
+                 offsets: np.ndarray = None, areas: np.ndarray = None):
+        self.names = list(names or [])
+        self.vertices = np.asarray(vertices if vertices is not None else (), dtype=np.float64).reshape(-1, 2)
+        self.offsets = (np.asarray(offsets, dtype=np.int64) if offsets is not None
+                        else np.zeros(len(self.names) + 1, dtype=np.int64))
+        self.areas = (np.asarray(areas, dtype=np.float64) if areas is not None
+                      else np.zeros(len(self.names)))
+    
+    @classmethod
+    def from_rooms(cls, rooms) -> 'RoomTable':
+        """Build a table from Room objects (a table is returned as is)"""
+        if isinstance(rooms, cls):
+            return rooms
+        rooms = list(rooms or [])
+        counts = [len(r.corners) for r in rooms]
+        return cls([r.name for r in rooms],
+                   [c for r in rooms for c in r.corners],
+                   np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+                   [r.area for r in rooms])
+    
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> 'RoomTable':
+        """Build a table from the dicts written by to_records"""
+        counts = [len(r['corners']) for r in records]
+        return cls([r['name'] for r in records],
+                   [c for r in records for c in r['corners']],
+                   np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+                   [r['area'] for r in records])
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def __getitem__(self, index: int) -> Room:
+        corners = self.vertices[self.offsets[index]:self.offsets[index + 1]].tolist()
+        return Room(name=self.names[index], corners=[tuple(c) for c in corners],
+                    area=float(self.areas[index]))
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def corner_counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+    
+    def _room_ids(self) -> np.ndarray:
+        """Room index of every vertex in the buffer"""
+        return np.repeat(np.arange(len(self)), self.corner_counts())
+    
+    def perimeters(self) -> np.ndarray:
+        """Closed-polygon perimeter of every room in meters"""
+        # Successor of each vertex within its own ring
+        successor = np.arange(1, len(self.vertices) + 1)
+        counts = self.corner_counts()
+        successor[self.offsets[1:][counts > 0] - 1] = self.offsets[:-1][counts > 0]
+        edges = np.hypot(*(self.vertices[successor] - self.vertices).T)
+        return np.bincount(self._room_ids(), weights=edges, minlength=len(self))
+    
+    def centroids(self) -> np.ndarray:
+        """Mean corner position of every room (NaN for rooms without corners)"""
+        ids = self._room_ids()
+        sums = np.column_stack([np.bincount(ids, weights=self.vertices[:, k], minlength=len(self))
+                                for k in range(2)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / self.corner_counts()[:, None]
+    
+    def iter_records(self, precision: int = None):
+        """Yield room dicts in the layout of asdict(Room), floats rounded to precision"""
+        vertices = self.vertices if precision is None else np.round(self.vertices, precision)
+        bounds = zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+        areas = (area for area, in _column_rows([self.areas], precision))
+        for name, (start, end), area in zip(self.names, bounds, areas):
+            yield {'name': name, 'corners': vertices[start:end].tolist(), 'area': area}
+    
+    def to_records(self, precision: int = None) -> List[Dict]:
+        return list(self.iter_records(precision))
+
+
+class OpeningTable:
+    """Struct-of-arrays storage for doors or windows
+    
+    kind is Door or Window; positions is N x 2 in meters. heights is only
+    kept for windows. Indexing and iteration yield views of the given kind.
+    """
+    
+    def __init__(self, kind: type, positions: np.ndarray = None, widths: np.ndarray = None,
+                 wall_index: np.ndarray = None, heights: np.ndarray = None):
+        self.kind = kind
+        self.positions = np.asarray(positions if positions is not None else (),
+                                    dtype=np.float64).reshape(-1, 2)
+        n = len(self.positions)
+        self.widths = np.asarray(widths if widths is not None else np.zeros(n), dtype=np.float64)
+        self.wall_index = (np.asarray(wall_index, dtype=np.int64) if wall_index is not None
+                           else np.full(n, -1, dtype=np.int64))
+        self.heights = None
+        if kind is Window:
+            self.heights = np.asarray(heights if heights is not None else np.full(n, 1.5),
+                                      dtype=np.float64)
+    
+    @classmethod
+    def from_items(cls, items, kind: type) -> 'OpeningTable':
+        """Build a table from Door or Window objects (a table is returned as is)"""
+        if isinstance(items, cls):
+            return items
+        items = list(items or [])
+        return cls(kind, [i.position for i in items], [i.width for i in items],
+                   [i.wall_index for i in items],
+                   [i.height for i in items] if kind is Window else None)
+    
+    @classmethod
+    def from_records(cls, records: List[Dict], kind: type) -> 'OpeningTable':
+        """Build a table from the dicts written by to_records"""
+        return cls(kind, [r['position'] for r in records], [r['width'] for r in records],
+                   [r['wall_index'] for r in records],
+                   [r['height'] for r in records] if kind is Window else None)
+    
+    def __len__(self) -> int:
+        return len(self.positions)
+    
+    def __getitem__(self, index: int):
+        fields = {'position': tuple(self.positions[index].tolist()),
+                  'width': float(self.widths[index]),
+                  'wall_index': int(self.wall_index[index])}
+        if self.kind is Window:
+            fields['height'] = float(self.heights[index])
+        return self.kind(**fields)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def iter_records(self, precision: int = None):
+        """Yield Door or Window dicts in the layout of asdict, floats rounded to precision"""
+        names = ['position', 'width', 'height', 'wall_index'] if self.kind is Window else \
+            ['position', 'width', 'wall_index']
+        columns = {'position': self.positions, 'width': self.widths,
+                   'height': self.heights, 'wall_index': self.wall_index}
+        for values in _column_rows([columns[name] for name in names], precision):
+            yield dict(zip(names, values))
+    
+    def to_records(self, precision: int = None) -> List[Dict]:
+        return list(self.iter_records(precision))
+
+
 @dataclass
 class BIMModel:
-    """Building Information Model container"""
-    walls: List[Wall]
-    rooms: List[Room]
-    doors: List[Door] = None
-    windows: List[Window] = None
+    """Building Information Model container
+    
+    walls, rooms, doors and windows may be given as lists of dataclasses;
+    they are stored as WallTable, RoomTable and OpeningTable columns.
+    """
+    walls: WallTable
+    rooms: RoomTable
+    doors: OpeningTable = None
+    windows: OpeningTable = None
     floors: int = 1
     floor_height: float = 3.0
     metadata: Dict = None
+    
+    def __post_init__(self):
+        self.walls = WallTable.from_walls(self.walls)
+        self.rooms = RoomTable.from_rooms(self.rooms)
+        if self.doors is not None:
+            self.doors = OpeningTable.from_items(self.doors, Door)
+        if self.windows is not None:
+            self.windows = OpeningTable.from_items(self.windows, Window)
+    
+    def to_dict(self, precision: int = None) -> Dict:
+        """Plain-dict form of the model, laid out like asdict() on list-based models"""
+        return {
+            'walls': self.walls.to_records(precision),
+            'rooms': self.rooms.to_records(precision),
+            'doors': self.doors.to_records(precision) if self.doors is not None else None,
+            'windows': self.windows.to_records(precision) if self.windows is not None else None,
+            'floors': self.floors,
+            'floor_height': self.floor_height,
+            'metadata': self.metadata,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'BIMModel':
+        """Rebuild a model from the dict produced by export_to_json"""
+        return cls(
+            walls=WallTable.from_records(data.get('walls', [])),
+            rooms=RoomTable.from_records(data.get('rooms', [])),
+            doors=OpeningTable.from_records(data.get('doors') or [], Door),
+            windows=OpeningTable.from_records(data.get('windows') or [], Window),
+            floors=data.get('floors', 1),
+            floor_height=data.get('floor_height', 3.0),
+            metadata=data.get('metadata'),
+        )
+    
+    @classmethod
+    def from_npz(cls, path: str) -> 'BIMModel':
+        """Rebuild a model from a file written by export_to_npz"""
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes())
+            openings = {}
+            for prefix, kind in (('door', Door), ('window', Window)):
+                if header[f'has_{prefix}s']:
+                    openings[f'{prefix}s'] = OpeningTable(
+                        kind, data[f'{prefix}_positions'], data[f'{prefix}_widths'],
+                        data[f'{prefix}_wall_index'],
+                        data[f'{prefix}_heights'] if kind is Window else None)
+            return cls(
+                walls=WallTable(data['wall_coords'], data['wall_thickness'], data['wall_height']),
+                rooms=RoomTable(header['room_names'], data['room_vertices'],
+                                data['room_offsets'], data['room_areas']),
+                floors=header['floors'],
+                floor_height=header['floor_height'],
+                metadata=header['metadata'],
+                **openings,
+            )
+    
+    @classmethod
+    def load(cls, path: str) -> 'BIMModel':
+        """Read a model exported in any of EXPORT_FORMATS"""
+        if path.endswith('.npz'):
+            return cls.from_npz(path)
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+    
+    def translated(self, dx: float, dy: float) -> 'BIMModel':
+        """Copy of the model with all plan geometry moved by (dx, dy) meters"""
+        def moved(openings):
+            if openings is None:
+                return None
+            return OpeningTable(openings.kind, openings.positions + (dx, dy), openings.widths,
+                                openings.wall_index, openings.heights)
+        return BIMModel(
+            walls=WallTable(self.walls.coords + (dx, dy, dx, dy), self.walls.thickness,
+                            self.walls.height),
+            rooms=RoomTable(self.rooms.names, self.rooms.vertices + (dx, dy), self.rooms.offsets,
+                            self.rooms.areas),
+            doors=moved(self.doors),
+            windows=moved(self.windows),
+            floors=self.floors,
+            floor_height=self.floor_height,
+            metadata=self.metadata,
+        )
+    
+    def diff(self, previous: 'BIMModel', precision: int = 4) -> Dict:
+        """Changes from previous to this model, per element kind
+        
+        Elements are matched by their records rounded to precision; an
+        opening's wall_index is left out since it only follows wall order.
+        'removed' lists indices into previous, 'added' the new records with
+        their index into this model.
+        """
+        def changes(old, new, ignore=()):
+            def key(record):
+                return json.dumps({k: v for k, v in record.items() if k not in ignore}, sort_keys=True)
+            pending = {}
+            for i, record in enumerate(old.iter_records(precision) if old is not None else ()):
+                pending.setdefault(key(record), []).append(i)
+            added, unchanged = [], 0
+            for i, record in enumerate(new.iter_records(precision) if new is not None else ()):
+                matches = pending.get(key(record))
+                if matches:
+                    matches.pop()
+                    unchanged += 1
+                else:
+                    added.append(dict(record, index=i))
+            removed = sorted(i for indices in pending.values() for i in indices)
+            return {'added': added, 'removed': removed, 'unchanged': unchanged}
+        
+        return {
+            'walls': changes(previous.walls, self.walls),
+            'rooms': changes(previous.rooms, self.rooms),
+            'doors': changes(previous.doors, self.doors, ('wall_index',)),
+            'windows': changes(previous.windows, self.windows, ('wall_index',)),
+        }
+
+
+@dataclass
+class Mesh:
+    """Indexed triangle mesh in glTF axes (x, up, plan y), in meters
+    
+    positions and normals are V x 3, indices is T x 3 into them. groups maps
+    a part name ('walls', 'floors') to its (first triangle, triangle count).
+    """
+    positions: np.ndarray
+    normals: np.ndarray
+    indices: np.ndarray
+    groups: Dict[str, Tuple[int, int]]
+    
+    # Base colours of the parts in glTF materials
+    MATERIALS = {
+        'walls': {'baseColorFactor': [0.83, 0.83, 0.83, 1.0], 'doubleSided': False},
+        'floors': {'baseColorFactor': [0.82, 0.71, 0.55, 1.0], 'doubleSided': True},
+    }
+    
+    def to_glb(self, output_path: str):
+        """Write a binary glTF 2.0 file with one buffer shared by all parts"""
+        with open(output_path, 'wb') as f:
+            f.write(self.glb_bytes())
+    
+    def glb_bytes(self) -> bytes:
+        """The binary glTF 2.0 written by to_glb"""
+        positions = np.ascontiguousarray(self.positions, dtype=np.float32)
+        normals = np.ascontiguousarray(self.normals, dtype=np.float32)
+        indices = np.ascontiguousarray(self.indices, dtype=np.uint32)
+        binary = positions.tobytes() + normals.tobytes() + indices.tobytes()
+        
+        gltf = {
+            'asset': {'version': '2.0', 'generator': 'blueprint_to_3d_bim'},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'buffers': [{'byteLength': len(binary)}],
+        }
+        primitives = [(name, first, count) for name, (first, count) in self.groups.items() if count]
+        if primitives:
+            gltf['bufferViews'] = [
+                {'buffer': 0, 'byteOffset': 0, 'byteLength': positions.nbytes, 'target': 34962},
+                {'buffer': 0, 'byteOffset': positions.nbytes, 'byteLength': normals.nbytes,
+                 'target': 34962},
+                {'buffer': 0, 'byteOffset': positions.nbytes + normals.nbytes,
+                 'byteLength': indices.nbytes, 'target': 34963},
+            ]
+            gltf['accessors'] = [
+                {'bufferView': 0, 'componentType': 5126, 'count': len(positions), 'type': 'VEC3',
+                 'min': positions.min(axis=0).tolist(), 'max': positions.max(axis=0).tolist()},
+                {'bufferView': 1, 'componentType': 5126, 'count': len(normals), 'type': 'VEC3'},
+            ]
+            gltf['materials'] = []
+            gltf['meshes'] = [{'name': 'building', 'primitives': []}]
+            for name, first, count in primitives:
+                gltf['accessors'].append({'bufferView': 2, 'byteOffset': first * 12,
+                                          'componentType': 5125, 'count': count * 3,
+                                          'type': 'SCALAR'})
+                material = self.MATERIALS.get(name, self.MATERIALS['walls'])
+                gltf['materials'].append({
+                    'name': name,
+                    'pbrMetallicRoughness': {'baseColorFactor': material['baseColorFactor'],
+                                             'metallicFactor': 0.0, 'roughnessFactor': 0.9},
+                    'doubleSided': material['doubleSided'],
+                })
+                gltf['meshes'][0]['primitives'].append({
+                    'attributes': {'POSITION': 0, 'NORMAL': 1},
+                    'indices': len(gltf['accessors']) - 1,
+                    'material': len(gltf['materials']) - 1,
+                })
+            gltf['nodes'] = [{'mesh': 0, 'name': 'building'}]
+            gltf['scenes'][0]['nodes'] = [0]
+        
+        # Chunks must be 4-byte aligned: JSON padded with spaces, BIN with zeros
+        json_chunk = json.dumps(gltf, separators=(',', ':')).encode()
+        json_chunk += b' ' * (-len(json_chunk) % 4)
+        binary += b'\0' * (-len(binary) % 4)
+        return b''.join([
+            b'glTF' + np.array([2, 12 + 8 + len(json_chunk) + 8 + len(binary)], dtype='<u4').tobytes(),
+            np.array([len(json_chunk), 0x4E4F534A], dtype='<u4').tobytes() + json_chunk,
+            np.array([len(binary), 0x004E4942], dtype='<u4').tobytes() + binary,
+        ])
+    
+    def to_obj(self, output_path: str):
+        """Write a Wavefront OBJ file with one group per part"""
+        with open(output_path, 'w') as f:
+            f.write("# blueprint_to_3d_bim mesh (y up, meters)\n")
+            np.savetxt(f, self.positions, fmt='v %.5f %.5f %.5f')
+            np.savetxt(f, self.normals, fmt='vn %.4f %.4f %.4f')
+            for name, (first, count) in self.groups.items():
+                if not count:
+                    continue
+                f.write(f"g {name}\n")
+                faces = self.indices[first:first + count] + 1  # OBJ indices are 1-based
+                np.savetxt(f, np.repeat(faces, 2, axis=1), fmt='f %d//%d %d//%d %d//%d')
+
+
+class WallIndex:
+    """Uniform-grid spatial index over wall segments for nearest-wall queries
+    
+    Every wall is registered in the grid cells it passes through, dilated
+    enough that any point within reach of the wall finds it in its own cell.
+    Cell keys are kept sorted, so a query is a binary search plus an exact
+    distance test against the few walls in that cell.
+    """
+    
+    def __init__(self, walls, reach: float = 1.0, cell_size: float = None):
+        table = WallTable.from_walls(walls)
+        self.coords = table.coords
+        self.reach = float(reach)
+        p1, d = self.coords[:, :2], self.coords[:, 2:] - self.coords[:, :2]
+        lengths = np.hypot(d[:, 0], d[:, 1])
+        self.cell_size = float(cell_size or max(2 * self.reach, 1e-3))
+        
+        # Sample every wall at most one cell apart and register the sampled cells
+        samples = np.maximum(1, np.ceil(lengths / self.cell_size)).astype(np.int64) + 1
+        wall_ids = np.repeat(np.arange(len(self.coords)), samples)
+        starts = np.cumsum(samples) - samples
+        t = (np.arange(len(wall_ids)) - np.repeat(starts, samples)) / np.repeat(samples - 1, samples)
+        cells = np.floor((p1[wall_ids] + t[:, None] * d[wall_ids]) / self.cell_size).astype(np.int64)
+        
+        # A point within reach of a wall is within reach + cell / 2 of a sample,
+        # so with cell >= 2 * reach it lies in a sampled cell or a neighbour
+        ring = 1 if self.cell_size >= 2 * self.reach else int(np.ceil(self.reach / self.cell_size)) + 1
+        offsets = np.stack(np.meshgrid(np.arange(-ring, ring + 1), np.arange(-ring, ring + 1)),
+                           axis=-1).reshape(-1, 2)
+        cells = (cells[:, None, :] + offsets[None]).reshape(-1, 2)
+        wall_ids = np.repeat(wall_ids, len(offsets))
+        
+        keys = self._keys(cells)
+        order = np.lexsort((wall_ids, keys))
+        keys, wall_ids = keys[order], wall_ids[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = (keys[1:] != keys[:-1]) | (wall_ids[1:] != wall_ids[:-1])
+        self.keys, self.wall_ids = keys[unique], wall_ids[unique]
+    
+    @staticmethod
+    def _keys(cells: np.ndarray) -> np.ndarray:
+        # Pack (cx, cy) into one sortable int64; grids stay far below 2**31 cells
+        return (cells[:, 0] << 32) + cells[:, 1]
+    
+    def __len__(self) -> int:
+        return len(self.coords)
+    
+    def candidates(self, points: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """All (point, wall) pairs within reach
+        
+        Returns parallel arrays point_ids, wall_ids, distance and t, the
+        position of the closest point along the wall (0 at start, 1 at end).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(points) or not len(self.keys):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0), np.zeros(0)
+        
+        query = self._keys(np.floor(points / self.cell_size).astype(np.int64))
+        lo = np.searchsorted(self.keys, query, side='left')
+        hi = np.searchsorted(self.keys, query, side='right')
+        counts = hi - lo
+        point_ids = np.repeat(np.arange(len(points)), counts)
+        wall_ids = self.wall_ids[np.repeat(lo - np.cumsum(counts) + counts, counts)
+                                 + np.arange(counts.sum())]
+        
+        p1 = self.coords[wall_ids, :2]
+        d = self.coords[wall_ids, 2:] - p1
+        r = points[point_ids] - p1
+        t = np.clip((r * d).sum(axis=1) / np.maximum((d * d).sum(axis=1), 1e-12), 0, 1)
+        dist = np.hypot(*(r - t[:, None] * d).T)
+        
+        near = dist <= self.reach
+        return point_ids[near], wall_ids[near], dist[near], t[near]
+    
+    def nearest(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest wall within reach of each point
+        
+        Returns (wall index, distance) arrays; points with no wall within
+        reach get index -1 and distance inf.
+        """
+        n = len(np.asarray(points).reshape(-1, 2))
+        best = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf)
+        point_ids, wall_ids, dist, _ = self.candidates(points)
+        
+        # Closest candidate per point, ties to the lowest wall index
+        order = np.lexsort((wall_ids, dist, point_ids))
+        leading = np.ones(len(order), dtype=bool)
+        leading[1:] = point_ids[order][1:] != point_ids[order][:-1]
+        first = order[leading]
+        best[point_ids[first]] = wall_ids[first]
+        best_dist[point_ids[first]] = dist[first]
+        return best, best_dist
+    
+    def wall_pairs(self) -> np.ndarray:
+        """Distinct (i, j) wall pairs, i < j, that share a grid cell (K x 2)"""
+        new_cell = np.ones(len(self.keys), dtype=bool)
+        new_cell[1:] = self.keys[1:] != self.keys[:-1]
+        starts = np.flatnonzero(new_cell)
+        counts = np.diff(np.append(starts, len(self.keys)))
+        
+        # Entry k of a cell pairs with every later entry of the same cell
+        partners = np.repeat(starts + counts, counts) - np.arange(len(self.keys)) - 1
+        first = np.repeat(np.arange(len(self.keys)), partners)
+        second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(partners) - partners, partners)
+        i, j = self.wall_ids[first], self.wall_ids[second]
+        packed = np.unique(np.minimum(i, j) * len(self.coords) + np.maximum(i, j))
+        return np.column_stack([packed // len(self.coords), packed % len(self.coords)])
+
+
+class WallGraph:
+    """Wall segments joined into a planar graph of junction nodes
+    
+    Endpoints closer than tolerance are snapped into one node, an endpoint
+    that stops within tolerance of another wall's interior splits that wall
+    (T-junction), and walls that cross are split at the crossing. Candidate
+    pairs come from spatial hashing (WallIndex cells and _close_pairs), so the
+    build is near-linear in the number of walls. The result is nodes (M x 2
+    meters), edges (E x 2 node ids, one per wall piece) and edge_wall, the
+    input wall each edge came from.
+    
+    Free wall ends that face each other across a straight gap of at most
+    bridge meters (a door or window opening) are joined by bridges, virtual
+    edges that close rooms in faces() but are not walls.
+    """
+    
+    def __init__(self, walls, tolerance: float = 0.3, bridge: float = 0.0):
+        table = WallTable.from_walls(walls)
+        self.tolerance = float(tolerance)
+        self.bridge = float(bridge)
+        coords = table.coords
+        n = len(coords)
+        p1, d = coords[:, :2], coords[:, 2:] - coords[:, :2]
+        lengths = np.hypot(d[:, 0], d[:, 1])
+        
+        split_wall = [np.arange(n), np.arange(n)]
+        split_t = [np.zeros(n), np.ones(n)]
+        if n:
+            index = WallIndex(table, self.tolerance)
+            # T-junctions: an endpoint near the interior of another wall
+            ends = np.concatenate([coords[:, :2], coords[:, 2:]])
+            point_ids, wall_ids, _, t = index.candidates(ends)
+            inside = ((point_ids % n != wall_ids) &
+                      (t * lengths[wall_ids] > self.tolerance) &
+                      ((1 - t) * lengths[wall_ids] > self.tolerance))
+            split_wall.append(wall_ids[inside])
+            split_t.append(t[inside])
+            
+            # Crossings: solve p1a + ta * da = p1b + tb * db for walls sharing a cell
+            a, b = index.wall_pairs().T
+            denom = d[a, 0] * d[b, 1] - d[a, 1] * d[b, 0]
+            r = p1[b] - p1[a]
+            safe = np.where(np.abs(denom) > 1e-12, denom, 1.0)
+            ta = (r[:, 0] * d[b, 1] - r[:, 1] * d[b, 0]) / safe
+            tb = (r[:, 0] * d[a, 1] - r[:, 1] * d[a, 0]) / safe
+            cross = (np.abs(denom) > 1e-12) & (ta > 0) & (ta < 1) & (tb > 0) & (tb < 1)
+            split_wall += [a[cross], b[cross]]
+            split_t += [ta[cross], tb[cross]]
+        
+        # Split points in order along each wall, then snapped into nodes
+        split_wall = np.concatenate(split_wall)
+        split_t = np.concatenate(split_t)
+        order = np.lexsort((split_t, split_wall))
+        split_wall, split_t = split_wall[order], split_t[order]
+        points = p1[split_wall] + split_t[:, None] * d[split_wall]
+        labels = _connected_labels(len(points), *_close_pairs(points, self.tolerance))
+        node_ids, labels = np.unique(labels, return_inverse=True)
+        counts = np.bincount(labels, minlength=len(node_ids))
+        self.nodes = np.column_stack([np.bincount(labels, points[:, 0], len(node_ids)),
+                                      np.bincount(labels, points[:, 1], len(node_ids))]) / \
+            np.maximum(counts, 1)[:, None]
+        
+        # Consecutive split points of one wall form an edge; drop collapsed
+        # pieces and pieces that duplicate an earlier wall
+        same_wall = split_wall[1:] == split_wall[:-1]
+        u, v = labels[:-1][same_wall], labels[1:][same_wall]
+        source = split_wall[:-1][same_wall]
+        keep = u != v
+        u, v, source = u[keep], v[keep], source[keep]
+        packed = np.minimum(u, v) * max(len(self.nodes), 1) + np.maximum(u, v)
+        _, first = np.unique(packed, return_index=True)
+        first.sort()
+        self.edges = np.column_stack([u[first], v[first]]).astype(np.int64).reshape(-1, 2)
+        self.edge_wall = source[first].astype(np.int64)
+        self.thickness = table.thickness[self.edge_wall]
+        self.height = table.height[self.edge_wall]
+        
+        self.bridges = self._find_bridges()
+        self.half_origin, self.half_target, self.half_angle, self.order, self.indptr = \
+            self._half_edges(self.edges)
+    
+    def _find_bridges(self) -> np.ndarray:
+        """Pairs of free wall ends facing each other across a gap of at most bridge"""
+        degree = np.bincount(self.edges.reshape(-1), minlength=len(self.nodes))
+        free = np.flatnonzero(degree == 1)
+        if self.bridge <= 0 or len(free) < 2:
+            return np.zeros((0, 2), dtype=np.int64)
+        
+        # Outward direction of each free end, away from its only neighbour
+        ends, others = self.edges.reshape(-1), self.edges[:, ::-1].reshape(-1)
+        by_end = np.argsort(ends, kind='stable')
+        neighbour = others[by_end][np.searchsorted(ends[by_end], free)]
+        out = self.nodes[free] - self.nodes[neighbour]
+        out /= np.maximum(np.hypot(out[:, 0], out[:, 1]), 1e-12)[:, None]
+        
+        i, j = _close_pairs(self.nodes[free], self.bridge)
+        gap = self.nodes[free[j]] - self.nodes[free[i]]
+        gap /= np.maximum(np.hypot(gap[:, 0], gap[:, 1]), 1e-12)[:, None]
+        # Both ends point into the gap and along it (within ~8 degrees)
+        facing = ((out[i] * gap).sum(axis=1) > 0.99) & ((out[j] * -gap).sum(axis=1) > 0.99)
+        i, j = i[facing], j[facing]
+        
+        # Each end takes at most one bridge, the shortest
+        length = np.hypot(*(self.nodes[free[i]] - self.nodes[free[j]]).T)
+        taken = np.zeros(len(free), dtype=bool)
+        pairs = []
+        for k in np.argsort(length, kind='stable'):
+            if not taken[i[k]] and not taken[j[k]]:
+                taken[i[k]] = taken[j[k]] = True
+                pairs.append((free[i[k]], free[j[k]]))
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    
+    def _half_edges(self, edges: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Half-edges 2e (u -> v) and 2e + 1 (v -> u), sorted around each node by angle
+        
+        Returns origin, target and angle per half-edge, the angular order and
+        the CSR offsets of each node's block in that order.
+        """
+        origin = edges.reshape(-1)
+        target = edges[:, ::-1].reshape(-1)
+        vec = self.nodes[target] - self.nodes[origin]
+        angle = np.arctan2(vec[:, 1], vec[:, 0])
+        order = np.lexsort((angle, origin))
+        indptr = np.searchsorted(origin[order], np.arange(len(self.nodes) + 1))
+        return origin, target, angle, order, indptr
+    
+    def __len__(self) -> int:
+        return len(self.edges)
+    
+    def degree(self) -> np.ndarray:
+        """Number of wall pieces meeting at each node"""
+        return np.diff(self.indptr)
+    
+    def neighbors(self, node: int) -> np.ndarray:
+        """Nodes joined to node by a wall, in counterclockwise order"""
+        return self.half_target[self.order[self.indptr[node]:self.indptr[node + 1]]]
+    
+    def incident(self, node: int) -> np.ndarray:
+        """Edge ids meeting at node; edges sharing a node are adjacent walls"""
+        return self.order[self.indptr[node]:self.indptr[node + 1]] // 2
+    
+    def to_walls(self) -> WallTable:
+        """Snapped and split wall pieces as a WallTable"""
+        return WallTable(self.nodes[self.edges].reshape(-1, 4), self.thickness.copy(),
+                         self.height.copy())
+    
+    def faces(self, min_area: float = 0.0, straight_angle: float = 5.0) -> List[np.ndarray]:
+        """Closed wall cycles as polygons (K x 2 meters), the outer boundaries excluded
+        
+        Bridges count as walls here. Walls that end free (and chains of them)
+        are pruned first since they cannot bound a room. Faces are traced by
+        always turning to the next wall clockwise at each node. Vertices where
+        the boundary turns less than straight_angle degrees are dropped, and
+        faces smaller than min_area (m^2) are skipped.
+        """
+        edges = np.concatenate([self.edges, self.bridges])
+        alive = np.ones(len(edges), dtype=bool)
+        while True:
+            degree = np.bincount(edges[alive].reshape(-1), minlength=len(self.nodes))
+            dangling = alive & ((degree[edges[:, 0]] < 2) | (degree[edges[:, 1]] < 2))
+            if not dangling.any():
+                break
+            alive &= ~dangling
+        
+        # Angular order of the surviving half-edges around each node
+        origin, _, angle, _, _ = self._half_edges(edges)
+        half = np.flatnonzero(np.repeat(alive, 2))
+        order = half[np.lexsort((angle[half], origin[half]))]
+        rank = np.empty(2 * len(edges), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        starts = np.searchsorted(origin[order], np.arange(len(self.nodes) + 1))
+        
+        # next(u -> v) is the half-edge leaving v just clockwise of v -> u
+        twin = half ^ 1
+        target = origin[twin]
+        prev = rank[twin] - 1
+        prev = np.where(prev < starts[target], starts[target + 1] - 1, prev)
+        following = np.full(2 * len(edges), -1, dtype=np.int64)
+        following[half] = order[prev]
+        
+        # Faces are the cycles of following; rank each half-edge along its
+        # cycle by pointer jumping, counting steps to the cycle's first member
+        labels = _connected_labels(2 * len(edges), half, following[half])
+        first = labels == np.arange(2 * len(edges))
+        steps = np.where(first, 0, 1)
+        pointer = np.where(first, np.arange(2 * len(edges)), following)
+        while (pointer[half] != labels[half]).any():
+            steps[half] += steps[pointer[half]]
+            pointer[half] = pointer[pointer[half]]
+        face_ids, face = np.unique(labels[half], return_inverse=True)
+        size = np.bincount(face, minlength=len(face_ids))
+        position = (size[face] - steps[half]) % size[face]
+        sequence = half[np.lexsort((position, face))]
+        face = face[np.searchsorted(half, sequence)]
+        
+        # Shoelace area per face; bounded faces wind one way, each component's
+        # outer boundary the other
+        a, b = self.nodes[origin[sequence]], self.nodes[origin[sequence ^ 1]]
+        signed = 0.5 * np.bincount(face, a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0], len(face_ids))
+        
+        # Turn at each vertex between the incoming and the outgoing wall
+        previous = np.empty(2 * len(edges), dtype=np.int64)
+        previous[following[half]] = half
+        incoming = a - self.nodes[origin[previous[sequence]]]
+        outgoing = b - a
+        turn = np.degrees(np.abs(np.arctan2(
+            incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0],
+            (incoming * outgoing).sum(axis=1))))
+        
+        corner = turn >= straight_angle
+        counts = np.bincount(face[corner], minlength=len(face_ids))
+        polygons = np.split(a[corner], np.cumsum(counts)[:-1])
+        return [polygons[k] for k in np.flatnonzero((signed > 0) & (signed >= min_area) & (counts >= 3))]
+
+
+def _close_pairs(points: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs (i < j) of points closer than radius, by spatial hashing
+    
+    Points are bucketed into radius-sized cells with sorted keys; each cell
+    is matched against itself and four of its neighbours, so every close pair
+    is found exactly once in expected linear time.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(points) < 2 or radius <= 0:
+        return empty, empty
+    cells = np.floor(points / radius).astype(np.int64)
+    keys = WallIndex._keys(cells)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    
+    firsts, seconds = [], []
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        query = WallIndex._keys(cells + (dx, dy))
+        lo = np.searchsorted(sorted_keys, query, side='left')
+        hi = np.searchsorted(sorted_keys, query, side='right')
+        counts = hi - lo
+        first = np.repeat(np.arange(len(points)), counts)
+        second = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        if dx == 0 and dy == 0:
+            mask = first < second
+            first, second = first[mask], second[mask]
+        firsts.append(first)
+        seconds.append(second)
+    first, second = np.concatenate(firsts), np.concatenate(seconds)
+    close = np.hypot(*(points[first] - points[second]).T) <= radius
+    return first[close], second[close]
+
+
+def _connected_labels(n: int, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Connected component label (smallest member index) of n nodes joined by edges
+    
+    Min-label propagation with pointer jumping; each round is one vectorized
+    pass and the number of rounds grows with the log of the component size.
+    """
+    labels = np.arange(n)
+    while len(first):
+        low = np.minimum(labels[first], labels[second])
+        np.minimum.at(labels, labels[first], low)
+        np.minimum.at(labels, labels[second], low)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels[first], labels[second]):
+            break
+    return labels
+
+
+def _chain_groups(values: np.ndarray, gap: float, max_span: float,
+                  outer: np.ndarray = None) -> np.ndarray:
+    """Group sorted values whose neighbours are closer than gap
+    
+    Chains longer than max_span are cut into consecutive max_span-wide bins so
+    dense hatching cannot link unrelated lines. If outer is given (sorted
+    group ids of the same length), groups never cross an outer boundary.
+    Returns dense group ids in input order.
+    """
+    breaks = np.ones(len(values), dtype=bool)
+    breaks[1:] = np.diff(values) > gap
+    if outer is not None:
+        breaks[1:] |= outer[1:] != outer[:-1]
+    chain = np.cumsum(breaks) - 1
+    chain_min = values[breaks][chain]
+    sub = np.floor((values - chain_min) / max_span).astype(np.int64)
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = (chain[1:] != chain[:-1]) | (sub[1:] != sub[:-1])
+    return np.cumsum(changed) - 1
+
+
+def _door_kernel(radius: int, start_angle: float = 0.0, leaf: Optional[int] = None,
+                 margin: int = 2) -> Tuple[np.ndarray, np.ndarray]:
+    """Door swing templates, hinge at the kernel center
+    
+    Returns the stroke kernel and the empty kernel. The strokes are the
+    one-pixel quarter arc from start_angle plus, unless leaf is None, the
+    door leaf (the radius at start_angle, or at start_angle + 90 when leaf
+    is 1); they weigh 1 in total. The empty kernel weighs 1 over the swept
+    quarter disc, margin pixels clear of the strokes, and 1 over a band just
+    outside the middle of the arc, where a room corner or another wall
+    would be inked but a door opens onto floor.
+    """
+    band = max(2, radius // 4)
+    c = radius + margin + band + 1
+    size = 2 * c + 1
+    strokes = np.zeros((size, size), dtype=np.uint8)
+    cv2.ellipse(strokes, (c, c), (radius, radius), 0, start_angle, start_angle + 90, 255, 1)
+    if leaf is not None:
+        angle = np.deg2rad(start_angle + 90 * leaf)
+        cv2.line(strokes, (c, c), (int(round(c + radius * np.cos(angle))),
+                                   int(round(c + radius * np.sin(angle)))), 255, 1)
+    
+    yy, xx = np.mgrid[-c:c + 1, -c:c + 1]
+    rho = np.hypot(xx, yy)
+    a0, a1 = np.deg2rad(start_angle), np.deg2rad(start_angle + 90)
+    swept = ((rho < radius - margin) &
+             (xx * np.cos(a0) + yy * np.sin(a0) > margin) & (xx * np.cos(a1) + yy * np.sin(a1) > margin))
+    sweep_angle = (np.degrees(np.arctan2(yy, xx)) - start_angle) % 360
+    outside = ((rho > radius + margin) & (rho <= radius + margin + band) &
+               (sweep_angle > 15) & (sweep_angle < 75))
+    stroke = strokes > 0
+    empty = swept / max(1, swept.sum()) + outside / max(1, outside.sum())
+    return (stroke / stroke.sum()).astype(np.float32), empty.astype(np.float32)
+
+
+def _extrude_boxes(p1: np.ndarray, p2: np.ndarray, z0: np.ndarray, z1: np.ndarray,
+                   half_thickness: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Extrude B plan segments into boxes in one pass
+    
+    Returns positions and normals (B*24 x 3, glTF axes: x, up, plan y) and
+    triangle indices (B*12 x 3). Every face has its own four vertices so the
+    flat normals stay sharp.
+    """
+    d = p2 - p1
+    u = d / np.linalg.norm(d, axis=1, keepdims=True)
+    n = np.column_stack([-u[:, 1], u[:, 0]]) * half_thickness[:, None]
+    a, b, c, e = p1 + n, p2 + n, p2 - n, p1 - n
+    
+    def lift(plan, z):
+        return np.column_stack([plan[:, 0], np.broadcast_to(z, len(plan)), plan[:, 1]])
+    
+    lo = {k: lift(v, z0) for k, v in zip('abce', (a, b, c, e))}
+    hi = {k: lift(v, z1) for k, v in zip('abce', (a, b, c, e))}
+    faces = [  # four corners and outward normal per face
+        ((lo['a'], lo['b'], hi['b'], hi['a']), lift(n, 0.0)),
+        ((lo['c'], lo['e'], hi['e'], hi['c']), lift(-n, 0.0)),
+        ((lo['b'], lo['c'], hi['c'], hi['b']), lift(u, 0.0)),
+        ((lo['e'], lo['a'], hi['a'], hi['e']), lift(-u, 0.0)),
+        ((lo['a'], lo['e'], lo['c'], lo['b']), np.tile([0.0, -1.0, 0.0], (len(p1), 1))),
+        ((hi['a'], hi['b'], hi['c'], hi['e']), np.tile([0.0, 1.0, 0.0], (len(p1), 1))),
+    ]
+    positions = np.stack([np.stack(corners, axis=1) for corners, _ in faces], axis=1)  # B x 6 x 4 x 3
+    normals = np.stack([normal / np.linalg.norm(normal, axis=1, keepdims=True)
+                        for _, normal in faces], axis=1)
+    normals = np.broadcast_to(normals[:, :, None, :], positions.shape)
+    
+    quads = np.arange(len(p1) * 6)[:, None] * 4
+    indices = np.concatenate([quads + [0, 1, 2], quads + [0, 2, 3]], axis=1).reshape(-1, 3)
+    return positions.reshape(-1, 3), normals.reshape(-1, 3), indices
+
+
+def _contour_measures(contours) -> Tuple[np.ndarray, np.ndarray]:
+    """Area and perimeter of every closed OpenCV contour in one vectorized pass"""
+    lengths = np.array([len(c) for c in contours])
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    starts = np.cumsum(lengths) - lengths
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    nxt = points[following]
+    area = np.abs(np.add.reduceat(points[:, 0] * nxt[:, 1] - points[:, 1] * nxt[:, 0], starts)) / 2
+    perimeter = np.add.reduceat(np.hypot(*(nxt - points).T), starts)
+    return area, perimeter
+
+
+def _clip_range(coords: np.ndarray, box) -> Tuple[np.ndarray, np.ndarray]:
+    """Liang-Barsky: the [t0, t1] part of each segment (N x 4) inside box (x0, y0, x1, y1)
+    
+    t0 >= t1 where a segment misses the box.
+    """
+    p1, d = coords[:, :2], coords[:, 2:] - coords[:, :2]
+    t0, t1 = np.zeros(len(coords)), np.ones(len(coords))
+    for axis in (0, 1):
+        lo, hi = box[axis], box[axis + 2]
+        parallel = d[:, axis] == 0
+        within = (p1[:, axis] >= lo) & (p1[:, axis] <= hi)
+        step = np.where(parallel, 1.0, d[:, axis])
+        a, b = (lo - p1[:, axis]) / step, (hi - p1[:, axis]) / step
+        t0 = np.maximum(t0, np.where(parallel, np.where(within, -np.inf, np.inf), np.minimum(a, b)))
+        t1 = np.minimum(t1, np.where(parallel, np.where(within, np.inf, -np.inf), np.maximum(a, b)))
+    return t0, t1
+
+
+def _clip_walls(walls: WallTable, box, min_length: float = 0.0) -> Tuple[WallTable, WallTable]:
+    """Split walls at a box (x0, y0, x1, y1) into the pieces inside and outside it
+    
+    Each wall has at most one piece inside and two outside. Pieces shorter
+    than min_length are dropped.
+    """
+    p1, d = walls.coords[:, :2], walls.coords[:, 2:] - walls.coords[:, :2]
+    t0, t1 = _clip_range(walls.coords, box)
+    
+    def pieces(index, start, end):
+        a = p1[index] + start[:, None] * d[index]
+        b = p1[index] + end[:, None] * d[index]
+        keep = np.hypot(*(b - a).T) > min_length
+        return WallTable(np.hstack([a, b])[keep], walls.thickness[index][keep],
+                         walls.height[index][keep])
+    
+    # Every piece is (wall, start t, end t)
+    hits, misses = np.flatnonzero(t0 < t1), np.flatnonzero(t0 >= t1)
+    inside = pieces(hits, t0[hits], t1[hits])
+    outside = pieces(np.concatenate([misses, hits, hits]),
+                     np.concatenate([np.zeros(len(misses)), np.zeros(len(hits)), t1[hits]]),
+                     np.concatenate([np.ones(len(misses)), t0[hits], np.ones(len(hits))]))
+    return inside, outside
+
+
+def _merge_boxes(boxes: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Replace overlapping (x0, y0, x1, y1) boxes by their bounding box until all are disjoint
+    
+    Each round sweeps the boxes sorted by x0, so a box is only tested against
+    those starting before it ends, and unites the overlapping groups with
+    _connected_labels. Merged boxes can grow into new overlaps, hence the
+    rounds; merged boxes keep the position of their first member.
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    while len(boxes) > 1:
+        order = np.argsort(boxes[:, 0], kind='stable')
+        x0 = boxes[order, 0]
+        ends = np.searchsorted(x0, boxes[order, 2], side='left')
+        counts = np.maximum(ends - np.arange(len(boxes)) - 1, 0)
+        first = np.repeat(np.arange(len(boxes)), counts)
+        second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        a, b = boxes[order[first]], boxes[order[second]]
+        overlap = (a[:, 0] < b[:, 2]) & (b[:, 0] < a[:, 2]) & (a[:, 1] < b[:, 3]) & (b[:, 1] < a[:, 3])
+        if not overlap.any():
+            break
+        labels = _connected_labels(len(boxes), order[first[overlap]], order[second[overlap]])
+        groups, inverse = np.unique(labels, return_inverse=True)
+        merged = np.empty((len(groups), 4), dtype=np.int64)
+        merged[:, :2] = np.iinfo(np.int64).max
+        merged[:, 2:] = np.iinfo(np.int64).min
+        np.minimum.at(merged[:, :2], inverse, boxes[:, :2])
+        np.maximum.at(merged[:, 2:], inverse, boxes[:, 2:])
+        boxes = merged
+    return [tuple(box) for box in boxes.tolist()]
+
+
+def _npy_view(buffer) -> np.ndarray:
+    """Zero-copy array over an in-memory .npy file (header, then the raw pixels)"""
+    stream = io.BytesIO(memoryview(buffer)[:65536])
+    version = np.lib.format.read_magic(stream)
+    read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                   else np.lib.format.read_array_header_2_0)
+    shape, fortran_order, dtype = read_header(stream)
+    count = int(np.prod(shape))
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=stream.tell()).reshape(
+        shape, order='F' if fortran_order else 'C')
+
+
+def _as_bgr(img: np.ndarray) -> np.ndarray:
+    """A raster as 3-channel BGR uint8; gray and BGRA rasters are converted"""
+    if img.dtype != np.uint8:
+        raise ValueError(f"Expected a uint8 raster, got {img.dtype}")
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """High-water resident set size of this process in MB, None where unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS
+
+
+def _open_pdf(path: str):
+    """Open a PDF with PyMuPDF, imported lazily since only PDF input needs it"""
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            raise ValueError("PDF input requires PyMuPDF (pip install pymupdf)") from None
+    return pymupdf.open(path)
+
+
+def _recognize_text(image: np.ndarray) -> Optional[str]:
+    """First line of text OCR reads in image, or None without pytesseract (imported lazily)"""
+    try:
+        import pytesseract
+    except ImportError:
+        return None
+    try:
+        text = pytesseract.image_to_string(image, config='--psm 6')
+    except pytesseract.TesseractNotFoundError:
+        return None
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    return next((line for line in lines if line), None)
+
+
+def _triangulate_polygon(points: np.ndarray) -> np.ndarray:
+    """Ear-clipping triangulation of a simple polygon, returns K x 3 vertex indices
+    
+    Falls back to a fan for whatever is left if no ear can be found (self-
+    intersecting outlines from approxPolyDP).
+    """
+    n = len(points)
+    if n < 3:
+        return np.empty((0, 3), dtype=np.int64)
+    x, y = points[:, 0], points[:, 1]
+    signed_area = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+    order = list(range(n)) if signed_area > 0 else list(range(n - 1, -1, -1))
+    
+    def cross(o, a, b):
+        return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - \
+               (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+    
+    triangles = []
+    while len(order) > 3:
+        for k in range(len(order)):
+            i0, i1, i2 = order[k - 1], order[k], order[(k + 1) % len(order)]
+            a, b, c = points[i0], points[i1], points[i2]
+            if cross(a, b, c) <= 0:
+                continue  # reflex or degenerate corner
+            others = points[[j for j in order if j not in (i0, i1, i2)]]
+            inside = (cross(a, b, others) >= 0) & (cross(b, c, others) >= 0) & (cross(c, a, others) >= 0)
+            if inside.any():
+                continue
+            triangles.append((i0, i1, i2))
+            del order[k]
+            break
+        else:
+            break
+    triangles.extend((order[0], order[k], order[k + 1]) for k in range(1, len(order) - 1))
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+
+class DoorKernelBank:
+    """Bank of door swing kernels over orientations, radii and optionally leaf sides
+    
+    A kernel scores the stroke ink it covers minus the ink it should find
+    empty (see _door_kernel), so a fully drawn swing over empty floor scores
+    1. Matching uses one FFT of each image shared by every kernel: each
+    kernel only adds two spectrum products and an inverse transform. Scores
+    are identical to the difference of two cv2.matchTemplate TM_CCORR maps.
+    """
+    
+    _banks = {}
+    # Kernel spectra are cached per FFT shape up to this many complex values
+    max_cached_spectrum_size = 32 * 1024 * 1024
+    
+    def __init__(self, radii_px: Tuple[int, ...], orientations: int, leaves: bool = True):
+        sides = (0, 1) if leaves else (None,)
+        # Largest radii first: a smaller arc fits inside a dilated larger one,
+        # and near ties keep the first kernel
+        self.entries = [(r, i * 360.0 / orientations, leaf) for r in sorted(radii_px, reverse=True)
+                        for i in range(orientations) for leaf in sides]
+        self.templates = [_door_kernel(r, angle, leaf, self.margin(r) if leaves else 1)
+                          for r, angle, leaf in self.entries]
+        self.index = {entry: idx for idx, entry in enumerate(self.entries)}
+        self.max_size = max(strokes.shape[0] for strokes, _ in self.templates)
+        self._spectra = OrderedDict()
+    
+    @staticmethod
+    def margin(radius: int) -> int:
+        """Clearance between a kernel's strokes and its empty area, room for a drawn leaf"""
+        return 2 + radius // 10
+    
+    @classmethod
+    def get(cls, radii_px: Tuple[int, ...], orientations: int, leaves: bool = True) -> 'DoorKernelBank':
+        """Shared, lazily built bank for this set of radii, orientations and leaf option"""
+        key = (tuple(radii_px), int(orientations), bool(leaves))
+        if key not in cls._banks:
+            cls._banks[key] = cls(*key)
+        return cls._banks[key]
+    
+    def _kernel_spectra(self, fft_shape: Tuple[int, int]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if fft_shape in self._spectra:
+            self._spectra.move_to_end(fft_shape)
+            return self._spectra[fft_shape]
+        spectra = [tuple(np.conj(sp_fft.rfft2(t, s=fft_shape, workers=-1)) for t in pair)
+                   for pair in self.templates]
+        size = 2 * len(spectra) * spectra[0][0].size
+        while self._spectra and sum(2 * len(v) * v[0][0].size for v in self._spectra.values()) + size > \
+                self.max_cached_spectrum_size:
+            self._spectra.popitem(last=False)
+        if size <= self.max_cached_spectrum_size:
+            self._spectra[fft_shape] = spectra
+        return spectra
+    
+    def match(self, strokes_img: np.ndarray, ink_img: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Best score over the bank at every hinge pixel, and the winning kernel index
+        
+        strokes_img is the float32 ink mask the strokes are matched on (in
+        [0, 1], typically dilated), ink_img the one that should be empty.
+        """
+        h, w = strokes_img.shape[:2]
+        best = np.full((h, w), -1.0, dtype=np.float32)
+        best_idx = np.zeros((h, w), dtype=np.int16)
+        if h < self.max_size or w < self.max_size:
+            return best, best_idx
+        
+        fft_shape = (sp_fft.next_fast_len(h + self.max_size - 1, real=True),
+                     sp_fft.next_fast_len(w + self.max_size - 1, real=True))
+        strokes_spectrum = sp_fft.rfft2(strokes_img, s=fft_shape, workers=-1)
+        ink_spectrum = sp_fft.rfft2(ink_img, s=fft_shape, workers=-1)
+        
+        for idx, (strokes, empty) in enumerate(self._kernel_spectra(fft_shape)):
+            k = self.templates[idx][0].shape[0]
+            rh, rw = h - k + 1, w - k + 1
+            score = sp_fft.irfft2(strokes_spectrum * strokes - ink_spectrum * empty,
+                                  s=fft_shape, workers=-1)[:rh, :rw]
+            
+            # Align every kernel on its hinge (kernel center)
+            c = k // 2
+            target = best[c:c + rh, c:c + rw]
+            better = score > target + 1e-3
+            target[better] = score[better]
+            best_idx[c:c + rh, c:c + rw][better] = idx
+        
+        return best, best_idx
 
 
 class BlueprintTo3DBIM:
     """Converts 2D blueprint images to 3D BIM models"""
     
-    def __init__(self, scale_factor: float = 0.05):
+    def __init__(self, scale_factor: float = 0.05, params: Dict = None):
         """
         Initialize converter
         
         Args:
             scale_factor: Conversion from pixels to meters (e.g., 0.05 = 1 pixel = 5cm)
+            params: Overrides for DETECTOR_PARAMS
         """
         self.scale_factor = scale_factor
-        self.walls = []
-        self.rooms = []
+        self.params = {**DETECTOR_PARAMS, **(params or {})}
+        self.counters = None  # candidate counts per stage while instrumented
+        self._counters_lock = threading.Lock()
+    
+    def count(self, stage: str, **counts):
+        """Add candidate counts for a stage; a no-op unless instrumented"""
+        if self.counters is None:
+            return
+        with self._counters_lock:
+            stage_counts = self.counters.setdefault(stage, {})
+            for name, value in counts.items():
+                stage_counts[name] = stage_counts.get(name, 0) + int(value)
+    
+    def scaled_params(self, factor: float) -> Dict:
+        """Pixel-based parameters adjusted for an image downsampled by factor"""
+        p = dict(self.params)
+        if factor == 1:
+            return p
+        p['bilateral_d'] = max(3, int(round(p['bilateral_d'] / factor)))
+        p['adaptive_block_size'] = max(3, int(p['adaptive_block_size'] / factor) | 1)
+        p['morph_kernel'] = max(1, int(p['morph_kernel'] / factor))
+        p['hough_threshold'] = max(10, int(p['hough_threshold'] / factor))
+        p['hough_min_line_length'] = max(5, p['hough_min_line_length'] / factor)
+        p['hough_max_line_gap'] = max(2, p['hough_max_line_gap'] / factor)
+        p['merge_distance_threshold'] = max(2.0, p['merge_distance_threshold'] / factor)
+        p['room_min_area'] = p['room_min_area'] / factor ** 2
+        return p
         
     def load_blueprint(self, image_path: str) -> np.ndarray:
-        """Load and preprocess blueprint image"""
+        """Load and preprocess blueprint image
+        
+        .npy rasters are memory-mapped rather than read; on Linux a file in
+        /dev/shm hands over an already decoded image through shared memory.
+        """
+        if image_path.lower().endswith('.npy'):
+            return _as_bgr(np.load(image_path, mmap_mode='r'))
         img = cv2.imread(image_path)
         if img is None:
             raise ValueError(f"Could not load image from {image_path}")
         return img
     
-    def preprocess_image(self, img: np.ndarray) -> np.ndarray:
-        """Preprocess blueprint image for wall detection"""
+    def load_raster(self, image_path: str) -> np.ndarray:
+        """Open a blueprint for tiled processing without full-resolution color copies
+        
+        .npy rasters (H x W or H x W x 3 uint8) are memory-mapped and streamed
+        from disk tile by tile; other formats are decoded once as single-channel.
+        """
+        if image_path.lower().endswith('.npy'):
+            return np.load(image_path, mmap_mode='r')
+        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Could not load image from {image_path}")
+        return img
+    
+    def count_pages(self, image_path: str) -> int:
+        """Number of pages in a blueprint file: TIFF frames, PDF pages, else 1"""
+        ext = os.path.splitext(image_path)[1].lower()
+        if ext == '.pdf':
+            with _open_pdf(image_path) as doc:
+                return doc.page_count
+        if ext in ('.tif', '.tiff'):
+            return max(1, cv2.imcount(image_path))
+        return 1
+    
+    def load_page(self, image_path: str, page: int, dpi: int = 200) -> np.ndarray:
+        """Load one zero-based page of a multi-page TIFF or PDF (rendered at dpi)"""
+        if image_path.lower().endswith('.pdf'):
+            with _open_pdf(image_path) as doc:
+                if not 0 <= page < doc.page_count:
+                    raise ValueError(f"{image_path} has no page {page + 1}")
+                pix = doc[page].get_pixmap(dpi=dpi, alpha=False)
+                img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+                return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR if pix.n == 1 else cv2.COLOR_RGB2BGR)
+        ok, pages = cv2.imreadmulti(image_path, start=page, count=1, flags=cv2.IMREAD_COLOR)
+        if not ok or not pages:
+            raise ValueError(f"Could not load page {page + 1} from {image_path}")
+        return pages[0]
+    
+    def decode_blueprint(self, image_bytes: bytes) -> np.ndarray:
+        """Decode an encoded blueprint image (PNG, JPEG, ...) from memory
+        
+        Bytes holding a .npy raster are viewed in place without decoding.
+        """
+        if bytes(image_bytes[:6]) == b'\x93NUMPY':
+            return _as_bgr(_npy_view(image_bytes))
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Could not decode image data")
+        return img
+    
+    def binarize(self, img: np.ndarray, gray: np.ndarray = None) -> np.ndarray:
+        """Denoised, thresholded and closed ink mask; strokes of any width survive"""
         # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Apply bilateral filter to reduce noise while keeping edges sharp
-        filtered = cv2.bilateralFilter(gray, 9, 75, 75)
+        # Reduce noise; the bilateral filter keeps edges sharp but is the slowest
+        p = self.params
+        method = p['denoise_method']
+        if method == 'bilateral':
+            filtered = cv2.bilateralFilter(gray, p['bilateral_d'], p['bilateral_sigma'], p['bilateral_sigma'])
+        elif method == 'median':
+            filtered = cv2.medianBlur(gray, p['denoise_ksize'])
+        elif method == 'gaussian':
+            filtered = cv2.GaussianBlur(gray, (p['denoise_ksize'], p['denoise_ksize']), 0)
+        elif method == 'none':
+            filtered = gray
+        else:
+            raise ValueError(f"Unknown denoise_method: {method}")
         
-        # Apply adaptive thresholding
-        binary = cv2.adaptiveThreshold(
-            filtered, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY_INV, 11, 2
-        )
+        # Apply thresholding
+        method = p['threshold_method']
+        if method in ('adaptive_gaussian', 'adaptive_mean'):
+            adaptive = (cv2.ADAPTIVE_THRESH_GAUSSIAN_C if method == 'adaptive_gaussian'
+                        else cv2.ADAPTIVE_THRESH_MEAN_C)
+            c = max(p['adaptive_c'], p['adaptive_c_grain_factor'] * self.measure_grain(filtered))
+            binary = cv2.adaptiveThreshold(
+                filtered, 255, adaptive, 
+                cv2.THRESH_BINARY_INV, p['adaptive_block_size'], c
+            )
+        elif method == 'otsu':
+            _, binary = cv2.threshold(filtered, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        else:
+            raise ValueError(f"Unknown threshold_method: {method}")
         
-        # Morphological operations to clean up
-        kernel = np.ones((3, 3), np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+        # Morphological closing bridges broken strokes
+        if p['morph_kernel'] > 1:
+            kernel = np.ones((p['morph_kernel'], p['morph_kernel']), np.uint8)
+            binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
         
         return binary
     
-    def detect_walls(self, binary_img: np.ndarray) -> List[Wall]:
-        """Detect walls from preprocessed binary image using line detection"""
+    def preprocess_image(self, img: np.ndarray, gray: np.ndarray = None,
+                         ink: np.ndarray = None) -> np.ndarray:
+        """Preprocess blueprint image for wall detection
+        
+        The binarize ink mask (computed when not given) is opened, which
+        drops speckles and strokes thinner than morph_kernel.
+        """
+        binary = self.binarize(img, gray) if ink is None else ink
+        if self.params['morph_kernel'] > 1:
+            kernel = np.ones((self.params['morph_kernel'], self.params['morph_kernel']), np.uint8)
+            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+        return binary
+    
+    def measure_grain(self, filtered: np.ndarray) -> float:
+        """Scanner grain of a denoised gray sheet, in gray levels
+        
+        A robust standard deviation (1.4826 times the median absolute
+        deviation) of the sheet around its Gaussian local mean over
+        adaptive_block_size, the mean the adaptive threshold compares with.
+        Clean drawings measure 0: most of a sheet is flat paper. Contrast
+        enhancement stretches the grain on scans, and a fixed adaptive_c of a
+        level or two lets it through as ink.
+        """
+        if self.params['adaptive_c_grain_factor'] <= 0:
+            return 0.0
+        block = self.params['adaptive_block_size']
+        gray = filtered.astype(np.float32)
+        residual = gray - cv2.GaussianBlur(gray, (block, block), 0)
+        return 1.4826 * float(np.median(np.abs(residual[::2, ::2])))
+    
+    def detect_edges(self, binary_img: np.ndarray) -> np.ndarray:
+        """Edge map used for wall line detection"""
+        return cv2.Canny(binary_img, self.params['canny_low'], self.params['canny_high'],
+                         apertureSize=3)
+    
+    def detect_walls(self, binary_img: np.ndarray, edges: np.ndarray = None,
+                     distance: np.ndarray = None) -> List[Wall]:
+        """Detect walls from preprocessed binary image using line detection
+        
+        distance is the L2 distance transform of binary_img (computed when
+        not given) from which each wall's thickness is measured.
+        """
         # Use Hough Line Transform to detect straight lines
-        edges = cv2.Canny(binary_img, 50, 150, apertureSize=3)
+        p = self.params
+        if edges is None:
+            edges = self.detect_edges(binary_img)
         
         # Detect lines using probabilistic Hough transform
         lines = cv2.HoughLinesP(
             edges, 
             rho=1, 
             theta=np.pi/180, 
-            threshold=100,
-            minLineLength=50,
-            maxLineGap=10
+            threshold=p['hough_threshold'],
+            minLineLength=p['hough_min_line_length'],
+            maxLineGap=p['hough_max_line_gap']
         )
         
         walls = []
         if lines is not None:
             # Filter and merge nearby parallel lines
-            merged_lines = self._merge_parallel_lines(lines)
+            merged_lines = self._merge_parallel_lines(
+                lines, p['merge_angle_threshold'], p['merge_distance_threshold']
+            )
             
-            for line in merged_lines:
+            if distance is None:
+                distance = cv2.distanceTransform(binary_img, cv2.DIST_L2, 5)
+            # Hough traces both faces of a thick wall; moved onto the centre of
+            # their ink, the faces of one wall merge into a single line
+            _, centres = self.measure_wall_thickness(np.asarray(merged_lines), distance,
+                                                     return_centres=True)
+            merged_lines = np.asarray(merged_lines, dtype=np.float64).reshape(-1, 4)
+            d = merged_lines[:, 2:] - merged_lines[:, :2]
+            length = np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-9)
+            shift = np.tile(centres[:, None] * np.column_stack([-d[:, 1], d[:, 0]]) / length[:, None], 2)
+            merged_lines = self._merge_parallel_lines(
+                merged_lines + shift, p['merge_angle_threshold'], p['merge_distance_threshold']
+            )
+            self.count('walls', hough_lines=len(lines), merged_lines=len(merged_lines))
+            thicknesses = self.measure_wall_thickness(np.asarray(merged_lines), distance)
+            
+            for line, thickness in zip(merged_lines, thicknesses.tolist()):
                 x1, y1, x2, y2 = line
                 
                 # Convert to meters
                 start = (x1 * self.scale_factor, y1 * self.scale_factor)
                 end = (x2 * self.scale_factor, y2 * self.scale_factor)
                 
-                # Estimate wall thickness based on nearby parallel lines
-                thickness = 0.2  # Default 20cm
-                
                 wall = Wall(start_point=start, end_point=end, thickness=thickness)
                 walls.append(wall)
         
-        self.walls = walls
         return walls
     
+    def measure_wall_thickness(self, lines: np.ndarray, distance: np.ndarray,
+                               samples: int = 9, return_centres: bool = False):
+        """Thickness in meters of each wall line (N x 4 pixels) from a distance transform
+        
+        Every wall is probed at samples stations along its middle 80%, each
+        with a cross-section reaching wall_max_thickness to either side (the
+        line may run along one face of the wall), in a single gather. The
+        cross-section is sampled every half pixel, a quarter pixel off the
+        line, so each pixel it crosses squarely counts twice. The ink run
+        through the deepest point of the distance transform is the stroke
+        width along the normal; the median over the stations with ink
+        ignores door gaps and crossing walls. Walls with no ink under them
+        keep the 0.2 m default. With return_centres, also returns the signed
+        offset in pixels along the normal (-dy, dx) from each line to the
+        middle of its ink (0 without ink).
+        """
+        lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+        h, w = distance.shape[:2]
+        p1, d = lines[:, :2], lines[:, 2:] - lines[:, :2]
+        length = np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-9)
+        normal = np.column_stack([-d[:, 1], d[:, 0]]) / length[:, None]
+        
+        reach = int(np.ceil(self.params['wall_max_thickness'] / self.scale_factor))
+        t = np.linspace(0.1, 0.9, samples)
+        offsets = (np.arange(-2 * reach, 2 * reach) + 0.5) / 2
+        # N x samples x offsets probe grid
+        points = (p1[:, None, None, :] + t[None, :, None, None] * d[:, None, None, :] +
+                  offsets[None, None, :, None] * normal[:, None, None, :])
+        x = np.clip(np.rint(points[..., 0]).astype(np.intp), 0, w - 1)
+        y = np.clip(np.rint(points[..., 1]).astype(np.intp), 0, h - 1)
+        depth = distance[y, x]
+        
+        # The ink run around the ridge: from the last gap before it to the first gap after
+        ink = depth > 0
+        ridge = depth.argmax(axis=2)[..., None]
+        position = np.arange(len(offsets))
+        first = np.where(~ink & (position < ridge), position, -1).max(axis=2) + 1
+        last = np.where(~ink & (position > ridge), position, len(offsets)).min(axis=2) - 1
+        found = ink.any(axis=2)
+        width = np.where(found, (last - first + 1) * 0.5, np.nan)
+        middle = np.where(found, (offsets[first] + offsets[np.maximum(last, first)]) / 2, np.nan)
+        
+        # Median over the stations with ink; NaN sorts last
+        stations = found.sum(axis=1)
+        rows = np.arange(len(lines))
+        lo, hi = np.maximum(stations - 1, 0) // 2, np.maximum(stations, 1) // 2
+        widths, middles = np.sort(width, axis=1), np.sort(middle, axis=1)
+        width = (widths[rows, lo] + widths[rows, np.minimum(hi, samples - 1)]) / 2
+        middle = (middles[rows, lo] + middles[rows, np.minimum(hi, samples - 1)]) / 2
+        
+        thickness = np.clip(np.nan_to_num(width) * self.scale_factor, self.scale_factor,
+                            self.params['wall_max_thickness'])
+        thickness = np.where(stations > 0, thickness, 0.2)
+        if return_centres:
+            return thickness, np.where(stations > 0, np.nan_to_num(middle), 0.0)
+        return thickness
+    
     def _merge_parallel_lines(self, lines: np.ndarray, 
                              angle_threshold: float = 5.0,
-                             distance_threshold: float = 10.0) -> List:
-        """Merge nearby parallel lines to reduce duplicates"""
+                             distance_threshold: float = 10.0,
+                             return_groups: bool = False) -> List:
+        """Merge nearby parallel lines to reduce duplicates
+        
+        Segments are grouped by orientation, then by perpendicular offset along
+        each group's normal, and finally into overlapping runs along the group
+        direction. Each run becomes one segment spanning the extreme projections
+        of its members, so diagonal walls stay on their own axis. Every step is
+        a sort or a vectorized pass, giving O(n log n) overall. With
+        return_groups, also returns the merged index of every input line.
+        """
         if lines is None or len(lines) == 0:
-            return []
+            return ([], np.zeros(0, dtype=np.int64)) if return_groups else []
         
-        lines = lines.reshape(-1, 4)
-        merged = []
-        used = set()
+        lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+        p0, p1 = lines[:, :2], lines[:, 2:]
+        d = p1 - p0
+        lengths = np.hypot(d[:, 0], d[:, 1])
         
-        for i, line1 in enumerate(lines):
-            if i in used:
-                continue
-                
-            x1, y1, x2, y2 = line1
-            angle1 = np.arctan2(y2 - y1, x2 - x1) * 180 / np.pi
-            
-            # Find parallel lines
-            similar_lines = [line1]
-            for j, line2 in enumerate(lines[i+1:], start=i+1):
-                if j in used:
-                    continue
-                    
-                x3, y3, x4, y4 = line2
-                angle2 = np.arctan2(y4 - y3, x4 - x3) * 180 / np.pi
-                
-                # Check if angles are similar
-                angle_diff = abs(angle1 - angle2)
-                if angle_diff > 180:
-                    angle_diff = 360 - angle_diff
-                    
-                if angle_diff < angle_threshold:
-                    # Check distance between lines
-                    dist = self._point_to_line_distance((x3, y3), (x1, y1, x2, y2))
-                    if dist < distance_threshold:
-                        similar_lines.append(line2)
-                        used.add(j)
-            
-            # Merge similar lines
-            if len(similar_lines) > 1:
-                all_points = [(x, y) for line in similar_lines 
-                             for x, y in [(line[0], line[1]), (line[2], line[3])]]
-                # Find extreme points
-                x_coords = [p[0] for p in all_points]
-                y_coords = [p[1] for p in all_points]
-                # Extract coordinates from list and format as [x1, y1, x2, y2]
-                merged_line = [min(x_coords), min(y_coords), max(x_coords), max(y_coords)]
-            else:
-                merged_line = line1.tolist()
-                
-            merged.append(merged_line)
-            used.add(i)
+        # Undirected orientation in [0, 180)
+        theta = np.degrees(np.arctan2(d[:, 1], d[:, 0])) % 180.0
+        order = np.argsort(theta, kind='stable')
+        angle_ids = np.empty(len(lines), dtype=np.int64)
+        angle_ids[order] = _chain_groups(theta[order], angle_threshold, 2 * angle_threshold)
+        # Orientations near 0 and near 180 describe the same direction
+        first, last = order[0], order[-1]
+        if (angle_ids[first] != angle_ids[last] and
+                theta[first] + 180.0 - theta[last] < angle_threshold):
+            angle_ids[angle_ids == angle_ids[last]] = angle_ids[first]
         
-        return merged
-    
-    def _point_to_line_distance(self, point: Tuple, line: Tuple) -> float:
-        """Calculate perpendicular distance from point to line"""
-        x0, y0 = point
-        x1, y1, x2, y2 = line
+        # Length-weighted mean direction per orientation group (doubled angles wrap at 180)
+        weights = np.maximum(lengths, 1e-9)
+        two_theta = np.radians(2 * theta)
+        n_groups = angle_ids.max() + 1
+        phi = 0.5 * np.arctan2(np.bincount(angle_ids, weights * np.sin(two_theta), n_groups),
+                               np.bincount(angle_ids, weights * np.cos(two_theta), n_groups))
+        ux, uy = np.cos(phi)[angle_ids], np.sin(phi)[angle_ids]
+        
+        # Perpendicular offset of each segment's midpoint from the origin
+        mid = (p0 + p1) / 2
+        offset = mid[:, 0] * -uy + mid[:, 1] * ux
+        order = np.lexsort((offset, angle_ids))
+        offset_ids = np.empty(len(lines), dtype=np.int64)
+        offset_ids[order] = _chain_groups(offset[order], distance_threshold,
+                                          2 * distance_threshold, angle_ids[order])
+        
+        # Extent of each segment along its group direction
+        t0 = p0[:, 0] * ux + p0[:, 1] * uy
+        t1 = p1[:, 0] * ux + p1[:, 1] * uy
+        t_start, t_end = np.minimum(t0, t1), np.maximum(t0, t1)
         
-        num = abs((y2-y1)*x0 - (x2-x1)*y0 + x2*y1 - y2*x1)
-        den = np.sqrt((y2-y1)**2 + (x2-x1)**2)
+        # Overlapping runs within each offset group: a run breaks where a segment
+        # starts beyond the furthest end seen so far (plus the allowed gap)
+        order = np.lexsort((t_start, offset_ids))
+        gid, ts, te = offset_ids[order], t_start[order], t_end[order]
+        span = max(float(te.max() - ts.min()), 1.0) + 4 * distance_threshold
+        shift = gid * span  # keeps the running maximum from leaking across groups
+        reach = np.maximum.accumulate(te + shift)
+        new_run = np.ones(len(order), dtype=bool)
+        new_run[1:] = (gid[1:] != gid[:-1]) | (ts[1:] + shift[1:] > reach[:-1] + distance_threshold)
+        run_ids = np.empty(len(lines), dtype=np.int64)
+        run_ids[order] = np.cumsum(new_run) - 1
         
-        return num / den if den != 0 else float('inf')
+        n_runs = run_ids.max() + 1
+        counts = np.bincount(run_ids, minlength=n_runs)
+        run_start = np.full(n_runs, np.inf)
+        run_end = np.full(n_runs, -np.inf)
+        np.minimum.at(run_start, run_ids, t_start)
+        np.maximum.at(run_end, run_ids, t_end)
+        run_offset = (np.bincount(run_ids, weights * offset, n_runs) /
+                      np.bincount(run_ids, weights, n_runs))
+        run_ux = np.zeros(n_runs)
+        run_uy = np.zeros(n_runs)
+        run_ux[run_ids], run_uy[run_ids] = ux, uy
+        
+        merged = np.column_stack([
+            run_start * run_ux - run_offset * run_uy,
+            run_start * run_uy + run_offset * run_ux,
+            run_end * run_ux - run_offset * run_uy,
+            run_end * run_uy + run_offset * run_ux,
+        ])
+        # Segments that merged with nothing keep their exact endpoints
+        singles = counts[run_ids] == 1
+        merged[run_ids[singles]] = lines[singles]
+        
+        # Preserve the input order of the first member of each run
+        first_member = np.full(n_runs, len(lines))
+        np.minimum.at(first_member, run_ids, np.arange(len(lines)))
+        output_order = np.argsort(first_member, kind='stable')
+        if return_groups:
+            rank = np.empty(n_runs, dtype=np.int64)
+            rank[output_order] = np.arange(n_runs)
+            return merged[output_order].tolist(), rank[run_ids]
+        return merged[output_order].tolist()
     
     def detect_rooms(self, binary_img: np.ndarray) -> List[Room]:
-        """Detect rooms using contour detection"""
-        # Find contours
-        contours, _ = cv2.findContours(
-            binary_img, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
-        )
+        """Detect rooms as the regions enclosed by the wall mask
+        
+        Openings up to room_gap_close wide are closed first so rooms joined
+        by a door separate. With the two-level contour hierarchy every hole
+        in the wall ink is one enclosed region, so the inner and outer
+        outlines of a wall never yield two rooms and the building exterior
+        never yields one. Holes are filtered on area and mean width (too
+        narrow to stand in, like the cavity of a hollow wall) in one
+        vectorized pass; only the survivors are simplified, and polygons
+        with fewer than three corners are discarded.
+        """
+        p = self.params
+        gap = int(round(p['room_gap_close'] / self.scale_factor)) | 1
+        if gap > 1:
+            binary_img = cv2.morphologyEx(binary_img, cv2.MORPH_CLOSE,
+                                          cv2.getStructuringElement(cv2.MORPH_RECT, (gap, gap)))
+        contours, hierarchy = cv2.findContours(binary_img, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return []
+        
+        area, perimeter = _contour_measures(contours)
+        width = 2 * area / np.maximum(perimeter, 1e-9) * self.scale_factor
+        holes = hierarchy[0][:, 3] >= 0
+        keep = (holes &
+                (area > p['room_min_area']) & (area < binary_img.size * p['room_max_area_ratio']) &
+                (width >= p['room_min_width']))
         
         rooms = []
-        for idx, contour in enumerate(contours):
-            area = cv2.contourArea(contour)
+        for idx in np.flatnonzero(keep):
+            # Approximate contour to polygon
+            approx = cv2.approxPolyDP(contours[idx], 0.02 * perimeter[idx], True)
+            if len(approx) < 3:
+                continue
             
-            # Filter small areas (noise) and very large areas (entire image)
-            if area > 1000 and area < binary_img.size * 0.8:
-                # Approximate contour to polygon
-                epsilon = 0.02 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                
-                # Convert to list of corner points in meters
-                corners = [(float(pt[0][0] * self.scale_factor), 
-                           float(pt[0][1] * self.scale_factor)) 
-                          for pt in approx]
-                
-                room = Room(
-                    name=f"Room_{idx}",
-                    corners=corners,
-                    area=float(area * (self.scale_factor ** 2))
-                )
-                rooms.append(room)
+            # Convert to list of corner points in meters
+            corners = [(float(pt[0][0] * self.scale_factor),
+                        float(pt[0][1] * self.scale_factor))
+                       for pt in approx]
+            rooms.append(Room(
+                name=f"Room_{len(rooms)}",
+                corners=corners,
+                area=float(area[idx] * (self.scale_factor ** 2))
+            ))
         
-        self.rooms = rooms
+        self.count('rooms', contours=len(contours), holes=int(holes.sum()), kept=int(keep.sum()),
+                   polygons=len(rooms))
+        return rooms
+    
+    def build_wall_graph(self, walls) -> WallGraph:
+        """Snap wall ends into junctions and split walls at T-junctions and crossings"""
+        return WallGraph(walls, self.params['wall_snap_tolerance'], self.params['wall_gap_bridge'])
+    
+    def rooms_from_graph(self, graph: WallGraph) -> List[Room]:
+        """Rooms as the closed wall cycles of a WallGraph, no image pass needed"""
+        min_area = self.params['room_min_area'] * self.scale_factor ** 2
+        rooms = []
+        for idx, corners in enumerate(graph.faces(min_area, self.params['merge_angle_threshold'])):
+            x, y = corners[:, 0], corners[:, 1]
+            area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+            rooms.append(Room(name=f"Room_{idx}",
+                              corners=[(float(px), float(py)) for px, py in corners],
+                              area=float(area)))
         return rooms
     
-    def create_3d_model(self, floor_height: float = 3.0, 
-                       num_floors: int = 1) -> BIMModel:
+    def create_3d_model(self, walls: List[Wall], rooms: List[Room],
+                       floor_height: float = 3.0, num_floors: int = 1,
+                       doors: List[Door] = None, windows: List[Window] = None) -> BIMModel:
         """Create 3D BIM model from detected walls and rooms"""
         bim_model = BIMModel(
-            walls=self.walls,
-            rooms=self.rooms,
+            walls=walls,
+            rooms=rooms,
+            doors=doors,
+            windows=windows,
             floors=num_floors,
             floor_height=floor_height,
-            metadata={
-                'total_wall_length': round(sum(self._calculate_wall_length(w) for w in self.walls), 2),
-                'total_floor_area': round(sum(r.area for r in self.rooms), 2),
-                'scale_factor': self.scale_factor
-            }
         )
+        bim_model.metadata = {
+            'total_wall_length': round(float(bim_model.walls.lengths().sum()), 2),
+            'total_floor_area': round(float(bim_model.rooms.areas.sum()), 2),
+            'scale_factor': self.scale_factor
+        }
         return bim_model
     
-    def _calculate_wall_length(self, wall: Wall) -> float:
-        """Calculate wall length in meters"""
-        x1, y1 = wall.start_point
-        x2, y2 = wall.end_point
-        return np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-    
     def visualize_3d(self, bim_model: BIMModel, save_path: str = None):
-        """Visualize the 3D BIM model"""
+        """Visualize the 3D BIM model with matplotlib
+        
+        Only shows a window when no save_path is given. matplotlib is imported
+        here so the CLI and workers never pay for it; see save_previews for
+        headless rendering.
+        """
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+        
         fig = plt.figure(figsize=(15, 10))
         ax = fig.add_subplot(111, projection='3d')
         
-        # Draw walls
-        for wall in bim_model.walls:
-            self._draw_wall_3d(ax, wall, bim_model.floor_height)
-        
-        # Draw floors
-        self._draw_floors_3d(ax, bim_model)
+        # Draw walls and floor slabs as one collection each from the shared mesh
+        mesh = self.build_mesh(bim_model)
+        triangles = mesh.positions[mesh.indices][:, :, [0, 2, 1]]  # back to plan x, y, height
+        walls_end = mesh.groups['walls'][1]
+        ax.add_collection3d(Poly3DCollection(triangles[:walls_end], alpha=0.7, facecolor='lightgray',
+                                             edgecolor='black', linewidths=0.2))
+        ax.add_collection3d(Poly3DCollection(triangles[walls_end:], alpha=0.3, facecolor='tan',
+                                             edgecolor='brown', linewidths=0.2))
         
         # Set labels and limits
         ax.set_xlabel('X (meters)')
@@ -277,10 +1837,8 @@ class BlueprintTo3DBIM:
         ax.set_title('3D BIM Model - Building View')
         
         # Set aspect ratio
-        if bim_model.walls:
-            max_range = max([
-                max(w.start_point[0], w.end_point[0]) for w in bim_model.walls
-            ] + [max(w.start_point[1], w.end_point[1]) for w in bim_model.walls])
+        if len(bim_model.walls):
+            max_range = float(bim_model.walls.coords.max())
         else:
             max_range = 10
         
@@ -291,189 +1849,719 @@ class BlueprintTo3DBIM:
         if save_path:
             plt.savefig(save_path, dpi=300, bbox_inches='tight')
             print(f"3D visualization saved to {save_path}")
+            plt.close(fig)
+        else:
+            plt.show()
+    
+    def _fit_transform(self, points: np.ndarray, size: int, margin: int = 16) -> Tuple[np.ndarray, float]:
+        """Offset and scale mapping 2D points into a size x size image"""
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        scale = (size - 2 * margin) / max(float((hi - lo).max()), 1e-6)
+        offset = margin + ((size - 2 * margin) - (hi - lo) * scale) / 2 - lo * scale
+        return offset, scale
+    
+    def render_plan(self, bim_model: BIMModel, size: int = 512) -> np.ndarray:
+        """Top-down raster preview: room fills, walls, door and window marks"""
+        image = np.full((size, size, 3), 255, dtype=np.uint8)
+        walls, rooms = bim_model.walls, bim_model.rooms
+        points = np.concatenate([walls.coords.reshape(-1, 2), rooms.vertices])
+        if not len(points):
+            return image
+        offset, scale = self._fit_transform(points, size)
         
-        plt.show()
+        def px(xy):
+            return np.round(np.asarray(xy) * scale + offset).astype(np.int32)
+        
+        room_colors = [(230, 216, 173), (193, 230, 193), (180, 222, 245), (221, 200, 230)]
+        vertices = px(rooms.vertices)
+        for i, count in enumerate(rooms.corner_counts()):
+            if count >= 3:
+                cv2.fillPoly(image, [vertices[rooms.offsets[i]:rooms.offsets[i + 1]]],
+                             room_colors[i % len(room_colors)], cv2.LINE_AA)
+        ends = px(walls.coords.reshape(-1, 2)).reshape(-1, 4)
+        for (x1, y1, x2, y2), thickness in zip(ends.tolist(), walls.thickness.tolist()):
+            cv2.line(image, (x1, y1), (x2, y2), (40, 40, 40),
+                     max(1, int(round(thickness * scale))), cv2.LINE_AA)
+        for table, color in ((bim_model.doors, (0, 120, 255)), (bim_model.windows, (255, 140, 0))):
+            if table is None:
+                continue
+            for (x, y), width in zip(px(table.positions).tolist(), table.widths.tolist()):
+                cv2.circle(image, (x, y), max(2, int(width * scale / 2)), color, 1, cv2.LINE_AA)
+        return image
     
-    def _draw_wall_3d(self, ax: Axes3D, wall: Wall, height: float):
-        """Draw a single wall in 3D"""
-        x1, y1 = wall.start_point
-        x2, y2 = wall.end_point
-        t = wall.thickness / 2
+    def render_axonometric(self, bim_model: BIMModel, size: int = 512) -> np.ndarray:
+        """Shaded axonometric thumbnail of the mesh, painter's algorithm with back-face culling"""
+        image = np.full((size, size, 3), 255, dtype=np.uint8)
+        mesh = self.build_mesh(bim_model)
+        if not len(mesh.indices):
+            return image
         
-        # Calculate perpendicular direction for wall thickness
-        length = np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-        if length == 0:
-            return
-            
-        dx = -(y2 - y1) / length * t
-        dy = (x2 - x1) / length * t
-        
-        # Define 8 vertices of the wall (rectangular prism)
-        vertices = [
-            [x1 + dx, y1 + dy, 0],
-            [x2 + dx, y2 + dy, 0],
-            [x2 - dx, y2 - dy, 0],
-            [x1 - dx, y1 - dy, 0],
-            [x1 + dx, y1 + dy, height],
-            [x2 + dx, y2 + dy, height],
-            [x2 - dx, y2 - dy, height],
-            [x1 - dx, y1 - dy, height],
-        ]
-        
-        # Define the 6 faces of the wall
-        faces = [
-            [vertices[0], vertices[1], vertices[5], vertices[4]],  # Front
-            [vertices[2], vertices[3], vertices[7], vertices[6]],  # Back
-            [vertices[0], vertices[3], vertices[7], vertices[4]],  # Left
-            [vertices[1], vertices[2], vertices[6], vertices[5]],  # Right
-            [vertices[0], vertices[1], vertices[2], vertices[3]],  # Bottom
-            [vertices[4], vertices[5], vertices[6], vertices[7]],  # Top
-        ]
-        
-        # Create 3D polygon collection
-        poly = Poly3DCollection(faces, alpha=0.7, facecolor='lightgray', 
-                               edgecolor='black', linewidths=0.5)
-        ax.add_collection3d(poly)
-    
-    def _draw_floors_3d(self, ax: Axes3D, bim_model: BIMModel):
-        """Draw floor slabs"""
-        if not bim_model.rooms:
-            return
-            
-        for floor_num in range(bim_model.floors + 1):
-            z = floor_num * bim_model.floor_height
-            
-            for room in bim_model.rooms:
-                if len(room.corners) < 3:
-                    continue
-                    
-                # Create floor polygon
-                vertices = [[x, y, z] for x, y in room.corners]
-                floor_poly = [vertices]
-                
-                poly = Poly3DCollection(floor_poly, alpha=0.3, 
-                                       facecolor='tan' if floor_num % 2 == 0 else 'wheat',
-                                       edgecolor='brown', linewidths=0.5)
-                ax.add_collection3d(poly)
+        # Isometric view from (+x, +up, +plan y): screen x along x - z, screen y down
+        x, y, z = mesh.positions.T
+        screen = np.column_stack([(x - z) * np.cos(np.pi / 6), (x + z) * np.sin(np.pi / 6) - y])
+        offset, scale = self._fit_transform(screen, size)
+        screen = np.round(screen * scale + offset).astype(np.int32)
+        
+        view = np.array([1.0, 1.0, 1.0]) / np.sqrt(3)
+        light = np.array([0.4, 0.8, 0.2]) / np.linalg.norm([0.4, 0.8, 0.2])
+        normals = mesh.normals[mesh.indices[:, 0]]
+        is_wall = np.arange(len(mesh.indices)) < mesh.groups['walls'][1]
+        visible = ~is_wall | (normals @ view > 0)
+        depth = mesh.positions[mesh.indices].sum(axis=(1, 2))
+        shade = 0.45 + 0.55 * np.abs(normals @ light)
+        base = np.where(is_wall[:, None], [[205, 205, 205]], [[140, 180, 210]])
+        colors = np.clip(base * shade[:, None], 0, 255).astype(np.uint8).tolist()
+        
+        triangles = screen[mesh.indices]
+        for i in np.flatnonzero(visible)[np.argsort(depth[visible], kind='stable')]:
+            cv2.fillConvexPoly(image, triangles[i], colors[i], cv2.LINE_AA)
+        return image
+    
+    def save_previews(self, bim_model: BIMModel, output_path: str, size: int = 512,
+                      cache: 'ConversionCache' = None, key: str = None) -> Dict[str, str]:
+        """Write <output>.plan.png and <output>.axo.png next to a result file
+        
+        With a cache and key, encoded previews are stored alongside the cached
+        result and reused instead of being rendered again.
+        """
+        stem = os.path.splitext(output_path)[0]
+        paths = {}
+        for name, suffix, render in (('plan', 'plan.png', self.render_plan),
+                                     ('axonometric', 'axo.png', self.render_axonometric)):
+            data = cache.get_blob(key, suffix) if cache is not None and key else None
+            if data is None:
+                data = cv2.imencode('.png', render(bim_model, size))[1].tobytes()
+                if cache is not None and key:
+                    cache.put_blob(key, suffix, data)
+            paths[name] = f"{stem}.{suffix}"
+            with open(paths[name], 'wb') as f:
+                f.write(data)
+        return paths
+    
+    def to_json(self, bim_model: BIMModel) -> str:
+        """Serialize BIM model to the JSON text written by export_to_json"""
+        return json.dumps(bim_model.to_dict(), indent=2)
     
     def export_to_json(self, bim_model: BIMModel, output_path: str):
         """Export BIM model to JSON format"""
-        data = asdict(bim_model)
+        with open(output_path, 'w') as f:
+            f.write(self.to_json(bim_model))
+        
+        print(f"BIM model exported to {output_path}")
+    
+    def write_json_stream(self, bim_model: BIMModel, f, precision: int = None):
+        """Write the model as compact JSON to a text file, one record at a time
+        
+        Produces the same structure as to_json without indentation or an
+        intermediate copy of the model; floats are rounded to precision
+        decimals when it is given.
+        """
+        def dumps(value):
+            return json.dumps(value, separators=(',', ':'))
+        
+        sections = [('walls', bim_model.walls), ('rooms', bim_model.rooms),
+                    ('doors', bim_model.doors), ('windows', bim_model.windows)]
+        f.write('{')
+        for name, table in sections:
+            if table is None:
+                f.write(f'"{name}":null,')
+                continue
+            f.write(f'"{name}":[')
+            records = table.iter_records(precision)
+            separator = ''
+            # Encode a batch of records per call, the C encoder does the heavy lifting
+            while True:
+                batch = list(islice(records, 1024))
+                if not batch:
+                    break
+                f.write(separator + dumps(batch)[1:-1])
+                separator = ','
+            f.write('],')
+        f.write(f'"floors":{dumps(bim_model.floors)},"floor_height":{dumps(bim_model.floor_height)},'
+                f'"metadata":{dumps(bim_model.metadata)}}}')
+    
+    def export_to_npz(self, bim_model: BIMModel, output_path):
+        """Export the model as an uncompressed .npz of typed columns
+        
+        output_path may also be a writable binary file object.
+        Coordinates are float32 and indices int32. Room names, floors,
+        floor_height and metadata go in 'header', UTF-8 JSON stored as uint8.
+        Entries are stored rather than deflated so readers can slice them
+        straight out of the file.
+        """
+        walls, rooms = bim_model.walls, bim_model.rooms
+        header = {'floors': bim_model.floors, 'floor_height': bim_model.floor_height,
+                  'metadata': bim_model.metadata, 'room_names': rooms.names,
+                  'has_doors': bim_model.doors is not None,
+                  'has_windows': bim_model.windows is not None}
+        arrays = {
+            'header': np.frombuffer(json.dumps(header, separators=(',', ':')).encode(), dtype=np.uint8),
+            'wall_coords': walls.coords.astype(np.float32),
+            'wall_thickness': walls.thickness.astype(np.float32),
+            'wall_height': walls.height.astype(np.float32),
+            'room_vertices': rooms.vertices.astype(np.float32),
+            'room_offsets': rooms.offsets.astype(np.int32),
+            'room_areas': rooms.areas.astype(np.float32),
+        }
+        for prefix, table in (('door', bim_model.doors), ('window', bim_model.windows)):
+            table = table if table is not None else OpeningTable(Door if prefix == 'door' else Window)
+            arrays[f'{prefix}_positions'] = table.positions.astype(np.float32)
+            arrays[f'{prefix}_widths'] = table.widths.astype(np.float32)
+            arrays[f'{prefix}_wall_index'] = table.wall_index.astype(np.int32)
+            if table.heights is not None:
+                arrays[f'{prefix}_heights'] = table.heights.astype(np.float32)
+        if hasattr(output_path, 'write'):
+            np.savez(output_path, **arrays)
+            return
+        with open(output_path, 'wb') as f:
+            np.savez(f, **arrays)
+    
+    def serialize(self, bim_model: BIMModel, output_format: str = 'json',
+                  precision: int = None) -> bytes:
+        """Encode the model in one of EXPORT_FORMATS in memory, as export would write it"""
+        if output_format == 'json':
+            return self.to_json(bim_model).encode()
+        if output_format == 'json-stream':
+            text = io.StringIO()
+            self.write_json_stream(bim_model, text, precision)
+            return text.getvalue().encode()
+        if output_format == 'npz':
+            data = io.BytesIO()
+            self.export_to_npz(bim_model, data)
+            return data.getvalue()
+        raise ValueError(f"Unknown output format: {output_format} "
+                         f"(expected one of {', '.join(EXPORT_FORMATS)})")
+    
+    def export(self, bim_model: BIMModel, output_path: str, output_format: str = 'json',
+               precision: int = None) -> Dict:
+        """Export in one of EXPORT_FORMATS and report size and serialization time
+        
+        precision only applies to 'json-stream'.
+        """
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format} "
+                             f"(expected one of {', '.join(EXPORT_FORMATS)})")
+        start = time.perf_counter()
+        if output_format == 'json':
+            with open(output_path, 'w') as f:
+                f.write(self.to_json(bim_model))
+        elif output_format == 'json-stream':
+            with open(output_path, 'w') as f:
+                self.write_json_stream(bim_model, f, precision)
+        else:
+            self.export_to_npz(bim_model, output_path)
+        report = {'format': output_format, 'bytes': os.path.getsize(output_path),
+                  'ms': round((time.perf_counter() - start) * 1000, 2)}
+        print(f"BIM model exported to {output_path} "
+              f"({report['format']}, {report['bytes']} bytes, {report['ms']} ms)")
+        return report
+    
+    def _assign_openings(self, bim_model: BIMModel, max_distance: float = 0.5) -> List[Tuple]:
+        """Place doors and windows on walls as (wall, t0, t1, kind, height) intervals
+        
+        t0/t1 are distances along the wall from its start point. Openings
+        keep their wall_index; the others go to the nearest wall within
+        max_distance plus half the thickest wall, or are dropped.
+        """
+        walls = bim_model.walls
+        if not len(walls):
+            return []
+        p1, d = walls.coords[:, :2], walls.coords[:, 2:] - walls.coords[:, :2]
+        lengths = np.maximum(walls.lengths(), 1e-9)
+        index = WallIndex(walls, max_distance + float(walls.thickness.max()) / 2)
+        
+        intervals = []
+        for kind, table in (('door', bim_model.doors), ('window', bim_model.windows)):
+            if table is None or not len(table):
+                continue
+            hosts = table.wall_index.copy()
+            unassigned = hosts < 0
+            hosts[unassigned] = index.nearest(table.positions[unassigned])[0]
+            ok = np.flatnonzero((hosts >= 0) & (hosts < len(walls)))
+            hosts = hosts[ok]
+            # Centre of the opening along its host wall, from the projection of its position
+            r = table.positions[ok] - p1[hosts]
+            centre = np.clip((r * d[hosts]).sum(axis=1) / lengths[hosts], 0, lengths[hosts])
+            half = table.widths[ok] / 2
+            heights = table.heights[ok] if kind == 'window' else np.zeros(len(ok))
+            for wall, c, h, height in zip(hosts.tolist(), centre.tolist(), half.tolist(), heights.tolist()):
+                intervals.append((wall, c - h, c + h, kind, height if kind == 'window' else None))
+        return intervals
+    
+    def build_mesh(self, bim_model: BIMModel, door_height: float = 2.1,
+                   sill_height: float = 0.9) -> Mesh:
+        """Extrude all walls and triangulate all floor slabs into one Mesh
+        
+        Doors and windows cut openings in their walls: a wall becomes solid
+        pieces between openings plus a lintel above each opening and a sill
+        below each window. Walls and slabs are repeated for every floor.
+        """
+        walls = bim_model.walls
+        lengths = walls.lengths()
+        keep = lengths > 1e-6
+        
+        # One (wall, t0, t1, z0, z1) row per box; walls without openings in one go
+        cuts = {}
+        for wall, t0, t1, kind, window_height in self._assign_openings(bim_model):
+            if keep[wall]:
+                z0, z1 = (0.0, door_height) if kind == 'door' else \
+                    (sill_height, sill_height + window_height)
+                cuts.setdefault(wall, []).append((t0, t1, z0, z1))
+        solid = np.flatnonzero(keep & ~np.isin(np.arange(len(walls)), list(cuts)))
+        rows = [np.column_stack([solid, np.zeros(len(solid)), lengths[solid],
+                                 np.zeros(len(solid)), walls.height[solid]])]
+        for wall, openings in cuts.items():
+            length, height = lengths[wall], walls.height[wall]
+            cursor = 0.0
+            for t0, t1, z0, z1 in sorted(openings):
+                t0, t1 = max(t0, cursor), min(t1, length)
+                if t1 <= t0:
+                    continue
+                rows.append([[wall, cursor, t0, 0.0, height]])
+                if z1 < height:
+                    rows.append([[wall, t0, t1, z1, height]])
+                if z0 > 0:
+                    rows.append([[wall, t0, t1, 0.0, min(z0, height)]])
+                cursor = t1
+            rows.append([[wall, cursor, length, 0.0, height]])
+        boxes = np.concatenate([np.asarray(r, dtype=np.float64).reshape(-1, 5) for r in rows])
+        boxes = boxes[boxes[:, 2] - boxes[:, 1] > 1e-6]
+        
+        # Repeat every box per floor and extrude them all at once
+        levels = np.arange(bim_model.floors) * bim_model.floor_height
+        boxes = np.tile(boxes, (len(levels), 1))
+        z_offset = np.repeat(levels, len(boxes) // max(1, len(levels)))
+        wall = boxes[:, 0].astype(np.int64)
+        start = walls.coords[wall, :2]
+        direction = (walls.coords[wall, 2:] - start) / np.maximum(lengths[wall], 1e-9)[:, None]
+        positions, normals, indices = _extrude_boxes(
+            start + direction * boxes[:, 1:2], start + direction * boxes[:, 2:3],
+            boxes[:, 3] + z_offset, boxes[:, 4] + z_offset, walls.thickness[wall] / 2)
         
-        with open(output_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Floor slabs at every level, including the roof
+        rooms = bim_model.rooms
+        slab_triangles = []
+        for i, count in enumerate(rooms.corner_counts()):
+            if count >= 3:
+                slab_triangles.append(_triangulate_polygon(rooms.vertices[rooms.offsets[i]:rooms.offsets[i + 1]])
+                                      + rooms.offsets[i])
+        slab_triangles = np.concatenate(slab_triangles) if slab_triangles else np.empty((0, 3), np.int64)
+        slab_levels = np.arange(bim_model.floors + 1) * bim_model.floor_height
+        n_vertices = len(rooms.vertices)
+        floor_positions = np.concatenate([
+            np.column_stack([rooms.vertices[:, 0], np.full(n_vertices, z), rooms.vertices[:, 1]])
+            for z in slab_levels])
+        floor_indices = np.concatenate([slab_triangles + k * n_vertices for k in range(len(slab_levels))])
         
-        print(f"BIM model exported to {output_path}")
+        all_positions = np.concatenate([positions, floor_positions])
+        all_normals = np.concatenate([normals, np.tile([0.0, 1.0, 0.0], (len(floor_positions), 1))])
+        all_indices = np.concatenate([indices, floor_indices + len(positions)])
+        
+        # Counter-clockwise winding seen from the side the normal points to
+        tri = all_positions[all_indices]
+        facing = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        flip = (facing * all_normals[all_indices[:, 0]]).sum(axis=1) < 0
+        all_indices[flip] = all_indices[flip][:, [0, 2, 1]]
+        
+        return Mesh(positions=all_positions, normals=all_normals, indices=all_indices,
+                    groups={'walls': (0, len(indices)), 'floors': (len(indices), len(floor_indices))})
+    
+    def export_mesh(self, bim_model: BIMModel, output_path: str) -> Dict:
+        """Write the model mesh as binary glTF (.glb) or OBJ (.obj), chosen by extension"""
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension not in ('.glb', '.obj'):
+            raise ValueError(f"Unknown mesh format: {output_path} (expected .glb or .obj)")
+        start = time.perf_counter()
+        mesh = self.build_mesh(bim_model)
+        if extension == '.glb':
+            mesh.to_glb(output_path)
+        else:
+            mesh.to_obj(output_path)
+        report = {'format': extension[1:], 'bytes': os.path.getsize(output_path),
+                  'triangles': len(mesh.indices),
+                  'ms': round((time.perf_counter() - start) * 1000, 2)}
+        print(f"Mesh exported to {output_path} ({report['triangles']} triangles, "
+              f"{report['bytes']} bytes, {report['ms']} ms)")
+        return report
 
 
 class AdvancedBlueprintProcessor(BlueprintTo3DBIM):
     """Advanced blueprint processing with additional BIM elements"""
     
-    def __init__(self, scale_factor: float = 0.05):
-        super().__init__(scale_factor)
-        self.doors = []
-        self.windows = []
+    def __init__(self, scale_factor: float = 0.05, params: Dict = None):
+        super().__init__(scale_factor, params)
+    
+    def instrument(self, enabled: bool = True):
+        """Switch per-stage instrumentation on or off
+        
+        While on, detectors add their candidate counts (raw Hough lines,
+        template peaks, contours before and after filtering, ...) to
+        counters and BlueprintPipeline records wall time, CPU time and peak
+        RSS of every stage in its stats.
+        """
+        self.counters = {} if enabled else None
         
     def load_and_enhance(self, image_path: str) -> np.ndarray:
         """Load blueprint and apply enhancement techniques"""
-        img = self.load_blueprint(image_path)
+        return self.enhance(self.load_blueprint(image_path))
+    
+    def enhance_gray(self, gray: np.ndarray) -> np.ndarray:
+        """Grayscale contrast enhancement for the cheaper profiles
         
+        'clahe_gray' applies CLAHE straight to the gray image instead of the
+        LAB round-trip done by enhance(); 'none' returns the input.
+        """
+        method = self.params['enhance_method']
+        if method == 'clahe_gray':
+            grid = self.params['clahe_grid']
+            clahe = cv2.createCLAHE(clipLimit=self.params['clahe_clip_limit'],
+                                    tileGridSize=(grid, grid))
+            return clahe.apply(gray)
+        if method in ('none', 'clahe_lab'):
+            return gray
+        raise ValueError(f"Unknown enhance_method: {method}")
+    
+    def enhance(self, img: np.ndarray) -> np.ndarray:
+        """Apply contrast enhancement to a decoded blueprint"""
         # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
         lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
         l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        grid = self.params['clahe_grid']
+        clahe = cv2.createCLAHE(clipLimit=self.params['clahe_clip_limit'], tileGridSize=(grid, grid))
         l = clahe.apply(l)
         enhanced = cv2.merge([l, a, b])
         enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
         
         return enhanced
     
-    def detect_text_annotations(self, img: np.ndarray) -> List[Dict]:
-        """Detect and extract text annotations from blueprint"""
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    def detect_text_annotations(self, img: np.ndarray, gray: np.ndarray = None,
+                                binary: np.ndarray = None, rooms=None) -> List[Dict]:
+        """Detect and extract text annotations from blueprint
+        
+        Given rooms, MSER only runs on the windows text_windows finds inside
+        them, so the cost follows the annotated area instead of the sheet,
+        and every region gets the index of the room it lies in ('room', -1
+        for none). Without rooms the whole sheet is scanned.
+        """
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        room_ids = None
+        if rooms is None:
+            windows = [(0, 0, gray.shape[1], gray.shape[0])]
+        else:
+            windows, room_ids = self.text_windows(gray, binary, rooms)
+            factor = max(1, int(self.params['text_downscale']))
         
         # Use MSER (Maximally Stable Extremal Regions) for text detection
         mser = cv2.MSER_create()
-        regions, _ = mser.detectRegions(gray)
-        
         text_regions = []
-        for region in regions:
-            x, y, w, h = cv2.boundingRect(region.reshape(-1, 1, 2))
-            
-            # Filter by aspect ratio and size (typical for text)
-            aspect_ratio = w / float(h) if h > 0 else 0
-            if 0.2 < aspect_ratio < 5 and 10 < w < 200 and 10 < h < 100:
-                text_regions.append({
-                    'bbox': (int(x), int(y), int(w), int(h)),
-                    'position': (float(x * self.scale_factor), float(y * self.scale_factor))
-                })
+        seen = set()
+        mser_regions = 0
+        for x0, y0, x1, y1 in windows:
+            regions, _ = mser.detectRegions(np.ascontiguousarray(gray[y0:y1, x0:x1]))
+            mser_regions += len(regions)
+            for region in regions:
+                x, y, w, h = cv2.boundingRect(region.reshape(-1, 1, 2))
+                x, y = x + x0, y + y0
+                
+                # Filter by aspect ratio and size (typical for text)
+                aspect_ratio = w / float(h) if h > 0 else 0
+                if 0.2 < aspect_ratio < 5 and 10 < w < 200 and 10 < h < 100 and (x, y, w, h) not in seen:
+                    seen.add((x, y, w, h))
+                    text_region = {
+                        'bbox': (int(x), int(y), int(w), int(h)),
+                        'position': (float(x * self.scale_factor), float(y * self.scale_factor))
+                    }
+                    if room_ids is not None:
+                        row = min((y + h // 2) // factor, room_ids.shape[0] - 1)
+                        col = min((x + w // 2) // factor, room_ids.shape[1] - 1)
+                        text_region['room'] = int(room_ids[row, col]) - 1
+                    text_regions.append(text_region)
         
+        self.count('text', windows=len(windows),
+                   scanned_px=int(sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows)),
+                   mser_regions=mser_regions, kept=len(text_regions))
         return text_regions
     
-    def detect_doors(self, binary_img: np.ndarray, walls: List) -> List[Door]:
-        """Detect door symbols in blueprint"""
+    def text_windows(self, gray: np.ndarray, binary: np.ndarray,
+                     rooms) -> Tuple[List[Tuple[int, int, int, int]], np.ndarray]:
+        """Windows (x0, y0, x1, y1) around the annotations inside rooms, and a room-id raster
+        
+        Rooms are rasterized as ids (index + 1, 0 outside) at 1/text_downscale
+        resolution. Ink inside them is split into connected marks; marks no
+        larger than a text region (wall pieces the room outline cuts off are
+        longer) are padded by text_window_pad and the clusters they form
+        become the windows, in full-resolution pixels. The raster is also the
+        spatial lookup that joins text regions to rooms.
+        """
+        factor = max(1, int(self.params['text_downscale']))
+        pad = int(self.params['text_window_pad'])
+        height, width = gray.shape[:2]
+        size = (-(-width // factor), -(-height // factor))
+        
+        room_ids = np.zeros((size[1], size[0]), dtype=np.int32)
+        table = RoomTable.from_rooms(rooms)
+        # Larger rooms first so a room nested in another keeps its own id
+        for i in np.argsort(-table.areas, kind='stable'):
+            corners = table.vertices[table.offsets[i]:table.offsets[i + 1]]
+            if len(corners) >= 3:
+                points = np.round(corners / (self.scale_factor * factor)).astype(np.int32)
+                cv2.fillPoly(room_ids, [points], int(i) + 1)
+        
+        if binary is None:
+            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        ink = (cv2.resize(binary, size, interpolation=cv2.INTER_AREA) > 0) & (room_ids > 0)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(ink.astype(np.uint8), connectivity=8)
+        longest = np.maximum(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT])
+        marks = (longest <= -(-200 // factor)) & (longest >= 10 // factor)
+        marks[0] = False
+        self.count('text', marks=int(marks.sum()))
+        if not marks.any():
+            return [], room_ids
+        
+        clusters = cv2.dilate(marks[labels].astype(np.uint8), np.ones((2 * pad + 1, 2 * pad + 1), np.uint8))
+        _, _, stats, _ = cv2.connectedComponentsWithStats(clusters, connectivity=8)
+        x0, y0 = stats[1:, cv2.CC_STAT_LEFT] * factor, stats[1:, cv2.CC_STAT_TOP] * factor
+        x1 = np.minimum(x0 + stats[1:, cv2.CC_STAT_WIDTH] * factor, width)
+        y1 = np.minimum(y0 + stats[1:, cv2.CC_STAT_HEIGHT] * factor, height)
+        return list(zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())), room_ids
+    
+    def label_rooms(self, rooms: RoomTable, text_regions: List[Dict], gray: np.ndarray = None) -> List[Dict]:
+        """Join text regions to their rooms, one label per annotated room
+        
+        The regions detect_text_annotations tagged with a room are united
+        into one label box per room. With pytesseract installed and gray
+        given, the label is read and the room renamed after it (suffixed
+        when another room already has that name); otherwise 'text' is None
+        and rooms keep their names.
+        """
+        boxes, counts = {}, {}
+        for region in text_regions:
+            room = region.get('room', -1)
+            if room < 0 or room >= len(rooms):
+                continue
+            x, y, w, h = region['bbox']
+            box = boxes.get(room, (x, y, x + w, y + h))
+            boxes[room] = (min(box[0], x), min(box[1], y), max(box[2], x + w), max(box[3], y + h))
+            counts[room] = counts.get(room, 0) + 1
+        
+        names = set(rooms.names)
+        labels = []
+        for room in sorted(boxes):
+            x0, y0, x1, y1 = boxes[room]
+            text = _recognize_text(gray[y0:y1, x0:x1]) if gray is not None else None
+            if text:
+                name, serial = text, 2
+                while name in names:
+                    name, serial = f"{text} {serial}", serial + 1
+                names.add(name)
+                rooms.names[room] = name
+            labels.append({
+                'room': rooms.names[room],
+                'bbox': [int(x0), int(y0), int(x1 - x0), int(y1 - y0)],
+                'position': [float(x0 * self.scale_factor), float(y0 * self.scale_factor)],
+                'regions': counts[room],
+                'text': text,
+            })
+        self.count('labels', rooms=len(labels), read=sum(label['text'] is not None for label in labels))
+        return labels
+    
+    def attach_to_walls(self, openings: List, walls) -> List:
+        """Set each door or window's wall_index to its host wall, dropping orphans
+        
+        The host is the nearest wall within opening_wall_tolerance meters.
+        walls may be a list, a WallTable or a prebuilt WallIndex.
+        """
+        if not openings:
+            return openings
+        index = walls if isinstance(walls, WallIndex) else \
+            WallIndex(walls, self.params['opening_wall_tolerance'])
+        hosts, _ = index.nearest([opening.position for opening in openings])
+        kept = []
+        for opening, host in zip(openings, hosts.tolist()):
+            if host >= 0:
+                opening.wall_index = host
+                kept.append(opening)
+        return kept
+    
+    def detect_doors(self, ink_img: np.ndarray, walls: List) -> List[Door]:
+        """Detect door symbols in blueprint
+        
+        ink_img is the thresholded sheet before the opening that cleans the
+        wall mask (see binarize), so one-pixel swing arcs survive; specks
+        smaller than the shortest swing are dropped. Door kernels (see
+        DoorKernelBank) score the swing strokes on the ink dilated by
+        door_stroke_tolerance pixels, minus the ink inside the swept area and
+        just beyond the arc, so wall ink around a door costs nothing while a
+        room corner or hatching does. An arc-only bank for door_orientations
+        swings, whose radii span door_radii_m, runs on a pooled copy where
+        the smallest door is about 6 pixels; its peaks are re-scored at full
+        resolution with the leaf on either side (see _refine_door_match). A
+        score of 1 is a fully drawn swing over empty floor. Each door is
+        reported at its hinge, with the matched radius as its width, and
+        attached to its host wall (see attach_to_walls); pass walls=None to
+        skip that.
+        """
         doors = []
+        p = self.params
+        r_min = max(4, int(round(min(p['door_radii_m']) / self.scale_factor)))
+        r_max = max(r_min, int(round(max(p['door_radii_m']) / self.scale_factor)))
+        orientations = p['door_orientations']
+        threshold = p['door_match_threshold']
+        min_distance = p['door_min_distance']
+        factor = max(1, r_min // 6)
+        
+        # Specks can't be a swing, but pooled they cover a small coarse arc
+        _, labels, stats, _ = cv2.connectedComponentsWithStats((ink_img > 0).astype(np.uint8), connectivity=8)
+        ink = ((stats[:, cv2.CC_STAT_AREA] >= r_min)[labels] & (labels > 0)).astype(np.float32)
         
-        # Create a kernel for door arc detection
-        kernel_size = 20
-        door_kernel = self._create_arc_kernel(kernel_size)
+        # Dilated ink tolerates strokes drawn off the kernel's one-pixel lines
+        tolerance = p['door_stroke_tolerance']
+        strokes = ink
+        if tolerance > 0:
+            strokes = cv2.dilate(ink, cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
+                                                                (2 * tolerance + 1, 2 * tolerance + 1)))
         
-        # Template matching for door arcs
-        result = cv2.matchTemplate(binary_img, door_kernel, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.6
-        locations = np.where(result >= threshold)
+        # The coarse copy keeps a block's strokes if any pixel in it is inked,
+        # plus one block of slack so its radii can step by two, and the
+        # fraction of ink that should be empty
+        h, w = ink.shape[0] // factor, ink.shape[1] // factor
+        coarse_strokes = cv2.dilate(strokes, np.ones((factor, factor), np.uint8),
+                                    anchor=(0, 0))[:h * factor:factor, :w * factor:factor]
+        coarse_strokes = cv2.dilate(coarse_strokes, np.ones((3, 3), np.uint8))
+        coarse_ink = cv2.resize(ink[:h * factor, :w * factor], (w, h), interpolation=cv2.INTER_AREA)
+        coarse_radii = tuple(range(r_min // factor, -(-r_max // factor) + 1, 2))
+        coarse_bank = DoorKernelBank.get(coarse_radii, orientations, leaves=False)
+        result, best_kernel = coarse_bank.match(coarse_strokes, coarse_ink)
         
-        for pt in zip(*locations[::-1]):
-            x, y = pt
+        # Only local maxima of the score map become candidates, strongest first.
+        # Pooled strokes are only easier to cover, so a door passing at full
+        # resolution passes here too.
+        xs, ys, _ = self._find_score_peaks(result, threshold, min_distance / self.scale_factor / factor)
+        self.count('doors', template_peaks=len(xs))
+        
+        # The coarse copy pins the middle of an arc better than its hinge: a
+        # smaller arc whose hinge slides out along the swing's bisector scores
+        # nearly as well. Refinement walks the hinge back from the middle over
+        # the radii from the coarse one up, every other radius first, then
+        # the neighbours of the best.
+        fine_bank = DoorKernelBank.get(tuple(range(r_min, r_max + 1)), orientations)
+        min_distance_px = min_distance / self.scale_factor
+        hinges = []
+        for x, y in zip(xs, ys):
+            # A weaker peak this close to a found door would only be deduplicated below
+            if any(np.hypot(x * factor - hx, y * factor - hy) < min_distance_px for hx, hy in hinges):
+                continue
+            radius, angle, _ = coarse_bank.entries[int(best_kernel[y, x])]
+            bisector = np.deg2rad(angle + 45)
+            direction = np.array([np.cos(bisector), np.sin(bisector)])
+            middle = (np.array([x, y]) + direction * radius) * factor
+            radii = range(r_max, max(r_min, factor * (radius - 1)) - 1, -2)
+            x, y, score, radius = self._refine_door_match(
+                strokes, ink, fine_bank, angle, middle, direction, radii, factor)
+            middle = np.array([x, y]) + direction * radius
+            radii = range(min(r_max, radius + 1), max(r_min, radius - 1) - 1, -1)
+            x, y, score, radius = self._refine_door_match(
+                strokes, ink, fine_bank, angle, middle, direction, radii, 1)
+            if score < threshold:
+                continue
+            hinges.append((x, y))
             door = Door(
                 position=(float(x * self.scale_factor), float(y * self.scale_factor)),
-                width=0.9
+                width=float(radius * self.scale_factor)
             )
             doors.append(door)
         
-        self.doors = self._remove_duplicate_doors(doors)
-        return self.doors
+        matched = len(doors)
+        doors = self._remove_duplicate_doors(doors, min_distance)
+        deduplicated = len(doors)
+        if walls is not None:
+            doors = self.attach_to_walls(doors, walls)
+        self.count('doors', matched=matched, deduplicated=deduplicated, kept=len(doors))
+        # Report in raster order, like a scan of the sheet
+        return sorted(doors, key=lambda door: (door.position[1], door.position[0]))
     
-    def _create_arc_kernel(self, size: int) -> np.ndarray:
-        """Create a kernel representing a door arc"""
-        kernel = np.zeros((size, size), dtype=np.uint8)
-        center = size // 2
-        radius = size // 2 - 2
+    def _refine_door_match(self, strokes: np.ndarray, ink: np.ndarray, bank: DoorKernelBank,
+                           angle: float, middle: np.ndarray, direction: np.ndarray, radii: range,
+                           search: int) -> Tuple[int, int, float, int]:
+        """Best hinge, score and radius of one swing at full resolution
         
-        # Draw a quarter circle (door swing arc)
-        for angle in range(0, 90, 5):
-            rad = np.deg2rad(angle)
-            x = int(center + radius * np.cos(rad))
-            y = int(center + radius * np.sin(rad))
-            cv2.circle(kernel, (x, y), 1, 255, -1)
+        Each radius in radii places the hinge that far back from the arc's
+        middle along direction, its bisector, then lets it move up to search
+        pixels; both leaf sides are tried. Ties keep the earlier radius.
+        """
+        h, w = ink.shape[:2]
+        best = (int(round(middle[0])), int(round(middle[1])), -1.0, radii[0] if len(radii) else 0)
+        for radius in radii:
+            x, y = np.round(middle - direction * radius).astype(int)
+            # Both leaf sides share the empty kernel
+            _, empty_kernel = bank.templates[bank.index[(radius, angle, 0)]]
+            c = empty_kernel.shape[0] // 2
+            x0, y0 = max(0, x - c - search), max(0, y - c - search)
+            x1, y1 = min(w, x + c + search + 1), min(h, y + c + search + 1)
+            if x1 - x0 < empty_kernel.shape[1] or y1 - y0 < empty_kernel.shape[0]:
+                continue
+            empty = cv2.matchTemplate(ink[y0:y1, x0:x1], empty_kernel, cv2.TM_CCORR)
+            for leaf in (0, 1):
+                stroke_kernel, _ = bank.templates[bank.index[(radius, angle, leaf)]]
+                result = cv2.matchTemplate(strokes[y0:y1, x0:x1], stroke_kernel, cv2.TM_CCORR) - empty
+                _, score, _, (bx, by) = cv2.minMaxLoc(result)
+                if score > best[2] + 1e-3:
+                    best = (int(x0 + bx + c), int(y0 + by + c), float(score), radius)
+        return best
+    
+    def _find_score_peaks(self, score_map: np.ndarray, threshold: float,
+                          min_distance_px: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Local maxima of a matchTemplate score map at or above threshold
         
-        return kernel
+        A pixel is a peak when it equals the maximum of its
+        (2 * min_distance_px + 1) neighbourhood. Returns x, y and score arrays
+        sorted by descending score.
+        """
+        radius = max(1, int(round(min_distance_px)))
+        footprint = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * radius + 1, 2 * radius + 1))
+        local_max = cv2.dilate(score_map, footprint)
+        ys, xs = np.nonzero((score_map >= threshold) & (score_map >= local_max))
+        scores = score_map[ys, xs]
+        order = np.argsort(-scores, kind='stable')
+        return xs[order], ys[order], scores[order]
     
     def _remove_duplicate_doors(self, doors: List[Door], 
                                 min_distance: float = 1.0) -> List[Door]:
-        """Remove duplicate door detections"""
+        """Remove duplicate door detections
+        
+        Doors are kept greedily in the given order (strongest first when fed
+        from _find_score_peaks). Kept doors are bucketed in a grid of
+        min_distance cells, so each candidate only checks its 3x3 neighbourhood.
+        """
         if not doors:
             return []
         
+        grid = {}
         unique_doors = []
         for door in doors:
+            x, y = door.position
+            cx, cy = int(np.floor(x / min_distance)), int(np.floor(y / min_distance))
             is_duplicate = False
-            for unique_door in unique_doors:
-                dist = np.sqrt(
-                    (door.position[0] - unique_door.position[0])**2 +
-                    (door.position[1] - unique_door.position[1])**2
-                )
-                if dist < min_distance:
-                    is_duplicate = True
+            for nx in (cx - 1, cx, cx + 1):
+                for ny in (cy - 1, cy, cy + 1):
+                    for other in grid.get((nx, ny), ()):
+                        if (x - other.position[0])**2 + (y - other.position[1])**2 < min_distance**2:
+                            is_duplicate = True
+                            break
+                    if is_duplicate:
+                        break
+                if is_duplicate:
                     break
             
             if not is_duplicate:
                 unique_doors.append(door)
+                grid.setdefault((cx, cy), []).append(door)
         
         return unique_doors
     
-    def detect_windows(self, binary_img: np.ndarray) -> List[Window]:
-        """Detect window symbols in blueprint"""
+    def detect_windows(self, binary_img: np.ndarray, walls: List = None) -> List[Window]:
+        """Detect window symbols in blueprint, attached to host walls when walls are given"""
         windows = []
         
         # Windows often appear as parallel lines with specific spacing
@@ -502,31 +2590,420 @@ class AdvancedBlueprintProcessor(BlueprintTo3DBIM):
                 )
                 windows.append(window)
         
-        self.windows = windows
+        sized = len(windows)
+        if walls is not None:
+            windows = self.attach_to_walls(windows, walls)
+        self.count('windows', contours=len(contours_h) + len(contours_v), sized=sized,
+                   kept=len(windows))
         return windows
     
-    def calculate_room_metrics(self, rooms: List) -> Dict:
-        """Calculate detailed metrics for each room"""
-        metrics = {}
+    def _detect_in_region(self, image: np.ndarray, box: Tuple[int, int, int, int],
+                          core: Tuple[int, int, int, int] = None,
+                          detectors: Tuple[str, ...] = ('walls', 'doors', 'windows')
+                          ) -> Tuple[Dict[str, list], 'BlueprintPipeline']:
+        """Run the pipeline on image[y0:y1, x0:x1] and map results to sheet coordinates
+        
+        box is (x0, y0, x1, y1) in pixels. If core is given (same layout,
+        relative to the box), doors and windows outside it are dropped so
+        overlapping regions do not report the same opening twice.
+        """
+        x0, y0, x1, y1 = box
+        crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+        if crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+        pipeline = BlueprintPipeline(self, image=crop)
+        found = pipeline.run_detectors(detectors)
+        sf = self.scale_factor
+        
+        def owned(position):
+            if core is None:
+                return True
+            px, py = position[0] / sf, position[1] / sf
+            return core[0] <= px < core[2] and core[1] <= py < core[3]
+        
+        def shifted(position):
+            return (position[0] + x0 * sf, position[1] + y0 * sf)
+        
+        results = {}
+        if 'walls' in found:
+            results['walls'] = [Wall(start_point=shifted(w.start_point), end_point=shifted(w.end_point),
+                                     thickness=w.thickness, height=w.height)
+                                for w in found['walls']]
+        if 'doors' in found:
+            results['doors'] = [Door(position=shifted(d.position), width=d.width,
+                                     wall_index=d.wall_index)
+                                for d in found['doors'] if owned(d.position)]
+        if 'windows' in found:
+            results['windows'] = [Window(position=shifted(w.position), width=w.width,
+                                         height=w.height, wall_index=w.wall_index)
+                                  for w in found['windows'] if owned(w.position)]
+        if 'rooms' in found:
+            results['rooms'] = [Room(name=r.name, corners=[shifted(c) for c in r.corners], area=r.area)
+                                for r in found['rooms']]
+        return results, pipeline
+    
+    def _merge_wall_pieces(self, walls) -> List[Wall]:
+        """Join collinear overlapping wall pieces (e.g. cut at region borders) into walls"""
+        sf = self.scale_factor
+        pieces = WallTable.from_walls(walls)
+        if not len(pieces):
+            return []
+        merged, groups = self._merge_parallel_lines(
+            pieces.coords / sf, self.params['merge_angle_threshold'],
+            self.params['merge_distance_threshold'], return_groups=True)
+        # Pieces measured in different regions: length-weighted mean thickness
+        weights = np.maximum(pieces.lengths(), 1e-9)
+        thickness = (np.bincount(groups, weights * pieces.thickness, len(merged)) /
+                     np.bincount(groups, weights, len(merged)))
+        return [Wall(start_point=(x1 * sf, y1 * sf), end_point=(x2 * sf, y2 * sf), thickness=t)
+                for (x1, y1, x2, y2), t in zip(merged, thickness.tolist())]
+    
+    def _stitch_regions(self, regions: List[Dict[str, list]]) -> Dict[str, list]:
+        """Join per-region detections: merge wall pieces, drop duplicate openings"""
+        sf = self.scale_factor
+        walls = [w for r in regions for w in r.get('walls', [])]
+        doors = [d for r in regions for d in r.get('doors', [])]
+        windows = [w for r in regions for w in r.get('windows', [])]
+        
+        if walls:
+            walls = self._merge_wall_pieces(walls)
+        
+        # Windows share Door's .position, so the same grid dedup applies
+        doors = self._remove_duplicate_doors(doors, self.params['door_min_distance'])
+        windows = self._remove_duplicate_doors(windows, 2 * sf)
+        
+        # Region-local wall indices are meaningless after the merge, re-attach
+        if walls:
+            index = WallIndex(walls, self.params['opening_wall_tolerance'])
+            doors = self.attach_to_walls(doors, index)
+            windows = self.attach_to_walls(windows, index)
+        return {
+            'walls': walls,
+            'doors': sorted(doors, key=lambda door: (door.position[1], door.position[0])),
+            'windows': windows,
+        }
+    
+    def detect_tiled(self, image: np.ndarray, tile_size: int = 2048, overlap: int = 128,
+                     max_workers: int = 1) -> Dict[str, list]:
+        """Detect walls, rooms, doors and windows tile by tile with bounded memory
         
-        for idx, room in enumerate(rooms):
-            # Calculate perimeter
-            perimeter = 0
-            corners = room.corners
-            for i in range(len(corners)):
-                p1 = corners[i]
-                p2 = corners[(i + 1) % len(corners)]
-                perimeter += np.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2)
+        The image (H x W gray or BGR, possibly memory-mapped) is cut into
+        overlapping tiles that each run the normal pipeline, so the float and
+        filtered copies never exceed one tile per worker. Walls are stitched
+        across seams by merging their collinear overlapping pieces, and each
+        door or window is kept only by the tile whose core (tile minus half the
+        overlap) contains it. Rooms are found on a downsampled wall mask
+        assembled from the tiles' binary images, or with room_method
+        'wall_graph' from the stitched walls alone.
+        """
+        h, w = image.shape[:2]
+        step = max(1, tile_size - overlap)
+        origins = [(x0, y0)
+                   for y0 in range(0, max(h - overlap, 1), step)
+                   for x0 in range(0, max(w - overlap, 1), step)]
+        
+        # Rooms are detected on a reduced mask no larger than one tile
+        factor = max(1, int(np.ceil(max(h, w) / tile_size)))
+        room_mask = np.zeros(((h + factor - 1) // factor, (w + factor - 1) // factor), np.uint8)
+        half = overlap // 2
+        
+        def process(origin):
+            x0, y0 = origin
+            x1, y1 = min(w, x0 + tile_size), min(h, y0 + tile_size)
+            tw, th = x1 - x0, y1 - y0
+            # Core region owned by this tile, in tile pixels
+            core = (half if x0 > 0 else 0, half if y0 > 0 else 0,
+                    tw - half if x1 < w else tw, th - half if y1 < h else th)
+            found, pipeline = self._detect_in_region(image, (x0, y0, x1, y1), core)
             
-            # Calculate centroid
-            centroid_x = np.mean([p[0] for p in corners])
-            centroid_y = np.mean([p[1] for p in corners])
+            mx0, my0 = x0 // factor, y0 // factor
+            mx1, my1 = -(-x1 // factor), -(-y1 // factor)
+            small = cv2.resize(pipeline.get('binary'), (mx1 - mx0, my1 - my0),
+                               interpolation=cv2.INTER_AREA)
+            return found, (mx0, my0, small)
+        
+        if max_workers > 1 and len(origins) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                tiles = list(pool.map(process, origins))
+        else:
+            tiles = [process(origin) for origin in origins]
+        
+        for _, (mx0, my0, small) in tiles:
+            region = room_mask[my0:my0 + small.shape[0], mx0:mx0 + small.shape[1]]
+            np.maximum(region, (small > 0).astype(np.uint8) * 255, out=region)
+        
+        detected = self._stitch_regions([found for found, _ in tiles])
+        if self.params['room_method'] == 'wall_graph':
+            detected['rooms'] = self.rooms_from_graph(self.build_wall_graph(detected['walls']))
+        else:
+            coarse = AdvancedBlueprintProcessor(self.scale_factor * factor, self.scaled_params(factor))
+            detected['rooms'] = coarse.detect_rooms(room_mask)
+        return detected
+    
+    def detect_pyramid(self, image: np.ndarray, factor: int = 4, max_workers: int = 1,
+                       max_region: int = 384) -> Dict[str, list]:
+        """Coarse-to-fine detection: layout at low resolution, details only near walls
+        
+        Walls are detected on the image downsampled by factor. The coarse
+        walls define a band wide enough to hold a door swing; only the parts
+        of the sheet inside those bands, cut into regions of at most
+        max_region pixels, are preprocessed at full resolution to refine the
+        wall endpoints and to find doors and windows. Rooms are found on the
+        full-resolution wall mask assembled from those regions' binary images
+        (all the walls lie inside the bands), or with room_method
+        'wall_graph' from the refined walls. Coordinates come out in meters
+        through scale_factor, so the model schema is unchanged.
+        """
+        h, w = image.shape[:2]
+        coarse_img = cv2.resize(image, (max(1, w // factor), max(1, h // factor)),
+                                interpolation=cv2.INTER_AREA)
+        coarse = AdvancedBlueprintProcessor(self.scale_factor * factor, self.scaled_params(factor))
+        coarse_found = BlueprintPipeline(coarse, image=coarse_img).run_detectors(('walls',), max_workers)
+        
+        # Region of interest: bands around each coarse wall wide enough for a door
+        # swing plus the coarse endpoint error, drawn at coarse resolution
+        sf = self.scale_factor
+        band = int(max(self.params['door_radii_m']) / sf) + 2 * factor
+        roi = np.zeros(coarse_img.shape[:2], np.uint8)
+        for wall in coarse_found['walls']:
+            a = tuple(int(round(v / (sf * factor))) for v in wall.start_point)
+            b = tuple(int(round(v / (sf * factor))) for v in wall.end_point)
+            cv2.line(roi, a, b, 255, thickness=2 * (band // factor) + 1)
+        
+        # Cover the ROI with one box per grid cell; boxes overlap their
+        # neighbours by a margin so openings on a cell edge are seen whole,
+        # and each cell owns only the openings inside it
+        margin = int(max(self.params['door_radii_m']) / sf) + 8
+        boxes, cores = [], []
+        for cy in range(0, h, max_region):
+            for cx in range(0, w, max_region):
+                cell = roi[cy // factor:(cy + max_region) // factor,
+                           cx // factor:(cx + max_region) // factor]
+                if not cell.any():
+                    continue
+                rx, ry, rw, rh = cv2.boundingRect(cell)
+                core = (cx + rx * factor, cy + ry * factor,
+                        min(w, cx + (rx + rw) * factor), min(h, cy + (ry + rh) * factor))
+                box = (max(0, core[0] - margin), max(0, core[1] - margin),
+                       min(w, core[2] + margin), min(h, core[3] + margin))
+                boxes.append(box)
+                cores.append((core[0] - box[0], core[1] - box[1], core[2] - box[0], core[3] - box[1]))
+        
+        def process(box, core):
+            found, pipeline = self._detect_in_region(image, box, core)
+            return found, pipeline.get('binary')
+        
+        if max_workers > 1 and len(boxes) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                regions = list(pool.map(process, boxes, cores))
+        else:
+            regions = [process(box, core) for box, core in zip(boxes, cores)]
+        
+        detected = self._stitch_regions([found for found, _ in regions])
+        if self.params['room_method'] == 'wall_graph':
+            # The refined full-resolution walls close rooms better than the coarse ones
+            detected['rooms'] = self.rooms_from_graph(self.build_wall_graph(detected['walls']))
+        else:
+            room_mask = np.zeros((h, w), np.uint8)
+            for (x0, y0, x1, y1), (_, binary) in zip(boxes, regions):
+                np.maximum(room_mask[y0:y1, x0:x1], binary, out=room_mask[y0:y1, x0:x1])
+            detected['rooms'] = self.detect_rooms(room_mask)
+        return detected
+    
+    def find_changed_regions(self, previous: np.ndarray, image: np.ndarray,
+                             threshold: int = 48) -> Tuple[Tuple[float, float], List[Tuple[int, ...]]]:
+        """Align a previous revision of a sheet to image and box what changed
+        
+        The translation between the two scans comes from phase correlation,
+        estimated on copies reduced to about 1024 pixels and refined on the
+        full-resolution window with the most ink; it is returned as (dx, dy)
+        pixels, previous to image. Pixels whose
+        gray level then differs by more than threshold, minus isolated
+        specks, are grouped into components whose boxes are grown by a door
+        swing and merged until disjoint. Boxes are (x0, y0, x1, y1) pixels.
+        """
+        def gray(img):
+            return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        before, after = gray(previous), gray(image)
+        h, w = after.shape
+        factor = max(1, int(np.ceil(max(h, w) / 1024)))
+        size = (max(1, w // factor), max(1, h // factor))
+        small_before = cv2.resize(before, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        small_after = cv2.resize(after, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        (dx, dy), _ = cv2.phaseCorrelate(small_before, small_after)
+        dx, dy = int(round(dx * factor)), int(round(dy * factor))
+        
+        window = min(512, w - abs(dx), h - abs(dy))
+        if factor > 1 and window >= 64:
+            # Densest ink window that stays inside both sheets after the coarse shift
+            k = max(1, window // factor)
+            ink = cv2.boxFilter(255 - small_after, -1, (k, k), normalize=False, anchor=(0, 0),
+                                borderType=cv2.BORDER_CONSTANT)
+            wy, wx = np.unravel_index(np.argmax(ink), ink.shape)
+            x0 = int(np.clip(wx * factor, max(0, dx), w - window + min(0, dx)))
+            y0 = int(np.clip(wy * factor, max(0, dy), h - window + min(0, dy)))
+            (rx, ry), _ = cv2.phaseCorrelate(
+                before[y0 - dy:y0 - dy + window, x0 - dx:x0 - dx + window].astype(np.float32),
+                after[y0:y0 + window, x0:x0 + window].astype(np.float32))
+            dx, dy = dx + int(round(rx)), dy + int(round(ry))
+        shift = (float(dx), float(dy))
+        aligned = cv2.warpAffine(before, np.float32([[1, 0, shift[0]], [0, 1, shift[1]]]), (w, h),
+                                 borderMode=cv2.BORDER_REPLICATE)
+        
+        changed = (cv2.absdiff(after, aligned) > threshold).astype(np.uint8)
+        changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(changed, connectivity=8)
+        margin = int(max(self.params['door_radii_m']) / self.scale_factor) + 8
+        boxes = [(max(0, x - margin), max(0, y - margin),
+                  min(w, x + bw + margin), min(h, y + bh + margin))
+                 for x, y, bw, bh, _ in stats[1:count].tolist()]
+        return shift, _merge_boxes(boxes)
+    
+    def reconvert(self, previous_image: np.ndarray, previous_model: 'BIMModel', image: np.ndarray,
+                  threshold: int = 48, max_dirty: float = 0.5, max_workers: int = 1) -> Dict:
+        """Update previous_model, converted from previous_image, to a revised image
+        
+        Only the changed regions (see find_changed_regions) are detected
+        again, each cropped wide enough to hold the rooms it touches. Inside
+        a region the new walls, rooms and openings replace the old ones;
+        walls crossing a region border are cut there and rejoined with
+        their new part, and openings are re-attached to the spliced walls.
+        Falls back to a full detection when the sheets differ in size or
+        more than max_dirty of the sheet changed.
+        
+        Returns the detections like detect_tiled plus 'shift', the alignment
+        offset in meters, and 'changed_regions', the re-detected boxes in
+        meters (None after a full detection).
+        """
+        sf = self.scale_factor
+        h, w = image.shape[:2]
+        shift, boxes = (0.0, 0.0), None
+        if previous_image.shape[:2] == (h, w):
+            shift, boxes = self.find_changed_regions(previous_image, image, threshold)
+        if boxes is None or sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) > max_dirty * h * w:
+            detected = BlueprintPipeline(self, image=image).run_detectors(max_workers=max_workers)
+            return dict(detected, shift=(shift[0] * sf, shift[1] * sf), changed_regions=None)
+        
+        previous = previous_model.translated(shift[0] * sf, shift[1] * sf)
+        rooms = previous.rooms
+        counts = rooms.corner_counts()
+        room_boxes = np.zeros((len(rooms), 4))
+        if len(rooms.vertices):
+            starts = rooms.offsets[:-1][counts > 0]
+            room_boxes[counts > 0] = np.hstack([np.minimum.reduceat(rooms.vertices, starts),
+                                                np.maximum.reduceat(rooms.vertices, starts)]) / sf
+        
+        def rooms_touching(box):
+            return ((counts > 0) & (room_boxes[:, 0] < box[2]) & (room_boxes[:, 2] > box[0]) &
+                    (room_boxes[:, 1] < box[3]) & (room_boxes[:, 3] > box[1]))
+        
+        # Regions reach over every old room they touch, so rooms come out whole
+        margin = int(max(self.params['door_radii_m']) / sf) + 8
+        regions = []
+        for box in boxes:
+            outer = np.vstack([np.array(box, dtype=np.float64), room_boxes[rooms_touching(box)]])
+            regions.append((max(0, int(outer[:, 0].min()) - margin), max(0, int(outer[:, 1].min()) - margin),
+                            min(w, int(np.ceil(outer[:, 2].max())) + margin),
+                            min(h, int(np.ceil(outer[:, 3].max())) + margin)))
+        # Overlapping regions would detect the same rooms twice; cores follow their region
+        regions = _merge_boxes(regions)
+        cores = []
+        for region in regions:
+            inner = [b for b in boxes if region[0] <= b[0] and region[1] <= b[1] and
+                     b[2] <= region[2] and b[3] <= region[3]]
+            cores.append((min(b[0] for b in inner), min(b[1] for b in inner),
+                          max(b[2] for b in inner), max(b[3] for b in inner)))
+        
+        detectors = ('walls', 'doors', 'windows')
+        if self.params['room_method'] != 'wall_graph':
+            detectors += ('rooms',)
+        
+        def process(region, core):
+            relative = (core[0] - region[0], core[1] - region[1], core[2] - region[0], core[3] - region[1])
+            return self._detect_in_region(image, region, relative, detectors)[0]
+        
+        if max_workers > 1 and len(regions) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                found = list(pool.map(process, regions, cores))
+        else:
+            found = [process(region, core) for region, core in zip(regions, cores)]
+        
+        # Walls clear of every core are kept as they are; the others are cut
+        # at the cores and rejoined with the new walls found inside them
+        touched = np.zeros(len(previous.walls), dtype=bool)
+        for core in cores:
+            t0, t1 = _clip_range(previous.walls.coords, np.array(core) * sf)
+            touched |= t0 < t1
+        outside = previous.walls[touched]
+        pieces = []
+        for core, result in zip(cores, found):
+            box = np.array(core) * sf
+            _, outside = _clip_walls(outside, box, sf)
+            pieces.append(_clip_walls(WallTable.from_walls(result['walls']), box, sf)[0])
+        walls = list(previous.walls[~touched]) + \
+            self._merge_wall_pieces(WallTable.concatenate(pieces + [outside]))
+        
+        def outside_cores(position):
+            px, py = position[0] / sf, position[1] / sf
+            return not any(c[0] <= px < c[2] and c[1] <= py < c[3] for c in cores)
+        
+        index = WallIndex(walls, self.params['opening_wall_tolerance'])
+        detected = {'walls': walls}
+        for name, min_distance in (('doors', self.params['door_min_distance']), ('windows', 2 * sf)):
+            kept = [o for o in (getattr(previous, name) or []) if outside_cores(o.position)]
+            openings = self._remove_duplicate_doors(kept + [o for r in found for o in r[name]], min_distance)
+            detected[name] = self.attach_to_walls(openings, index)
+        
+        if self.params['room_method'] == 'wall_graph':
+            detected['rooms'] = self.rooms_from_graph(self.build_wall_graph(walls))
+        else:
+            # Rooms detected again unchanged keep their old name, new ones get a free one
+            stale = np.zeros(len(rooms), dtype=bool)
+            for core in cores:
+                stale |= rooms_touching(core)
+            detected['rooms'] = [room for room, redo in zip(rooms, stale) if not redo]
             
-            metrics[room.name] = {
-                'area': round(float(room.area), 2),
-                'perimeter': round(float(perimeter), 2),
-                'centroid': (float(centroid_x), float(centroid_y)),
-                'num_corners': len(corners)
+            def shape(room):
+                return (round(room.area, 2),) + tuple(np.round(np.array(room.corners) / sf).astype(int).ravel())
+            old_names = {shape(rooms[i]): rooms.names[i] for i in np.flatnonzero(stale)}
+            names = set(rooms.names)
+            serial = len(rooms)
+            for core, result in zip(cores, found):
+                for room in result['rooms']:
+                    corners = np.array(room.corners) / sf
+                    if not (corners[:, 0].min() < core[2] and corners[:, 0].max() > core[0] and
+                            corners[:, 1].min() < core[3] and corners[:, 1].max() > core[1]):
+                        continue
+                    name = old_names.pop(shape(room), None)
+                    if name is None:
+                        while f"Room_{serial}" in names:
+                            serial += 1
+                        name = f"Room_{serial}"
+                        names.add(name)
+                    detected['rooms'].append(Room(name=name, corners=room.corners, area=room.area))
+        
+        detected['shift'] = (shift[0] * sf, shift[1] * sf)
+        detected['changed_regions'] = [[v * sf for v in core] for core in cores]
+        return detected
+    
+    def calculate_room_metrics(self, rooms: List) -> Dict:
+        """Calculate detailed metrics for each room"""
+        table = RoomTable.from_rooms(rooms)
+        
+        # One vectorized pass over the shared vertex buffer for all rooms
+        areas = np.round(table.areas, 2).tolist()
+        perimeters = np.round(table.perimeters(), 2).tolist()
+        centroids = table.centroids().tolist()
+        counts = table.corner_counts().tolist()
+        
+        metrics = {}
+        for name, area, perimeter, centroid, count in zip(table.names, areas, perimeters,
+                                                          centroids, counts):
+            metrics[name] = {
+                'area': area,
+                'perimeter': perimeter,
+                'centroid': tuple(centroid),
+                'num_corners': count
             }
         
         return metrics
@@ -542,29 +3019,26 @@ class AdvancedBlueprintProcessor(BlueprintTo3DBIM):
         }
         
         # Floor slab concrete
-        total_floor_area = sum(r.area for r in bim_model.rooms)
+        total_floor_area = float(RoomTable.from_rooms(bim_model.rooms).areas.sum())
         slab_thickness = 0.15  # 15cm standard slab
         quantities['concrete']['floor_slab_m3'] = round(total_floor_area * slab_thickness, 2)
         
-        # Wall materials
-        total_wall_area = 0
-        for wall in bim_model.walls:
-            length = np.sqrt(
-                (wall.end_point[0] - wall.start_point[0])**2 +
-                (wall.end_point[1] - wall.start_point[1])**2
-            )
-            wall_area = length * bim_model.floor_height
-            total_wall_area += wall_area
+        # Wall materials, using each wall's measured thickness
+        walls = WallTable.from_walls(bim_model.walls)
+        lengths = walls.lengths()
+        total_wall_area = float(lengths.sum()) * bim_model.floor_height
+        total_wall_volume = float((lengths * walls.thickness).sum()) * bim_model.floor_height
         
         quantities['walls']['total_area_m2'] = round(total_wall_area, 2)
-        quantities['walls']['bricks_count'] = int(total_wall_area * 80) # ~80 bricks per m2
+        quantities['walls']['volume_m3'] = round(total_wall_volume, 2)
+        quantities['walls']['bricks_count'] = int(total_wall_volume * 400) # ~400 bricks per m3 (80 per m2 at 20cm)
         
         # Flooring
         quantities['flooring']['tiles_m2'] = round(total_floor_area * 1.1, 2) # 10% waste
         
         # Doors and windows
-        quantities['doors']['count'] = len(self.doors)
-        quantities['windows']['count'] = len(self.windows)
+        quantities['doors']['count'] = len(bim_model.doors or [])
+        quantities['windows']['count'] = len(bim_model.windows or [])
         
         return quantities
     
@@ -606,6 +3080,7 @@ class AdvancedBlueprintProcessor(BlueprintTo3DBIM):
         
         report.append(f"\nWalls:")
         report.append(f"  Total wall area: {quantities['walls']['total_area_m2']:.2f} m²")
+        report.append(f"  Wall volume: {quantities['walls']['volume_m3']:.2f} m³")
         report.append(f"  Estimated bricks: {quantities['walls']['bricks_count']:,}")
         
         report.append(f"\nFlooring:")
@@ -624,6 +3099,168 @@ class AdvancedBlueprintProcessor(BlueprintTo3DBIM):
         return report_text
 
 
+class BlueprintPipeline:
+    """Lazily computed, memoized stages of one blueprint conversion
+    
+    Each stage (decoded, enhanced, gray, ink, binary, edges, distance, and the
+    detector outputs walls, wall_graph, wall_index, rooms, doors, windows,
+    text) is computed on first access from the stages it depends on and then
+    reused, so no stage runs twice per image. Wall-clock time per stage is kept in timings (ms).
+    When the processor is instrumented, stats additionally holds per stage
+    its wall and CPU time, the process peak RSS after it and how much the
+    stage raised it, and the output shape or item count; each stage is
+    logged with the detector's candidate counts as it finishes.
+    """
+    
+    def __init__(self, processor: 'AdvancedBlueprintProcessor', image_path: str = None,
+                 image_bytes: bytes = None, image: np.ndarray = None):
+        if image_path is None and image_bytes is None and image is None:
+            raise ValueError("BlueprintPipeline needs an image path, image bytes or an image")
+        self.processor = processor
+        self.image_path = image_path
+        self.image_bytes = image_bytes
+        self.results = {}
+        self.timings = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._stage_locks = {}
+        self._local = threading.local()
+        if image is not None:
+            self.results['decoded'] = image
+    
+    def get(self, stage: str):
+        """Return a stage, computing it (and its inputs) on first use
+        
+        Thread-safe: concurrent callers asking for the same stage wait for
+        the first one instead of computing it again.
+        """
+        if stage in self.results:
+            return self.results[stage]
+        compute = getattr(self, f'_compute_{stage}', None)
+        if compute is None:
+            raise KeyError(f"Unknown pipeline stage: {stage}")
+        with self._lock:
+            stage_lock = self._stage_locks.setdefault(stage, threading.Lock())
+        with stage_lock:
+            if stage not in self.results:
+                # Inputs computed on the way are timed on their own, keep only this stage's share
+                outer_nested = getattr(self._local, 'nested', 0.0)
+                outer_nested_cpu = getattr(self._local, 'nested_cpu', 0.0)
+                outer_nested_rss = getattr(self._local, 'nested_rss', 0.0)
+                self._local.nested = self._local.nested_cpu = self._local.nested_rss = 0.0
+                rss_before = _peak_rss_mb()
+                start, cpu_start = time.perf_counter(), time.process_time()
+                result = compute()
+                elapsed = time.perf_counter() - start
+                cpu = time.process_time() - cpu_start
+                self.timings[stage] = round((elapsed - self._local.nested) * 1000, 2)
+                growth = 0.0
+                if self.processor.counters is not None:
+                    growth = self._record_stats(stage, result, cpu - self._local.nested_cpu,
+                                                rss_before, self._local.nested_rss)
+                self._local.nested = outer_nested + elapsed
+                self._local.nested_cpu = outer_nested_cpu + cpu
+                self._local.nested_rss = outer_nested_rss + growth
+                self.results[stage] = result
+        return self.results[stage]
+    
+    def _record_stats(self, stage: str, result, cpu: float, rss_before: Optional[float],
+                      nested_growth: float) -> float:
+        # process_time covers every thread: concurrent detectors see each other's CPU
+        stats = {'wall_ms': self.timings[stage], 'cpu_ms': round(cpu * 1000, 2)}
+        rss = _peak_rss_mb()
+        growth = 0.0
+        if rss is not None:
+            growth = rss - rss_before
+            stats.update(rss_peak_mb=round(rss, 1), rss_growth_mb=round(growth - nested_growth, 1))
+        if isinstance(result, np.ndarray):
+            stats['shape'] = list(result.shape)
+        elif hasattr(result, '__len__'):
+            stats['items'] = len(result)
+        self.stats[stage] = stats
+        details = ' '.join(f"{k}={v}" for k, v in self.processor.counters.get(stage, {}).items())
+        print(f"Stage {stage}: {stats['wall_ms']} ms, CPU {stats['cpu_ms']} ms, "
+              f"peak RSS {stats.get('rss_peak_mb', 'n/a')} MB {details}".rstrip())
+        return growth
+    
+    def run_detectors(self, detectors: Tuple[str, ...] = ('walls', 'rooms', 'doors', 'windows'),
+                      max_workers: int = 1, on_result=None) -> Dict[str, list]:
+        """Run detector stages, fanning them out to a thread pool when max_workers > 1
+        
+        The shared inputs are computed first so the detectors only read them.
+        OpenCV releases the GIL in the heavy calls, so with enough cores the
+        total time approaches that of the slowest detector. on_result(name,
+        result) is called in detector order as soon as each result and all
+        those before it are available.
+        """
+        for stage in ('binary', 'edges'):
+            self.get(stage)
+        results = {}
+        if max_workers <= 1 or len(detectors) <= 1:
+            for name in detectors:
+                results[name] = self.get(name)
+                if on_result is not None:
+                    on_result(name, results[name])
+            return results
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(detectors))) as pool:
+            futures = {name: pool.submit(self.get, name) for name in detectors}
+            for name, future in futures.items():
+                results[name] = future.result()
+                if on_result is not None:
+                    on_result(name, results[name])
+            return results
+    
+    def _compute_decoded(self) -> np.ndarray:
+        if self.image_bytes is not None:
+            return self.processor.decode_blueprint(self.image_bytes)
+        return self.processor.load_blueprint(self.image_path)
+    
+    def _compute_enhanced(self) -> np.ndarray:
+        return self.processor.enhance(self.get('decoded'))
+    
+    def _compute_gray(self) -> np.ndarray:
+        if self.processor.params['enhance_method'] == 'clahe_lab':
+            return cv2.cvtColor(self.get('enhanced'), cv2.COLOR_BGR2GRAY)
+        return self.processor.enhance_gray(cv2.cvtColor(self.get('decoded'), cv2.COLOR_BGR2GRAY))
+    
+    def _compute_ink(self) -> np.ndarray:
+        return self.processor.binarize(self.get('decoded'), gray=self.get('gray'))
+    
+    def _compute_binary(self) -> np.ndarray:
+        return self.processor.preprocess_image(self.get('decoded'), ink=self.get('ink'))
+    
+    def _compute_edges(self) -> np.ndarray:
+        return self.processor.detect_edges(self.get('binary'))
+    
+    def _compute_distance(self) -> np.ndarray:
+        return cv2.distanceTransform(self.get('binary'), cv2.DIST_L2, 5)
+    
+    def _compute_walls(self) -> List[Wall]:
+        return self.processor.detect_walls(self.get('binary'), edges=self.get('edges'),
+                                           distance=self.get('distance'))
+    
+    def _compute_rooms(self) -> List[Room]:
+        if self.processor.params['room_method'] == 'wall_graph':
+            return self.processor.rooms_from_graph(self.get('wall_graph'))
+        return self.processor.detect_rooms(self.get('binary'))
+    
+    def _compute_wall_graph(self) -> WallGraph:
+        return self.processor.build_wall_graph(self.get('walls'))
+    
+    def _compute_wall_index(self) -> WallIndex:
+        return WallIndex(self.get('walls'), self.processor.params['opening_wall_tolerance'])
+    
+    def _compute_doors(self) -> List[Door]:
+        return self.processor.detect_doors(self.get('ink'), self.get('wall_index'))
+    
+    def _compute_windows(self) -> List[Window]:
+        return self.processor.detect_windows(self.get('binary'), self.get('wall_index'))
+    
+    def _compute_text(self) -> List[Dict]:
+        return self.processor.detect_text_annotations(self.get('decoded'), gray=self.get('gray'),
+                                                      binary=self.get('binary'), rooms=self.get('rooms'))
+
+
 def create_sample_blueprint():
     """Create a sample blueprint image for testing"""
     img = np.ones((800, 1000, 3), dtype=np.uint8) * 255
@@ -653,39 +3290,1032 @@ def create_sample_blueprint():
     return sample_path
 
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
+def _pipeline_digest() -> str:
+    """Hash of this module's source, so cached results expire when the code changes"""
+    global _PIPELINE_DIGEST
+    if _PIPELINE_DIGEST is None:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            _PIPELINE_DIGEST = hashlib.sha256(f.read()).hexdigest()
+    return _PIPELINE_DIGEST
+
+_PIPELINE_DIGEST = None
+
+
+class ConversionCache:
+    """Content-addressed cache of conversion results
+    
+    Keys are a SHA-256 over the image bytes, scale_factor, detector params and
+    the pipeline source. Results (the exported JSON text) are kept in an
+    in-memory LRU and, when cache_dir is set, in a size-bounded directory that
+    survives restarts. Least recently used files are evicted first.
+    """
+    
+    def __init__(self, cache_dir: str = None, max_memory_entries: int = 64,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    def make_key(self, image_bytes: bytes, scale_factor: float, params: Dict) -> str:
+        h = hashlib.sha256()
+        h.update(image_bytes)
+        h.update(json.dumps({'scale_factor': float(scale_factor), 'params': params,
+                             'pipeline': _pipeline_digest()}, sort_keys=True).encode())
+        return h.hexdigest()
+    
+    def _path(self, key: str, suffix: str = 'json') -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{suffix}")
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return cached JSON text for key, or None"""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return self.memory[key]
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'r') as f:
+                    text = f.read()
+                os.utime(path)  # refresh recency for disk eviction
+            except OSError:
+                text = None
+            if text is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(key, text)
+                return text
+        self.stats['misses'] += 1
+        return None
+    
+    def put(self, key: str, text: str):
+        """Store JSON text under key in both tiers"""
+        self._remember(key, text)
+        self.stats['stores'] += 1
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, path)  # atomic, other workers never see partial files
+            self._evict_disk()
+    
+    def get_blob(self, key: str, suffix: str) -> Optional[bytes]:
+        """Return a derived artifact (e.g. a preview PNG) stored next to key, or None"""
+        name = f"{key}.{suffix}"
+        if name in self.memory:
+            self.memory.move_to_end(name)
+            return self.memory[name]
+        if self.cache_dir:
+            try:
+                with open(self._path(key, suffix), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            self._remember(name, data)
+            return data
+        return None
+    
+    def put_blob(self, key: str, suffix: str, data: bytes):
+        """Store a derived artifact next to key in both tiers"""
+        self._remember(f"{key}.{suffix}", data)
+        if self.cache_dir:
+            path = self._path(key, suffix)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+    
+    def _remember(self, key: str, text: str):
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+    
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self.stats['evictions'] += 1
+            except OSError:
+                pass
+            total -= size
+
+
+def convert_blueprint(image_path: str, output_path: str,
+                      scale_factor: float = 0.05,
+                      cache: ConversionCache = None,
+                      threads: int = 1,
+                      tile_size: int = None,
+                      pyramid: int = None,
+                      profile: str = 'accurate',
+                      output_format: str = 'json',
+                      precision: int = None,
+                      mesh_path: str = None,
+                      preview: bool = False,
+                      room_method: str = 'contours',
+                      previous_image: str = None,
+                      previous_model: str = None,
+                      diff_path: str = None,
+                      page: int = None,
+                      dpi: int = 200,
+                      instrument: bool = False,
+                      cprofile_dir: str = None,
+                      cprofile_min_ms: float = 0.0,
+                      on_event=None,
+                      image_data: bytes = None,
+                      label_rooms: bool = False) -> BIMModel:
+    """Run the full conversion pipeline for one image and export the result
+    
+    threads > 1 runs the independent detectors (or tiles) concurrently on a
+    thread pool. tile_size switches to bounded-memory tiled processing and
+    pyramid (a downsampling factor) to coarse-to-fine detection. profile
+    picks one of PREPROCESS_PROFILES; output_format one of EXPORT_FORMATS.
+    The cache always holds the indented JSON, other formats are re-exported
+    from it on a hit. mesh_path additionally writes a .glb or .obj mesh and
+    preview plan/axonometric PNGs next to output_path (see save_previews).
+    room_method is one of ROOM_METHODS. Given previous_image and the
+    model exported from it (previous_model), only the regions that changed
+    are converted again (see reconvert) and the model diff is written to
+    diff_path (default <output stem>.diff.json); such runs bypass the cache.
+    page selects a zero-based page of a multi-page TIFF or PDF; PDF pages
+    are rendered at dpi. instrument records per-stage wall/CPU time, peak
+    RSS and candidate counts into metadata['profile'] (see
+    AdvancedBlueprintProcessor.instrument). cprofile_dir runs the conversion
+    under cProfile and dumps the stats there (<stem>-<ms>.prof, for
+    snakeviz or flameprof) when it took at least cprofile_min_ms.
+    on_event, when given, receives the STREAM_EVENTS as dicts while the
+    conversion runs ({'event': 'walls', 'walls': [...]}, then 'rooms',
+    'openings' with doors and windows, and 'metrics'); geometry is laid out
+    as in the exported JSON. Walls and rooms are emitted as soon as their
+    detectors finish, before the openings are matched. label_rooms also
+    detects the text annotations inside rooms (on the default path) and
+    turns them into metadata['room_labels'] (see
+    AdvancedBlueprintProcessor.label_rooms); rooms renamed from their labels
+    are streamed under their new names.
+    image_data converts an image already in memory (encoded bytes, or a .npy
+    raster viewed without copying) instead of reading image_path, which then
+    only names the input. With output_path None nothing is written and the
+    caller serializes the returned model (see serialize).
+    """
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Unknown profile: {profile} (expected one of {', '.join(PREPROCESS_PROFILES)})")
+    if room_method not in ROOM_METHODS:
+        raise ValueError(f"Unknown room method: {room_method} (expected one of {', '.join(ROOM_METHODS)})")
+    processor = AdvancedBlueprintProcessor(scale_factor=scale_factor,
+                                           params=dict(PREPROCESS_PROFILES[profile],
+                                                       room_method=room_method))
+    
+    streamed = {}  # detector results already turned into events
+    
+    def emit(event: str, **payload):
+        if on_event is not None:
+            on_event(dict(event=event, **payload))
+    
+    def emit_detected(name: str, result):
+        streamed[name] = result
+        if name == 'walls':
+            emit('walls', walls=WallTable.from_walls(result).to_records(precision))
+        elif name == 'rooms':
+            emit('rooms', rooms=RoomTable.from_rooms(result).to_records(precision))
+        elif name == 'windows':
+            emit('openings', doors=OpeningTable.from_items(streamed['doors'], Door).to_records(precision),
+                 windows=OpeningTable.from_items(result, Window).to_records(precision))
+    
+    labelled = {}
+    
+    def on_detected(name: str, result):
+        # With labels, rooms are held back until the text annotations have renamed them
+        if name == 'rooms' and label_rooms:
+            labelled['rooms'] = RoomTable.from_rooms(result)
+            return
+        if name == 'text':
+            labelled['labels'] = processor.label_rooms(labelled['rooms'], result, pipeline.get('gray'))
+            name, result = 'rooms', labelled['rooms']
+        if on_event is not None:
+            emit_detected(name, result)
+    
+    def emit_metrics(metadata: Dict):
+        emit('metrics', **{k: metadata.get(k) for k in ('total_wall_length', 'total_floor_area',
+                                                         'room_metrics', 'material_quantities')})
+    
+    incremental = previous_image is not None and previous_model is not None
+    key = None
+    image_bytes = None
+    if image_data is not None:
+        image_bytes = image_data
+    if cache is not None and not incremental:
+        if image_bytes is None:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        key_params = dict(processor.params, tile_size=tile_size, pyramid=pyramid, label_rooms=label_rooms)
+        if page is not None:
+            key_params.update(page=page, dpi=dpi)
+        key = cache.make_key(image_bytes, scale_factor, key_params)
+        text = cache.get(key)
+        if text is not None:
+            bim_model = BIMModel.from_dict(json.loads(text))
+            if on_event is not None:
+                for name, result in (('walls', bim_model.walls), ('rooms', bim_model.rooms),
+                                     ('doors', bim_model.doors), ('windows', bim_model.windows)):
+                    emit_detected(name, result)
+                emit_metrics(bim_model.metadata)
+            if output_path is None:
+                print("BIM model served from cache")
+            elif output_format == 'json':
+                with open(output_path, 'w') as f:
+                    f.write(text)
+                print(f"BIM model served from cache to {output_path}")
+            else:
+                processor.export(bim_model, output_path, output_format, precision)
+                print(f"BIM model served from cache to {output_path}")
+            if mesh_path:
+                processor.export_mesh(bim_model, mesh_path)
+            if preview and output_path is not None:
+                processor.save_previews(bim_model, output_path, cache=cache, key=key)
+            return bim_model
+    
+    if instrument:
+        processor.instrument()
+    profiler = cProfile.Profile() if cprofile_dir else None
+    if profiler is not None:
+        profiler.enable()
+    run_start, cpu_start = time.perf_counter(), time.process_time()
+    stages = {}
+    
+    page_image = None
+    if page is not None:
+        page_image = processor.load_page(image_path, page, dpi)
+        image_bytes = None
+    
+    if page_image is None and image_data is not None and (incremental or tile_size):
+        page_image = processor.decode_blueprint(image_data)
+    elif image_data is not None:
+        image_bytes = image_data
+    
+    if incremental:
+        previous = BIMModel.load(previous_model)
+        start = time.perf_counter()
+        image = processor.load_blueprint(image_path) if page_image is None else page_image
+        detected = processor.reconvert(processor.load_blueprint(previous_image), previous,
+                                       image, max_workers=threads)
+        timings = {'incremental': round((time.perf_counter() - start) * 1000, 2)}
+        input_shape = image.shape
+    elif tile_size:
+        image_bytes = None  # let large rasters stream from disk instead
+        start = time.perf_counter()
+        raster = processor.load_raster(image_path) if page_image is None else page_image
+        detected = processor.detect_tiled(raster, tile_size, max_workers=threads)
+        timings = {'tiled': round((time.perf_counter() - start) * 1000, 2)}
+        input_shape = raster.shape
+    elif pyramid and pyramid > 1:
+        pipeline = BlueprintPipeline(processor, image_path=image_path, image_bytes=image_bytes,
+                                     image=page_image)
+        image = pipeline.get('decoded')
+        start = time.perf_counter()
+        detected = processor.detect_pyramid(image, pyramid, max_workers=threads)
+        timings = dict(pipeline.timings, pyramid=round((time.perf_counter() - start) * 1000, 2))
+        stages, input_shape = pipeline.stats, image.shape
+    else:
+        # Decode and preprocess once; detectors share the memoized stages
+        pipeline = BlueprintPipeline(processor, image_path=image_path, image_bytes=image_bytes,
+                                     image=page_image)
+        detectors = ('walls', 'rooms', 'text', 'doors', 'windows') if label_rooms else \
+            ('walls', 'rooms', 'doors', 'windows')
+        detected = pipeline.run_detectors(detectors, max_workers=threads, on_result=on_detected)
+        detected.update(labelled)
+        timings = pipeline.timings
+        stages, input_shape = pipeline.stats, pipeline.get('decoded').shape
+    if on_event is not None and not streamed:
+        for name in ('walls', 'rooms', 'doors', 'windows'):
+            emit_detected(name, detected[name])
+    bim_model = processor.create_3d_model(detected['walls'], detected['rooms'],
+                                          doors=detected['doors'], windows=detected['windows'])
+    if 'labels' in detected:
+        bim_model.metadata['room_labels'] = detected['labels']
+    # Calculate additional metadata
+    metrics = processor.calculate_room_metrics(bim_model.rooms)
+    quantities = processor.estimate_material_quantities(bim_model)
+    bim_model.metadata.update({
+        'room_metrics': metrics,
+        'material_quantities': quantities
+    })
+    emit_metrics(bim_model.metadata)
+    if instrument:
+        rss = _peak_rss_mb()
+        bim_model.metadata['profile'] = {
+            'input_shape': list(input_shape),
+            'wall_ms': round((time.perf_counter() - run_start) * 1000, 2),
+            'cpu_ms': round((time.process_time() - cpu_start) * 1000, 2),
+            'rss_peak_mb': None if rss is None else round(rss, 1),
+            'stages': dict(stages) or {name: {'wall_ms': ms} for name, ms in timings.items()},
+            'counts': processor.counters,
+        }
+    
+    if output_path is not None:
+        processor.export(bim_model, output_path, output_format, precision)
+    if mesh_path:
+        processor.export_mesh(bim_model, mesh_path)
+    if preview and output_path is not None:
+        processor.save_previews(bim_model, output_path, cache=cache, key=key)
+    if incremental:
+        diff = bim_model.diff(previous.translated(*detected['shift']))
+        diff.update(shift=list(detected['shift']), changed_regions=detected['changed_regions'])
+        summary = ', '.join(f"{kind} +{len(diff[kind]['added'])}/-{len(diff[kind]['removed'])}"
+                            for kind in ('walls', 'rooms', 'doors', 'windows'))
+        if diff_path is None and output_path is not None:
+            diff_path = os.path.splitext(output_path)[0] + '.diff.json'
+        if diff_path is not None:
+            with open(diff_path, 'w') as f:
+                json.dump(diff, f)
+            print(f"Model diff written to {diff_path} ({summary})")
+        else:
+            bim_model.metadata['diff'] = diff
+            print(f"Model diff: {summary}")
+    print(f"Stage timings (ms): {timings}")
+    if profiler is not None:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - run_start) * 1000
+        if elapsed_ms >= cprofile_min_ms:
+            os.makedirs(cprofile_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(image_path or 'memory'))[0]
+            dump_path = os.path.join(cprofile_dir, f"{stem}-{int(time.time() * 1000)}.prof")
+            profiler.dump_stats(dump_path)
+            print(f"cProfile stats for {elapsed_ms:.0f} ms written to {dump_path}")
+            if instrument:
+                bim_model.metadata['profile']['cprofile'] = dump_path
+    if key is not None:
+        # Profiles describe one run; cached results are shared by later ones
+        profile_stats = bim_model.metadata.pop('profile', None)
+        if output_format == 'json' and profile_stats is None and output_path is not None:
+            with open(output_path, 'r') as f:
+                cache.put(key, f.read())
+        else:
+            cache.put(key, processor.to_json(bim_model))
+        if profile_stats is not None:
+            bim_model.metadata['profile'] = profile_stats
+    return bim_model
+
+
+# convert_blueprint keyword options that --serve jobs may set per request
+WORKER_CONVERSION_OPTIONS = ('threads', 'tile_size', 'pyramid', 'profile', 'output_format', 'precision',
+                             'preview', 'room_method', 'dpi', 'instrument', 'cprofile_dir',
+                             'cprofile_min_ms', 'label_rooms')
+
+
+def _model_summary(bim_model: BIMModel) -> Dict:
+    """Counts and totals reported once a conversion has finished"""
+    return {
+        'walls': len(bim_model.walls),
+        'rooms': len(bim_model.rooms),
+        'doors': len(bim_model.doors or []),
+        'windows': len(bim_model.windows or []),
+        'floor_area': bim_model.metadata.get('total_floor_area'),
+        'wall_length': bim_model.metadata.get('total_wall_length'),
+        'material_quantities': bim_model.metadata.get('material_quantities'),
+    }
+
+
+def _worker_main(conn, options: Dict):
+    """Worker process loop: keeps imports warm and converts jobs sent over a pipe
+    
+    options holds the pool-wide defaults ('cache_dir' and the conversion
+    options in WORKER_CONVERSION_OPTIONS); jobs may override conversion options.
+    """
+    # stdout belongs to the NDJSON protocol of the parent, keep worker chatter off it
+    sys.stdout = sys.stderr
+    cache = ConversionCache(options.get('cache_dir'))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        try:
+            conversion_options = {name: job.get(name, options.get(name))
+                                  for name in WORKER_CONVERSION_OPTIONS}
+            image_data = None
+            if job.get('input_base64') is not None:
+                encoded = job['input_base64']
+                image_data = base64.b64decode(encoded.split(',', 1)[-1] if encoded.startswith('data:')
+                                              else encoded)
+            start = time.perf_counter()
+            bim_model = convert_blueprint(
+                job.get('input'), job.get('output'),
+                scale_factor=float(job.get('scale_factor', 0.05)),
+                cache=cache,
+                mesh_path=job.get('mesh_output'),
+                previous_image=job.get('previous_input'),
+                previous_model=job.get('previous_output'),
+                diff_path=job.get('diff_output'),
+                page=job.get('page'),
+                on_event=((lambda event: conn.send({'id': job['id'], 'status': 'progress', **event}))
+                          if job.get('stream') else None),
+                image_data=image_data,
+                **{k: v for k, v in conversion_options.items() if v is not None}
+            )
+            response = {
+                'id': job['id'],
+                'status': 'ok',
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+                'format': conversion_options['output_format'] or 'json',
+                **_model_summary(bim_model),
+                'cache': dict(cache.stats),
+            }
+            if job.get('output') is not None:
+                response.update(output=job['output'], bytes=os.path.getsize(job['output']))
+            else:
+                # No files: the model (and mesh) travel back in the response itself
+                response['model'] = bim_model.to_dict(conversion_options['precision'])
+                if job.get('mesh'):
+                    mesh = AdvancedBlueprintProcessor(
+                        scale_factor=float(job.get('scale_factor', 0.05))).build_mesh(bim_model)
+                    response['mesh_base64'] = base64.b64encode(mesh.glb_bytes()).decode('ascii')
+            if 'profile' in bim_model.metadata:
+                response['profile'] = bim_model.metadata['profile']
+            conn.send(response)
+        except Exception as e:
+            conn.send({'id': job['id'], 'status': 'error', 'error': str(e)})
+
+
+class ConversionWorkerPool:
+    """Pool of warm converter processes with per-job timeouts and cancellation
+    
+    Jobs are dicts with 'id', 'input' (or 'input_base64', the image bytes
+    themselves), optionally 'output' (left out, the result carries the model
+    as 'model' and, with 'mesh': true, a base64 .glb as 'mesh_base64') and
+    optional 'scale_factor',
+    'threads', 'mesh_output', 'timeout', 'page' (zero-based, for multi-page
+    TIFF/PDF input), 'stream' and, for incremental reconversion, 'previous_input',
+    'previous_output' and 'diff_output'. Streamed jobs report each of the
+    STREAM_EVENTS as a {'status': 'progress', 'event': ...} result before their
+    final one. worker_options are passed to every worker
+    (see _worker_main). A job that exceeds its timeout or is cancelled while running has
+    its worker process terminated and replaced, so a stuck conversion can never
+    block the pool.
+    """
+    
+    def __init__(self, num_workers: int = None, job_timeout: float = 30.0,
+                 worker_options: Dict = None):
+        self.num_workers = max(1, num_workers or os.cpu_count() or 1)
+        self.job_timeout = job_timeout
+        self.worker_options = dict(worker_options or {})
+        self.pending = []          # queued jobs, FIFO
+        self.workers = []          # [process, conn, job, deadline]
+        self.cancelled = set()     # ids awaiting cancellation
+        self.lock = threading.Lock()
+        # spawn: workers are replaced while the stdin reader thread is running
+        self.ctx = mp.get_context('spawn')
+        self.wakeup_r, self.wakeup_w = self.ctx.Pipe(duplex=False)
+        for _ in range(self.num_workers):
+            self.workers.append(self._spawn())
+    
+    def _spawn(self) -> list:
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=_worker_main, args=(child_conn, self.worker_options),
+                                   daemon=True)
+        process.start()
+        child_conn.close()
+        return [process, parent_conn, None, None]
+    
+    def _replace(self, idx: int):
+        process, conn = self.workers[idx][0], self.workers[idx][1]
+        process.terminate()
+        process.join(1)
+        conn.close()
+        self.workers[idx] = self._spawn()
+    
+    def submit(self, job: Dict):
+        """Queue a job; safe to call from any thread"""
+        with self.lock:
+            self.pending.append(job)
+        self.wakeup_w.send(None)
+    
+    def cancel(self, job_id) -> bool:
+        """Request cancellation of a queued or running job; safe from any thread"""
+        with self.lock:
+            known = any(job['id'] == job_id for job in self.pending) or any(
+                w[2] is not None and w[2]['id'] == job_id for w in self.workers)
+            if known:
+                self.cancelled.add(job_id)
+        if known:
+            self.wakeup_w.send(None)
+        return known
+    
+    def outstanding(self) -> int:
+        """Number of queued and running jobs"""
+        with self.lock:
+            return len(self.pending) + sum(w[2] is not None for w in self.workers)
+    
+    def poll(self, max_wait: float = None) -> List[Dict]:
+        """Dispatch queued jobs, collect finished ones and enforce timeouts"""
+        results = []
+        with self.lock:
+            for idx, worker in enumerate(self.workers):
+                if worker[2] is None and not worker[0].is_alive():
+                    # Died between jobs (killed, out of memory): replace it before it gets one
+                    print(f"Idle worker {worker[0].pid} exited with code {worker[0].exitcode}, "
+                          f"replacing it", file=sys.stderr)
+                    self._replace(idx)
+            for job in [j for j in self.pending if j['id'] in self.cancelled]:
+                self.pending.remove(job)
+                self.cancelled.discard(job['id'])
+                results.append({'id': job['id'], 'status': 'cancelled'})
+            for idx, worker in enumerate(self.workers):
+                if worker[2] is not None and worker[2]['id'] in self.cancelled:
+                    self.cancelled.discard(worker[2]['id'])
+                    results.append({'id': worker[2]['id'], 'status': 'cancelled'})
+                    self._replace(idx)
+            for worker in self.workers:
+                if worker[2] is None and self.pending:
+                    job = self.pending.pop(0)
+                    worker[1].send(job)
+                    worker[2] = job
+                    worker[3] = time.monotonic() + float(job.get('timeout', self.job_timeout))
+            deadlines = [w[3] for w in self.workers if w[2] is not None]
+            conns = [w[1] for w in self.workers if w[2] is not None]
+        
+        timeout = 0 if results else max_wait
+        if deadlines:
+            until_deadline = max(0.0, min(deadlines) - time.monotonic())
+            timeout = until_deadline if timeout is None else min(timeout, until_deadline)
+        ready = wait_connections(conns + [self.wakeup_r], timeout)
+        
+        with self.lock:
+            if self.wakeup_r in ready:
+                while self.wakeup_r.poll():
+                    self.wakeup_r.recv()
+            now = time.monotonic()
+            for idx, worker in enumerate(self.workers):
+                process, conn, job, deadline = worker
+                if job is None:
+                    continue
+                if conn in ready:
+                    try:
+                        result = conn.recv()
+                        results.append(result)
+                        if result.get('status') != 'progress':
+                            worker[2] = worker[3] = None
+                    except (EOFError, OSError):
+                        results.append({'id': job['id'], 'status': 'error',
+                                        'error': 'worker process exited unexpectedly'})
+                        self._replace(idx)
+                elif now >= deadline:
+                    results.append({'id': job['id'], 'status': 'timeout'})
+                    self._replace(idx)
+        return results
+    
+    def close(self):
+        """Stop all worker processes"""
+        with self.lock:
+            for process, conn, _, _ in self.workers:
+                try:
+                    conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            for process, conn, _, _ in self.workers:
+                process.join(1)
+                if process.is_alive():
+                    process.terminate()
+            self.workers = []
+
+
+# Formats of the --serve metrics stream
+METRICS_FORMATS = ('jsonl', 'prometheus')
+
+
+class ConversionMetrics:
+    """Metrics of finished --serve jobs, as JSON lines or a Prometheus text file
+    
+    'jsonl' appends one line per job (id, status, elapsed time and, for
+    instrumented jobs, the per-stage profile). 'prometheus' keeps running
+    totals and rewrites path atomically after every job in the text
+    exposition format, ready for the node_exporter textfile collector.
+    """
+    
+    def __init__(self, path: str, metrics_format: str = 'jsonl'):
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format: {metrics_format} "
+                             f"(expected one of {', '.join(METRICS_FORMATS)})")
+        self.path = path
+        self.metrics_format = metrics_format
+        self.jobs = {}         # status -> count
+        self.job_seconds = [0.0, 0]
+        self.stages = {}       # stage -> [wall s, cpu s, count, peak RSS bytes]
+        self.candidates = {}   # (stage, kind) -> total
+    
+    def record(self, result: Dict):
+        """Account for one job response from ConversionWorkerPool.poll"""
+        if 'id' not in result or result['status'] == 'progress':
+            return
+        profile = result.get('profile') or {}
+        if self.metrics_format == 'jsonl':
+            line = {'time': round(time.time(), 3), 'id': result['id'], 'status': result['status'],
+                    'elapsed_ms': result.get('elapsed_ms')}
+            if profile:
+                line['profile'] = profile
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(line) + "\n")
+            return
+        
+        self.jobs[result['status']] = self.jobs.get(result['status'], 0) + 1
+        if result.get('elapsed_ms') is not None:
+            self.job_seconds[0] += result['elapsed_ms'] / 1000
+            self.job_seconds[1] += 1
+        for stage, stats in profile.get('stages', {}).items():
+            totals = self.stages.setdefault(stage, [0.0, 0.0, 0, 0])
+            totals[0] += stats['wall_ms'] / 1000
+            totals[1] += stats.get('cpu_ms', 0.0) / 1000
+            totals[2] += 1
+            totals[3] = max(totals[3], int(stats.get('rss_peak_mb', 0) * 2 ** 20))
+        for stage, counts in (profile.get('counts') or {}).items():
+            for kind, value in counts.items():
+                self.candidates[stage, kind] = self.candidates.get((stage, kind), 0) + value
+        
+        lines = ["# TYPE bim_jobs_total counter"]
+        lines += [f'bim_jobs_total{{status="{status}"}} {n}' for status, n in sorted(self.jobs.items())]
+        lines += ["# TYPE bim_job_seconds summary",
+                  f"bim_job_seconds_sum {self.job_seconds[0]:.6f}",
+                  f"bim_job_seconds_count {self.job_seconds[1]}"]
+        for name, index, kind in (('bim_stage_seconds', 0, 'summary'),
+                                  ('bim_stage_cpu_seconds', 1, 'summary'),
+                                  ('bim_stage_rss_peak_bytes', 3, 'gauge')):
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, totals in sorted(self.stages.items()):
+                if kind == 'gauge':
+                    lines.append(f'{name}{{stage="{stage}"}} {totals[index]}')
+                else:
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {totals[index]:.6f}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {totals[2]}')
+        lines.append("# TYPE bim_stage_candidates_total counter")
+        lines += [f'bim_stage_candidates_total{{stage="{stage}",kind="{kind}"}} {n}'
+                  for (stage, kind), n in sorted(self.candidates.items())]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def serve(num_workers: int = None, job_timeout: float = 30.0, worker_options: Dict = None,
+          metrics_path: str = None, metrics_format: str = 'jsonl'):
+    """Long-lived worker mode speaking newline-delimited JSON over stdin/stdout
+    
+    Requests:  {"id": ..., "input": ..., "output": ..., "scale_factor": ..., "timeout": ...,
+                plus any of WORKER_CONVERSION_OPTIONS}
+               {"id": ..., "input_base64": ..., "mesh": true, ...}  (no files touched)
+               {"op": "cancel", "id": ...}
+               {"op": "shutdown"}
+    Responses: {"id": ..., "status": "ok" | "error" | "timeout" | "cancelled", ...}
+    Successful responses carry the answering worker's cache hit/miss counters.
+    Requests with "stream": true first get one {"id": ..., "status": "progress",
+    "event": ...} line per STREAM_EVENTS entry as the conversion advances.
+    With metrics_path, jobs are instrumented and every response is also
+    recorded in a ConversionMetrics stream of metrics_format. At EOF or
+    shutdown no new jobs are accepted, but every job already submitted is
+    still answered before the workers stop.
+    """
+    metrics = None
+    if metrics_path:
+        metrics = ConversionMetrics(metrics_path, metrics_format)
+        worker_options = dict(worker_options or {}, instrument=True)
+    pool = ConversionWorkerPool(num_workers, job_timeout, worker_options)
+    out_lock = threading.Lock()
+    done = threading.Event()
+    
+    def emit(message: Dict):
+        with out_lock:
+            sys.stdout.write(json.dumps(message) + "\n")
+            sys.stdout.flush()
+    
+    def forward(results: List[Dict]):
+        for result in results:
+            emit(result)
+            if metrics is not None:
+                metrics.record(result)
+    
+    def read_requests():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                emit({'status': 'error', 'error': f'invalid request: {e}'})
+                continue
+            op = request.get('op', 'convert')
+            if op == 'shutdown':
+                break
+            elif op == 'cancel':
+                if not pool.cancel(request.get('id')):
+                    emit({'id': request.get('id'), 'status': 'error', 'error': 'unknown job'})
+            elif 'id' not in request or ('input' not in request and 'input_base64' not in request):
+                emit({'id': request.get('id'), 'status': 'error',
+                      'error': "convert requests need 'id' and 'input' or 'input_base64'"})
+            else:
+                pool.submit(request)
+        done.set()
+        pool.wakeup_w.send(None)
+    
+    reader = threading.Thread(target=read_requests, daemon=True)
+    reader.start()
+    emit({'status': 'ready', 'workers': pool.num_workers})
+    
+    try:
+        while not done.is_set():
+            forward(pool.poll())
+        # EOF or shutdown: answer every accepted job (each is bounded by its timeout)
+        while pool.outstanding():
+            forward(pool.poll())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+
+
+def expand_batch_inputs(inputs: List[str]) -> List[Tuple[str, Optional[int]]]:
+    """Resolve files, directories and glob patterns into (path, page) pairs
+    
+    Directories contribute their BATCH_EXTENSIONS files in name order.
+    Multi-page TIFFs and PDFs expand to one pair per zero-based page;
+    single-page images get page None.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)
+                                if name.lower().endswith(BATCH_EXTENSIONS)))
+        elif any(c in item for c in '*?['):
+            paths.extend(sorted(glob.glob(item)))
+        elif os.path.exists(item):
+            paths.append(item)
+        else:
+            raise ValueError(f"No such file or directory: {item}")
+    
+    loader = BlueprintTo3DBIM()
+    pages = []
+    for path in dict.fromkeys(paths):
+        count = loader.count_pages(path)
+        if count > 1 or path.lower().endswith('.pdf'):
+            pages.extend((path, page) for page in range(count))
+        else:
+            pages.append((path, None))
+    return pages
+
+
+def _sum_quantities(items: List[Dict]) -> Dict:
+    """Add up nested material_quantities dicts key by key"""
+    total = {}
+    for item in items:
+        for key, value in (item or {}).items():
+            if isinstance(value, dict):
+                total[key] = _sum_quantities([total.get(key, {}), value])
+            else:
+                total[key] = round(total.get(key, 0) + value, 2)
+    return total
+
+
+def convert_batch(inputs: List[str], output_dir: str, num_workers: int = None,
+                  job_timeout: float = 300.0, worker_options: Dict = None,
+                  report_path: str = None, out=None) -> Dict:
+    """Convert a drawing set page by page on a pool of worker processes
+    
+    inputs are files, directories or glob patterns (see expand_batch_inputs).
+    Each page is written to output_dir as <stem>[_p<page>] with the output
+    format's extension, and its worker response is written to out (default
+    stdout) as one NDJSON line as soon as it finishes. The aggregate report,
+    with totals and the material_quantities combined across all pages
+    (floors), goes to report_path (default output_dir/batch_report.json)
+    and is returned. Page numbers in names and responses start at 1.
+    """
+    out = out or sys.stdout
+    worker_options = dict(worker_options or {})
+    pages = expand_batch_inputs(inputs)
+    if not pages:
+        raise ValueError(f"No blueprint pages found in: {', '.join(inputs)}")
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = '.npz' if worker_options.get('output_format') == 'npz' else '.json'
+    
+    jobs = {}
+    names = set()
+    for path, page in pages:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if page is not None:
+            stem += f"_p{page + 1:03d}"
+        name, n = stem, 1
+        while name in names:
+            n += 1
+            name = f"{stem}_{n}"
+        names.add(name)
+        job = {'id': len(jobs), 'input': path, 'output': os.path.join(output_dir, name + suffix)}
+        if page is not None:
+            job['page'] = page
+        jobs[job['id']] = job
+    
+    start = time.perf_counter()
+    results = {}
+    pool = ConversionWorkerPool(min(num_workers or os.cpu_count() or 1, len(jobs)), job_timeout,
+                                worker_options)
+    try:
+        for job in jobs.values():
+            pool.submit(job)
+        while len(results) < len(jobs):
+            for result in pool.poll():
+                if result.get('status') == 'progress':
+                    continue
+                job = jobs[result['id']]
+                result['input'] = job['input']
+                result['page'] = job['page'] + 1 if 'page' in job else None
+                results[result['id']] = result
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        pool.close()
+    elapsed = time.perf_counter() - start
+    
+    done = [results[i] for i in sorted(results) if results[i]['status'] == 'ok']
+    report = {
+        'pages': len(jobs),
+        'converted': len(done),
+        'failed': [{k: results[i].get(k) for k in ('input', 'page', 'status', 'error')}
+                   for i in sorted(results) if results[i]['status'] != 'ok'],
+        'elapsed_s': round(elapsed, 2),
+        'pages_per_second': round(len(jobs) / elapsed, 3) if elapsed > 0 else None,
+        'workers': pool.num_workers,
+        'totals': {
+            'walls': sum(r['walls'] for r in done),
+            'rooms': sum(r['rooms'] for r in done),
+            'doors': sum(r['doors'] for r in done),
+            'windows': sum(r['windows'] for r in done),
+            'floor_area': round(sum(r['floor_area'] or 0 for r in done), 2),
+            'wall_length': round(sum(r['wall_length'] or 0 for r in done), 2),
+        },
+        'material_quantities': _sum_quantities([r['material_quantities'] for r in done]),
+        'floors': [{k: r.get(k) for k in ('input', 'page', 'output', 'walls', 'rooms', 'doors',
+                                          'windows', 'floor_area', 'wall_length')}
+                   for r in done],
+    }
+    report_path = report_path or os.path.join(output_dir, 'batch_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="2D Blueprint to 3D BIM Converter")
+    parser.add_argument('input', nargs='?',
+                        help="Blueprint image to convert ('-' reads the encoded image or a .npy "
+                             "raster from stdin; .npy files, e.g. in /dev/shm, are memory-mapped)")
+    parser.add_argument('output', nargs='?', default='output.json',
+                        help="Output path (see --format); '-' writes the model to stdout")
+    parser.add_argument('--scale-factor', type=float, default=0.05,
+                        help="Pixels to meters (default: 0.05)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Run as a long-lived NDJSON worker over stdin/stdout")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes in --serve and --batch mode (default: CPU count)")
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help="Per-job timeout in seconds in --serve and --batch mode")
+    parser.add_argument('--cache-dir', default=os.environ.get('BIM_CACHE_DIR'),
+                        help="Directory for the persistent result cache (default: $BIM_CACHE_DIR)")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="Run the detectors concurrently on this many threads (default: 1)")
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help="Process large scans in overlapping tiles of this many pixels")
+    parser.add_argument('--pyramid', type=int, default=None,
+                        help="Coarse-to-fine mode: detect the layout at 1/N resolution")
+    parser.add_argument('--profile', choices=list(PREPROCESS_PROFILES), default='accurate',
+                        help="Speed/quality preset for enhancement and preprocessing")
+    parser.add_argument('--format', dest='output_format', choices=list(EXPORT_FORMATS), default='json',
+                        help="Output format: indented JSON, compact streamed JSON or typed .npz")
+    parser.add_argument('--precision', type=int, default=None,
+                        help="Decimal places kept for floats in json-stream output")
+    parser.add_argument('--mesh', default=None,
+                        help="Also write the 3D mesh to this .glb or .obj path")
+    parser.add_argument('--preview', action='store_true', default=None,
+                        help="Write plan and axonometric PNG previews next to the output")
+    parser.add_argument('--rooms', dest='room_method', choices=list(ROOM_METHODS), default='contours',
+                        help="Find rooms from image contours or from closed wall cycles")
+    parser.add_argument('--previous-image', default=None,
+                        help="Earlier revision of the input; only the changed regions are converted")
+    parser.add_argument('--previous-model', default=None,
+                        help="Model exported from --previous-image (any --format)")
+    parser.add_argument('--diff', dest='diff_path', default=None,
+                        help="Where to write the model diff (default: <output stem>.diff.json)")
+    parser.add_argument('--instrument', action='store_true', default=None,
+                        help="Record per-stage time, CPU, peak RSS and candidate counts in metadata")
+    parser.add_argument('--metrics', default=None,
+                        help="In --serve mode, write job metrics to this file (implies --instrument)")
+    parser.add_argument('--metrics-format', choices=list(METRICS_FORMATS), default='jsonl',
+                        help="JSON lines per job, or a Prometheus text file rewritten after each job")
+    parser.add_argument('--cprofile', dest='cprofile_dir', default=None,
+                        help="Dump cProfile stats of slow conversions into this directory")
+    parser.add_argument('--cprofile-min-ms', type=float, default=0.0,
+                        help="Only dump cProfile stats of conversions taking at least this long")
+    parser.add_argument('--stream', action='store_true',
+                        help="Write NDJSON events to stdout as detectors finish (walls, rooms, "
+                             "openings, metrics), then a summary; logs go to stderr")
+    parser.add_argument('--labels', dest='label_rooms', action='store_true', default=None,
+                        help="Read the text annotations inside rooms into room labels (and names "
+                             "with pytesseract installed)")
+    parser.add_argument('--dpi', type=int, default=200,
+                        help="Resolution PDF pages are rendered at (default: 200)")
+    parser.add_argument('--batch', nargs='+', metavar='INPUT', default=None,
+                        help="Convert directories, globs and multi-page TIFF/PDF files page by page "
+                             "on --workers processes, streaming one NDJSON line per page")
+    parser.add_argument('--output-dir', default='bim_batch',
+                        help="Output directory in --batch mode (default: bim_batch)")
+    parser.add_argument('--report', default=None,
+                        help="Aggregate --batch report path (default: <output-dir>/batch_report.json)")
+    args = parser.parse_args(argv)
+    
+    worker_options = {'cache_dir': args.cache_dir, 'threads': args.threads,
+                      'tile_size': args.tile_size, 'pyramid': args.pyramid,
+                      'profile': args.profile, 'output_format': args.output_format,
+                      'precision': args.precision, 'preview': args.preview,
+                      'room_method': args.room_method, 'dpi': args.dpi,
+                      'instrument': args.instrument, 'cprofile_dir': args.cprofile_dir,
+                      'cprofile_min_ms': args.cprofile_min_ms, 'label_rooms': args.label_rooms}
+    if args.batch:
+        try:
+            report = convert_batch(args.batch, args.output_dir, args.workers, args.timeout,
+                                   worker_options, args.report)
+        except ValueError as e:
+            print(f"Error during batch processing: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Batch complete: {report['converted']}/{report['pages']} pages in "
+              f"{report['elapsed_s']} s", file=sys.stderr)
+        if report['failed']:
+            sys.exit(1)
+    elif args.serve:
+        serve(args.workers, args.timeout, worker_options, args.metrics, args.metrics_format)
+    elif args.input:
         # CLI usage for integration: python script.py <input_img> <output_json>
-        image_path = sys.argv[1]
-        output_path = sys.argv[2] if len(sys.argv) > 2 else 'output.json'
+        if args.stream and args.output == '-':
+            parser.error("--stream and output '-' both write to stdout")
+        events = model_out = None
+        if args.stream:
+            events, sys.stdout = sys.stdout, sys.stderr  # stdout carries only the events
+        elif args.output == '-':
+            model_out, sys.stdout = sys.stdout.buffer, sys.stderr  # stdout carries only the model
+        image_data = sys.stdin.buffer.read() if args.input == '-' else None
+        
+        def write_event(event: Dict):
+            events.write(json.dumps(event) + "\n")
+            events.flush()
         
-        processor = AdvancedBlueprintProcessor(scale_factor=0.05)
         try:
-            img = processor.load_blueprint(image_path)
-            enhanced = processor.load_and_enhance(image_path)
-            binary = processor.preprocess_image(enhanced)
-            
-            walls = processor.detect_walls(binary)
-            rooms = processor.detect_rooms(binary)
-            doors = processor.detect_doors(binary, walls)
-            windows = processor.detect_windows(binary)
-            
-            bim_model = processor.create_3d_model()
-            bim_model.doors = doors
-            bim_model.windows = windows
-            
-            # Calculate additional metadata
-            metrics = processor.calculate_room_metrics(rooms)
-            quantities = processor.estimate_material_quantities(bim_model)
-            bim_model.metadata.update({
-                'room_metrics': metrics,
-                'material_quantities': quantities
-            })
-            
-            processor.export_to_json(bim_model, output_path)
-            print(f"BIM processing complete: {output_path}")
+            cache = ConversionCache(args.cache_dir) if args.cache_dir else None
+            bim_model = convert_blueprint(None if image_data is not None else args.input,
+                                          None if model_out is not None else args.output,
+                                          scale_factor=args.scale_factor, cache=cache,
+                                          threads=args.threads, tile_size=args.tile_size,
+                                          pyramid=args.pyramid, profile=args.profile,
+                                          output_format=args.output_format, precision=args.precision,
+                                          mesh_path=args.mesh, preview=bool(args.preview),
+                                          room_method=args.room_method, previous_image=args.previous_image,
+                                          previous_model=args.previous_model, diff_path=args.diff_path,
+                                          dpi=args.dpi, instrument=bool(args.instrument),
+                                          cprofile_dir=args.cprofile_dir,
+                                          cprofile_min_ms=args.cprofile_min_ms,
+                                          on_event=write_event if events is not None else None,
+                                          image_data=image_data, label_rooms=bool(args.label_rooms))
+            if model_out is not None:
+                model_out.write(AdvancedBlueprintProcessor().serialize(
+                    bim_model, args.output_format, args.precision))
+                model_out.flush()
+            if events is not None:
+                write_event({'event': 'summary', 'output': args.output, **_model_summary(bim_model)})
+            print(f"BIM processing complete: {args.output}")
+            if cache is not None:
+                print(f"Cache stats: {cache.stats}")
         except Exception as e:
             print(f"Error during BIM processing: {str(e)}")
+            if events is not None:
+                write_event({'event': 'error', 'error': str(e)})
             sys.exit(1)
     else:
         # Interactive/Demo mode
@@ -695,20 +4325,25 @@ if __name__ == "__main__":
         
         processor = AdvancedBlueprintProcessor(scale_factor=0.05)
         img = processor.load_blueprint(img_path)
-        binary_img = processor.preprocess_image(img)
+        ink_img = processor.binarize(img)
+        binary_img = processor.preprocess_image(img, ink=ink_img)
         
         walls = processor.detect_walls(binary_img)
         rooms = processor.detect_rooms(binary_img)
-        doors = processor.detect_doors(binary_img, walls)
-        windows = processor.detect_windows(binary_img)
+        wall_index = WallIndex(walls, processor.params['opening_wall_tolerance'])
+        doors = processor.detect_doors(ink_img, wall_index)
+        windows = processor.detect_windows(binary_img, wall_index)
         
         print(f"Detected {len(walls)} walls, {len(rooms)} rooms, {len(doors)} doors, {len(windows)} windows")
         
-        bim_model = processor.create_3d_model(floor_height=3.0, num_floors=1)
-        bim_model.doors = doors
-        bim_model.windows = windows
+        bim_model = processor.create_3d_model(walls, rooms, floor_height=3.0, num_floors=1,
+                                              doors=doors, windows=windows)
         
         processor.generate_construction_report(bim_model, 'demo_report.txt')
         processor.export_to_json(bim_model, 'demo_model.json')
         # visualize_3d is available but usually requires UI environment
         # processor.visualize_3d(bim_model, save_path='demo_preview.png')
+
+
+if __name__ == "__main__":
+    main()
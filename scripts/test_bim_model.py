@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Columnar BIM model storage and its round-trips.
+
+Run with: python -m pytest scripts/test_bim_model.py
+"""
+
+import io
+import json
+from dataclasses import asdict
+
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import BIMModel, BlueprintTo3DBIM, Door, Room, Wall, Window
+
+WALLS = [Wall((0.0, 0.0), (6.0, 0.0), 0.2), Wall((6.0, 0.0), (6.0, 4.5), 0.25, 2.8),
+         Wall((0.0, 4.5), (0.0, 0.0))]
+ROOMS = [Room('Room 1', [(0.0, 0.0), (6.0, 0.0), (6.0, 4.5), (0.0, 4.5)], 27.0),
+         Room('Room 2', [(6.0, 0.0), (9.0, 0.0), (7.5, 3.0)], 4.5),
+         Room('Empty', [], 0.0)]
+DOORS = [Door((3.0, 0.0), 0.9, 0), Door((6.0, 2.0), 0.8)]
+WINDOWS = [Window((0.0, 2.0), 1.2, 1.4, 2)]
+
+
+def model() -> BIMModel:
+    return BIMModel(walls=WALLS, rooms=ROOMS, doors=DOORS, windows=WINDOWS, floors=2,
+                    floor_height=2.7, metadata={'scale_factor': 0.05})
+
+
+def as_json(value):
+    return json.loads(json.dumps(value))
+
+
+def test_tables_yield_the_dataclasses_they_were_built_from():
+    m = model()
+    assert list(m.walls) == WALLS
+    assert list(m.rooms) == ROOMS
+    assert list(m.doors) == DOORS
+    assert list(m.windows) == WINDOWS
+
+
+def test_to_dict_has_the_asdict_layout():
+    data = model().to_dict()
+    assert as_json(data['walls']) == as_json([asdict(w) for w in WALLS])
+    assert as_json(data['rooms']) == as_json([asdict(r) for r in ROOMS])
+    assert as_json(data['doors']) == as_json([asdict(d) for d in DOORS])
+    assert as_json(data['windows']) == as_json([asdict(w) for w in WINDOWS])
+    assert (data['floors'], data['floor_height'], data['metadata']) == (2, 2.7, {'scale_factor': 0.05})
+
+
+def test_dict_round_trip():
+    data = as_json(model().to_dict())
+    assert BIMModel.from_dict(data).to_dict() == data
+
+
+def test_vectorized_metrics_match_per_room_loops():
+    m = model()
+    assert m.walls.lengths() == pytest.approx([6.0, 4.5, 4.5])
+    for room, perimeter, centroid in zip(ROOMS, m.rooms.perimeters(), m.rooms.centroids()):
+        corners = np.array(room.corners).reshape(-1, 2)
+        if not len(corners):
+            assert perimeter == 0 and np.isnan(centroid).all()
+            continue
+        edges = np.roll(corners, -1, axis=0) - corners
+        assert perimeter == pytest.approx(np.hypot(*edges.T).sum())
+        assert centroid == pytest.approx(corners.mean(axis=0))
+
+
+@pytest.mark.parametrize('openings', [True, False])
+def test_json_stream_matches_indented_json(openings):
+    m = model() if openings else BIMModel(walls=WALLS, rooms=ROOMS)
+    converter = BlueprintTo3DBIM()
+    assert json.loads(converter.serialize(m, 'json-stream')) == json.loads(converter.serialize(m, 'json'))
+
+
+def test_json_stream_rounds_to_precision():
+    m = BIMModel(walls=[Wall((0.123456, 0.0), (1.987654, 0.0), 0.2)], rooms=[])
+    data = json.loads(BlueprintTo3DBIM().serialize(m, 'json-stream', precision=2))
+    assert data['walls'][0]['start_point'] == [0.12, 0.0]
+    assert data['walls'][0]['end_point'] == [1.99, 0.0]
+
+
+@pytest.mark.parametrize('openings', [True, False])
+def test_npz_round_trip(openings, tmp_path):
+    m = model() if openings else BIMModel(walls=WALLS, rooms=ROOMS)
+    path = str(tmp_path / 'model.npz')
+    BlueprintTo3DBIM().export(m, path, 'npz')
+    loaded = BIMModel.load(path)
+    with np.load(io.BytesIO(BlueprintTo3DBIM().serialize(m, 'npz'))) as data:
+        assert data['wall_coords'].dtype == np.float32
+        assert data['door_wall_index'].dtype == np.int32
+    # Geometry is stored as float32, so compare it to 5 decimals
+    expected, actual = m.to_dict(precision=5), loaded.to_dict(precision=5)
+    assert actual == expected
+    assert (loaded.doors is None) == (not openings)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Conversion cache hits, misses and eviction.
+
+Run with: python -m pytest scripts/test_conversion_cache.py
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from blueprint_to_3d_bim import DETECTOR_PARAMS, ConversionCache, convert_blueprint
+
+
+def plan_png() -> bytes:
+    """A 400x300 sheet with one rectangular room, PNG encoded."""
+    img = np.full((300, 400, 3), 255, np.uint8)
+    cv2.rectangle(img, (40, 40), (360, 260), (0, 0, 0), 6)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def test_memory_hit_and_miss():
+    cache = ConversionCache()
+    assert cache.get('a') is None
+    cache.put('a', '{"walls": []}')
+    assert cache.get('a') == '{"walls": []}'
+    assert cache.stats['misses'] == 1
+    assert cache.stats['memory_hits'] == 1
+    assert cache.stats['stores'] == 1
+
+
+def test_memory_evicts_least_recently_used():
+    cache = ConversionCache(max_memory_entries=2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    cache.get('a')
+    cache.put('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ConversionCache(str(tmp_path)).put('ab12', 'A')
+    cache = ConversionCache(str(tmp_path))
+    assert cache.get('ab12') == 'A'
+    assert cache.stats['disk_hits'] == 1
+    assert cache.get('ab12') == 'A'
+    assert cache.stats['memory_hits'] == 1
+
+
+def test_disk_evicts_oldest_files(tmp_path):
+    cache = ConversionCache(str(tmp_path), max_disk_bytes=250)
+    for i, key in enumerate(('aa01', 'bb02')):
+        cache.put(key, 'x' * 100)
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    cache.put('cc03', 'x' * 100)
+    assert not os.path.exists(cache._path('aa01'))
+    assert os.path.exists(cache._path('bb02'))
+    assert os.path.exists(cache._path('cc03'))
+    assert cache.stats['evictions'] == 1
+
+
+def test_key_covers_image_scale_and_params():
+    cache = ConversionCache()
+    key = cache.make_key(b'image', 0.05, DETECTOR_PARAMS)
+    assert key == cache.make_key(b'image', 0.05, dict(DETECTOR_PARAMS))
+    assert key != cache.make_key(b'other', 0.05, DETECTOR_PARAMS)
+    assert key != cache.make_key(b'image', 0.02, DETECTOR_PARAMS)
+    assert key != cache.make_key(b'image', 0.05, dict(DETECTOR_PARAMS, door_match_threshold=0.5))
+
+
+def test_convert_serves_second_run_from_cache(tmp_path):
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    data = plan_png()
+    first = convert_blueprint('plan.png', str(tmp_path / 'first.json'), cache=cache, image_data=data)
+    second = convert_blueprint('plan.png', str(tmp_path / 'second.json'), cache=cache, image_data=data)
+    assert cache.stats['misses'] == 1
+    assert cache.stats['memory_hits'] == 1
+    assert (tmp_path / 'first.json').read_text() == (tmp_path / 'second.json').read_text()
+    assert len(second.walls) == len(first.walls) > 0
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Door candidate peak finding and non-maximum suppression.
+
+Run with: python -m pytest scripts/test_door_nms.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import AdvancedBlueprintProcessor, BlueprintPipeline, Door
+
+SCALE = 0.05
+
+
+def brute_force_nms(doors, min_distance):
+    kept = []
+    for door in doors:
+        if all(np.hypot(door.position[0] - k.position[0], door.position[1] - k.position[1]) >= min_distance
+               for k in kept):
+            kept.append(door)
+    return kept
+
+
+def test_score_peaks_are_local_maxima_strongest_first():
+    score = np.zeros((60, 60), np.float32)
+    score[10, 10], score[12, 11] = 0.9, 0.8   # the weaker one is inside the first's window
+    score[40, 45] = 0.95
+    score[50, 10] = 0.5                        # below threshold
+    xs, ys, scores = AdvancedBlueprintProcessor(SCALE)._find_score_peaks(score, 0.7, 5)
+    assert list(zip(xs, ys)) == [(45, 40), (10, 10)]
+    assert scores == pytest.approx([0.95, 0.9])
+
+
+@pytest.mark.parametrize('min_distance', [0.5, 1.0, 2.5])
+def test_grid_nms_matches_brute_force(min_distance):
+    rng = np.random.default_rng(0)
+    doors = [Door(position=tuple(p)) for p in rng.uniform(0, 20, (300, 2))]
+    kept = AdvancedBlueprintProcessor(SCALE)._remove_duplicate_doors(doors, min_distance)
+    assert [d.position for d in kept] == [d.position for d in brute_force_nms(doors, min_distance)]
+
+
+def test_one_swing_gives_one_door_at_its_hinge():
+    img = np.full((300, 300, 3), 255, np.uint8)
+    cv2.rectangle(img, (20, 20), (280, 280), (0, 0, 0), 6)
+    cv2.line(img, (20, 150), (130, 150), (0, 0, 0), 6)
+    cv2.line(img, (148, 150), (280, 150), (0, 0, 0), 6)
+    # An 18 px (0.9 m) swing hinged at (148, 150) into the lower room, leaf drawn open
+    cv2.ellipse(img, (148, 150), (18, 18), 0, 90, 180, (0, 0, 0), 1)
+    cv2.line(img, (148, 150), (148, 168), (0, 0, 0), 2)
+    doors = BlueprintPipeline(AdvancedBlueprintProcessor(SCALE), image=img).get('doors')
+    assert len(doors) == 1
+    assert np.hypot(doors[0].position[0] / SCALE - 148, doors[0].position[1] / SCALE - 150) <= 3
+    assert doors[0].width == pytest.approx(0.9, abs=2 * SCALE)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+In-memory input: encoded bytes, .npy rasters, stdin and base64 serve jobs.
+
+Run with: python -m pytest scripts/test_memory_input.py
+"""
+
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import AdvancedBlueprintProcessor, BIMModel, _npy_view, convert_blueprint
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blueprint_to_3d_bim.py')
+
+
+def plan() -> np.ndarray:
+    img = np.full((300, 400, 3), 255, np.uint8)
+    cv2.rectangle(img, (40, 40), (360, 260), (0, 0, 0), 6)
+    cv2.line(img, (200, 40), (200, 260), (0, 0, 0), 6)
+    return img
+
+
+def npy_bytes(img: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, img)
+    return buffer.getvalue()
+
+
+def run(args, stdin: bytes):
+    proc = subprocess.run([sys.executable, SCRIPT, *args], input=stdin, capture_output=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr.decode()
+    return proc.stdout
+
+
+def test_npy_bytes_are_viewed_without_copying():
+    data = bytearray(npy_bytes(plan()))
+    view = _npy_view(data)
+    assert np.array_equal(view, plan())
+    assert np.shares_memory(view, np.frombuffer(data, np.uint8))
+
+
+@pytest.mark.parametrize('gray', [False, True])
+def test_decode_accepts_encoded_and_raw_rasters(gray):
+    img = cv2.cvtColor(plan(), cv2.COLOR_BGR2GRAY) if gray else plan()
+    processor = AdvancedBlueprintProcessor()
+    assert np.array_equal(processor.decode_blueprint(npy_bytes(img)), plan())
+    assert np.array_equal(processor.decode_blueprint(cv2.imencode('.png', img)[1].tobytes()), plan())
+
+
+def test_png_and_npy_data_convert_like_the_file(tmp_path):
+    cv2.imwrite(str(tmp_path / 'plan.png'), plan())
+    expected = convert_blueprint(str(tmp_path / 'plan.png'), None).to_dict()
+    for data in (cv2.imencode('.png', plan())[1].tobytes(), npy_bytes(plan())):
+        assert convert_blueprint('plan', None, image_data=data).to_dict()['walls'] == expected['walls']
+
+
+@pytest.mark.parametrize('data', [cv2.imencode('.png', plan())[1].tobytes(), npy_bytes(plan())],
+                         ids=['png', 'npy'])
+def test_cli_reads_stdin_and_writes_stdout(data):
+    model = json.loads(run(['-', '-'], data))
+    assert len(model['walls']) == len(convert_blueprint('plan', None, image_data=data).walls) > 0
+
+
+def test_cli_writes_npz_to_stdout(tmp_path):
+    (tmp_path / 'model.npz').write_bytes(run(['-', '-', '--format', 'npz'], npy_bytes(plan())))
+    assert len(BIMModel.load(str(tmp_path / 'model.npz')).walls) > 0
+
+
+def test_cli_rejects_streaming_to_stdout():
+    proc = subprocess.run([sys.executable, SCRIPT, '-', '-', '--stream'], input=b'', capture_output=True,
+                          timeout=120)
+    assert proc.returncode == 2
+
+
+def test_serve_converts_base64_without_files():
+    job = {'id': 1, 'input_base64': base64.b64encode(npy_bytes(plan())).decode(), 'mesh': True}
+    out = run(['--serve', '--workers', '1'], (json.dumps(job) + "\n").encode())
+    result = json.loads(out.decode().splitlines()[-1])
+    assert result['status'] == 'ok'
+    assert result['model']['walls']
+    assert base64.b64decode(result['mesh_base64'])[:4] == b'glTF'
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Vectorized parallel line merge against the legacy pairwise merge.
+
+Run with: python -m pytest scripts/test_merge_parallel_lines.py
+"""
+
+import numpy as np
+import pytest
+
+from bim_benchmark import legacy_merge_parallel_lines, synthetic_hough_lines
+from blueprint_to_3d_bim import BlueprintTo3DBIM
+
+
+def merge(lines, **kwargs):
+    return BlueprintTo3DBIM()._merge_parallel_lines(np.array(lines, dtype=np.int32), **kwargs)
+
+
+def normalized(segments) -> np.ndarray:
+    """Segments as sorted rows with their endpoints in lexicographic order."""
+    rows = [sorted([tuple(s[:2]), tuple(s[2:])]) for s in np.asarray(segments, dtype=float).reshape(-1, 4)]
+    return np.array(sorted(np.ravel(r).tolist() for r in rows))
+
+
+@pytest.mark.parametrize('lines', [
+    [[0, 100, 200, 100], [150, 102, 400, 102], [380, 99, 600, 99]],  # fragments of one wall
+    [[0, 100, 400, 100], [0, 160, 400, 160]],                         # two parallel walls
+    [[0, 100, 400, 100], [200, 0, 200, 300]],                         # perpendicular walls
+    [[10, 20, 300, 20]],                                              # a single segment
+])
+def test_matches_legacy_on_axis_aligned_walls(lines):
+    merged = merge(lines)
+    legacy = legacy_merge_parallel_lines(np.array(lines, dtype=np.int32))
+    assert len(merged) == len(legacy)
+    # x extents only: legacy puts a merged wall at its smallest y, the vector merge at the mean
+    assert normalized(merged)[:, [0, 2]] == pytest.approx(normalized(legacy)[:, [0, 2]], abs=0.5)
+
+
+def test_single_segment_keeps_exact_endpoints():
+    assert np.array_equal(np.reshape(merge([[10, 20, 300, 25]]), -1), [10, 20, 300, 25])
+
+
+def test_diagonal_wall_stays_on_its_axis():
+    # Falling diagonal: the legacy bounding box turns it into a rising one
+    lines = [[0, 300, 150, 150], [140, 160, 300, 0]]
+    merged = np.reshape(merge(lines), -1)
+    legacy = np.reshape(legacy_merge_parallel_lines(np.array(lines, dtype=np.int32)), -1)
+    assert np.array_equal(legacy, [0, 0, 300, 300])
+    assert normalized([merged]).ravel() == pytest.approx([0, 300, 300, 0], abs=1.0)
+
+
+def test_collinear_pieces_across_a_gap_stay_apart():
+    lines = [[0, 100, 100, 100], [300, 100, 400, 100]]
+    assert len(legacy_merge_parallel_lines(np.array(lines, dtype=np.int32))) == 1
+    assert len(merge(lines)) == 2
+
+
+def test_groups_map_every_input_onto_a_nearby_output():
+    lines = synthetic_hough_lines(500)
+    merged, groups = merge(lines, return_groups=True)
+    merged = np.asarray(merged, dtype=float).reshape(-1, 4)
+    assert len(groups) == 500 and groups.max() == len(merged) - 1
+    segments = lines.reshape(-1, 4).astype(float)
+    p0, p1 = merged[groups, :2], merged[groups, 2:]
+    u = (p1 - p0) / np.linalg.norm(p1 - p0, axis=1, keepdims=True)
+    for point in (segments[:, :2], segments[:, 2:]):
+        offset = point - p0
+        across = np.abs(offset[:, 0] * u[:, 1] - offset[:, 1] * u[:, 0])
+        assert across.max() <= 20.0  # twice distance_threshold
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Incremental reconversion of revised sheets and the model diff.
+
+Run with: python -m pytest scripts/test_reconvert.py
+"""
+
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import (
+    AdvancedBlueprintProcessor, BIMModel, BlueprintPipeline, Door, Room, Wall, convert_blueprint
+)
+
+SCALE = 0.05
+
+
+def sheet(split: bool = False) -> np.ndarray:
+    """Two 14 x 18 m rooms; the revision splits the right one in half."""
+    img = np.full((400, 600, 3), 255, np.uint8)
+    cv2.rectangle(img, (20, 20), (580, 380), (0, 0, 0), 6)
+    cv2.line(img, (300, 20), (300, 380), (0, 0, 0), 6)
+    if split:
+        cv2.line(img, (300, 200), (580, 200), (0, 0, 0), 6)
+    return img
+
+
+def convert(img: np.ndarray) -> BIMModel:
+    return convert_blueprint('plan.png', None, SCALE, image_data=cv2.imencode('.png', img)[1].tobytes())
+
+
+def test_diff_matches_records_and_ignores_wall_index():
+    walls = [Wall((0.0, 0.0), (5.0, 0.0)), Wall((5.0, 0.0), (5.0, 4.0))]
+    rooms = [Room('Room_0', [(0.0, 0.0), (5.0, 0.0), (5.0, 4.0)], 10.0)]
+    before = BIMModel(walls=walls, rooms=rooms, doors=[Door((2.0, 0.0), wall_index=0)], windows=[])
+    after = BIMModel(walls=[walls[1], Wall((0.0, 0.0), (6.0, 0.0))], rooms=rooms,
+                     doors=[Door((2.0, 0.0), wall_index=1)], windows=[])
+    diff = after.diff(before)
+    assert diff['walls']['removed'] == [0]
+    assert [(w['index'], w['end_point']) for w in diff['walls']['added']] == [(1, [6.0, 0.0])]
+    assert diff['walls']['unchanged'] == 1
+    assert diff['rooms'] == {'added': [], 'removed': [], 'unchanged': 1}
+    assert diff['doors'] == {'added': [], 'removed': [], 'unchanged': 1}
+
+
+def test_find_changed_regions_aligns_shifted_scans():
+    processor = AdvancedBlueprintProcessor(SCALE)
+    shift, boxes = processor.find_changed_regions(sheet(True), np.roll(sheet(True), (5, 7), axis=(0, 1)))
+    assert shift == (7.0, 5.0)
+    assert boxes == []
+
+
+def test_unchanged_sheet_keeps_the_previous_model():
+    previous = convert(sheet())
+    detected = AdvancedBlueprintProcessor(SCALE).reconvert(sheet(), previous, sheet())
+    assert detected['changed_regions'] == []
+    assert len(detected['walls']) == len(previous.walls)
+    assert [r.name for r in detected['rooms']] == previous.rooms.names
+
+
+def test_reconvert_matches_a_full_conversion():
+    processor = AdvancedBlueprintProcessor(SCALE)
+    previous = convert(sheet())
+    detected = processor.reconvert(sheet(), previous, sheet(True))
+    full = BlueprintPipeline(processor, image=sheet(True)).run_detectors()
+    # Only the new wall's neighbourhood is detected again
+    (x0, y0, x1, y1), = detected['changed_regions']
+    assert x0 > 10 and y0 > 5 and y1 < 15
+    assert len(detected['walls']) == len(full['walls'])
+    assert sorted(r.area for r in detected['rooms']) == pytest.approx(sorted(r.area for r in full['rooms']))
+    # The untouched left room keeps its name
+    left = [r.name for r in previous.rooms if np.mean(r.corners, axis=0)[0] < 15]
+    assert set(left) <= {r.name for r in detected['rooms']}
+
+
+def test_convert_writes_the_diff(tmp_path):
+    cv2.imwrite(str(tmp_path / 'v1.png'), sheet())
+    cv2.imwrite(str(tmp_path / 'v2.png'), sheet(True))
+    convert_blueprint(str(tmp_path / 'v1.png'), str(tmp_path / 'v1.json'), SCALE)
+    convert_blueprint(str(tmp_path / 'v2.png'), str(tmp_path / 'v2.json'), SCALE,
+                      previous_image=str(tmp_path / 'v1.png'), previous_model=str(tmp_path / 'v1.json'))
+    diff = json.loads((tmp_path / 'v2.diff.json').read_text())
+    assert len(diff['walls']['added']) == 1 and diff['walls']['removed'] == []
+    assert len(diff['rooms']['added']) == 2 and len(diff['rooms']['removed']) == 1
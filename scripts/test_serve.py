@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+The --serve NDJSON protocol: conversions, errors, timeouts and cancellation.
+
+Run with: python -m pytest scripts/test_serve.py
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blueprint_to_3d_bim.py')
+
+
+def plan_png() -> bytes:
+    img = np.full((300, 400, 3), 255, np.uint8)
+    cv2.rectangle(img, (40, 40), (360, 260), (0, 0, 0), 6)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def serve(requests, *args):
+    """Feed requests to a one-worker server until EOF; returns its responses"""
+    lines = [r if isinstance(r, str) else json.dumps(r) for r in requests]
+    proc = subprocess.run([sys.executable, SCRIPT, '--serve', '--workers', '1', *args],
+                          input="\n".join(lines) + "\n", capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return [json.loads(line) for line in proc.stdout.splitlines()]
+
+
+def by_id(responses):
+    return {r['id']: r for r in responses if r.get('status') not in ('ready', 'progress') and 'id' in r}
+
+
+def test_converts_files_and_inline_images(tmp_path):
+    (tmp_path / 'plan.png').write_bytes(plan_png())
+    responses = serve([
+        {'id': 'file', 'input': str(tmp_path / 'plan.png'), 'output': str(tmp_path / 'plan.json')},
+        {'id': 'inline', 'input_base64': base64.b64encode(plan_png()).decode()},
+    ])
+    assert responses[0] == {'status': 'ready', 'workers': 1}
+    results = by_id(responses)
+    assert results['file']['status'] == 'ok'
+    assert json.loads((tmp_path / 'plan.json').read_text())['walls']
+    assert results['inline']['status'] == 'ok'
+    assert results['inline']['model']['walls']
+
+
+def test_malformed_requests_get_errors():
+    responses = serve([
+        'not json',
+        {'id': 'no-input'},
+        {'op': 'cancel', 'id': 'nobody'},
+        {'id': 'missing', 'input': '/nonexistent/plan.png'},
+    ])
+    assert any(r['status'] == 'error' and 'invalid request' in r['error'] for r in responses)
+    results = by_id(responses)
+    assert results['no-input']['status'] == 'error'
+    assert results['nobody'] == {'id': 'nobody', 'status': 'error', 'error': 'unknown job'}
+    assert results['missing']['status'] == 'error'
+
+
+def test_timeout_and_cancel_replace_the_worker():
+    image = base64.b64encode(plan_png()).decode()
+    responses = serve([
+        {'id': 'slow', 'input_base64': image, 'timeout': 0.001},
+        {'id': 'queued', 'input_base64': image},
+        {'op': 'cancel', 'id': 'queued'},
+        {'id': 'after', 'input_base64': image},
+    ])
+    results = by_id(responses)
+    assert results['slow']['status'] == 'timeout'
+    assert results['queued']['status'] == 'cancelled'
+    # The replacement worker still answers
+    assert results['after']['status'] == 'ok'
+
+
+def test_shutdown_answers_accepted_jobs_first():
+    image = base64.b64encode(plan_png()).decode()
+    responses = serve([{'id': 'a', 'input_base64': image}, {'op': 'shutdown'}, {'id': 'ignored'}])
+    results = by_id(responses)
+    assert results['a']['status'] == 'ok'
+    assert 'ignored' not in results
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Progressive conversion events, in process, from the cache and over the CLI.
+
+Run with: python -m pytest scripts/test_stream_events.py
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+
+from blueprint_to_3d_bim import STREAM_EVENTS, ConversionCache, convert_blueprint
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blueprint_to_3d_bim.py')
+
+
+def plan_png() -> bytes:
+    """Two rooms with a door swing in the partition."""
+    img = np.full((400, 600, 3), 255, np.uint8)
+    cv2.rectangle(img, (20, 20), (580, 380), (0, 0, 0), 6)
+    cv2.line(img, (300, 20), (300, 180), (0, 0, 0), 6)
+    cv2.line(img, (300, 198), (300, 380), (0, 0, 0), 6)
+    cv2.ellipse(img, (300, 198), (18, 18), 0, 180, 270, (0, 0, 0), 1)
+    cv2.line(img, (300, 198), (282, 198), (0, 0, 0), 2)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def convert(**kwargs):
+    events = []
+    model = convert_blueprint('plan.png', None, image_data=plan_png(), on_event=events.append, **kwargs)
+    return events, model
+
+
+def test_events_arrive_in_order_and_match_the_model():
+    events, model = convert()
+    assert tuple(e['event'] for e in events) == STREAM_EVENTS
+    walls, rooms, openings, metrics = events
+    data = json.loads(json.dumps(model.to_dict()))
+    assert walls['walls'] == data['walls']
+    assert rooms['rooms'] == data['rooms']
+    assert openings['doors'] == data['doors'] and len(openings['doors']) == 1
+    assert openings['windows'] == data['windows']
+    assert metrics['total_floor_area'] == model.metadata['total_floor_area']
+
+
+def test_cache_hits_replay_the_same_events():
+    cache = ConversionCache()
+    first, _ = convert(cache=cache)
+    second, _ = convert(cache=cache)
+    assert cache.stats['memory_hits'] == 1
+    assert json.loads(json.dumps(second)) == json.loads(json.dumps(first))
+
+
+def test_cli_stream_writes_only_events_to_stdout(tmp_path):
+    (tmp_path / 'plan.png').write_bytes(plan_png())
+    proc = subprocess.run([sys.executable, SCRIPT, str(tmp_path / 'plan.png'), str(tmp_path / 'plan.json'),
+                           '--stream'], capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    events = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [e['event'] for e in events] == list(STREAM_EVENTS) + ['summary']
+    assert events[-1]['output'] == str(tmp_path / 'plan.json')
+    assert events[0]['walls'] == json.loads((tmp_path / 'plan.json').read_text())['walls']
+
+
+def test_cli_stream_reports_errors_as_events(tmp_path):
+    proc = subprocess.run([sys.executable, SCRIPT, str(tmp_path / 'missing.png'), str(tmp_path / 'out.json'),
+                           '--stream'], capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 1
+    assert json.loads(proc.stdout.splitlines()[-1])['event'] == 'error'
+
+
+def test_serve_streams_progress_before_the_result():
+    request = {'id': 'job', 'input_base64': base64.b64encode(plan_png()).decode(), 'stream': True}
+    proc = subprocess.run([sys.executable, SCRIPT, '--serve', '--workers', '1'],
+                          input=json.dumps(request) + "\n", capture_output=True, text=True, timeout=120)
+    responses = [json.loads(line) for line in proc.stdout.splitlines()][1:]
+    assert [r.get('event') for r in responses] == list(STREAM_EVENTS) + [None]
+    assert [r['status'] for r in responses] == ['progress'] * len(STREAM_EVENTS) + ['ok']
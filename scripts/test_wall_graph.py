@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Wall graph junctions and the rooms traced from its faces.
+
+Run with: python -m pytest scripts/test_wall_graph.py
+"""
+
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import Wall, WallGraph
+
+
+def walls(*segments):
+    return [Wall((x1, y1), (x2, y2)) for x1, y1, x2, y2 in segments]
+
+
+# A 10 x 6 m outline whose corners don't quite meet, as detected walls rarely do
+OUTLINE = [(0, 0, 10, 0), (10.1, 0.1, 10, 6), (10, 6, 0, 6.1), (0, 6, 0.1, 0.1)]
+
+
+def areas(graph, **kwargs):
+    return sorted(round(abs(polygon_area(f)), 1) for f in graph.faces(**kwargs))
+
+
+def polygon_area(points):
+    x, y = np.asarray(points).T
+    return 0.5 * (x @ np.roll(y, -1) - y @ np.roll(x, -1))
+
+
+def test_snapped_outline_is_one_room():
+    graph = WallGraph(walls(*OUTLINE), tolerance=0.3)
+    assert len(graph.nodes) == 4
+    assert graph.degree().tolist() == [2, 2, 2, 2]
+    faces = graph.faces()
+    assert len(faces) == 1
+    assert abs(polygon_area(faces[0])) == pytest.approx(60, abs=1.5)
+
+
+def test_t_junction_splits_the_outline():
+    # The partition stops just short of both long walls
+    graph = WallGraph(walls(*OUTLINE, (4, 0.2, 4, 5.9)), tolerance=0.3)
+    assert len(graph) == 7
+    assert sorted(graph.degree().tolist()) == [2, 2, 2, 2, 3, 3]
+    assert areas(graph) == pytest.approx([24, 36], abs=1.0)
+    # The junctions on the long walls are straight and leave only the four corners
+    assert sorted(len(f) for f in graph.faces()) == [4, 4]
+
+
+def test_crossing_walls_split_into_four_rooms():
+    graph = WallGraph(walls(*OUTLINE, (5, 0, 5, 6), (0, 3, 10, 3)), tolerance=0.3)
+    assert graph.degree().max() == 4
+    assert areas(graph) == pytest.approx([15, 15, 15, 15], abs=0.6)
+
+
+def test_dangling_stub_bounds_nothing():
+    graph = WallGraph(walls(*OUTLINE, (4, 0, 4, 2.5)), tolerance=0.3)
+    assert areas(graph) == pytest.approx([60], abs=1.5)
+
+
+@pytest.mark.parametrize('bridge, expected', [(0.0, [60]), (1.2, [24, 36])])
+def test_bridges_close_rooms_across_door_gaps(bridge, expected):
+    # The partition has a 0.9 m door gap
+    graph = WallGraph(walls(*OUTLINE, (4, 0, 4, 2.5), (4, 3.4, 4, 6)), tolerance=0.3, bridge=bridge)
+    assert len(graph.bridges) == (1 if bridge else 0)
+    assert areas(graph) == pytest.approx(expected, abs=1.5)
+
+
+def test_min_area_skips_small_faces():
+    graph = WallGraph(walls(*OUTLINE, (9, 0, 9, 1), (9, 1, 10, 1)), tolerance=0.3)
+    assert areas(graph) == pytest.approx([1, 59], abs=1.0)
+    assert areas(graph, min_area=2.0) == pytest.approx([59], abs=1.0)
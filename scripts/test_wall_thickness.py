@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Wall thickness measurement against walls of known width.
+
+Run with: python -m pytest scripts/test_wall_thickness.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from blueprint_to_3d_bim import AdvancedBlueprintProcessor, BlueprintPipeline
+
+SCALE = 0.05
+SIZE = 600
+
+
+def wall_sheet(width_px: int, diagonal: bool = False) -> np.ndarray:
+    """A white sheet with one 400 px black wall, rasterized by pixel centre."""
+    yy, xx = np.mgrid[0:SIZE, 0:SIZE].astype(float)
+    if diagonal:
+        across = np.abs(yy - xx) / np.sqrt(2)
+        along = (xx + yy - SIZE) / np.sqrt(2)
+    else:
+        across = np.abs(yy - (SIZE - 1) / 2)
+        along = xx - SIZE / 2
+    ink = (across < width_px / 2) & (np.abs(along) < 200)
+    return cv2.cvtColor(np.where(ink, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+def detect(image: np.ndarray):
+    return BlueprintPipeline(AdvancedBlueprintProcessor(SCALE), image=image).get('walls')
+
+
+@pytest.mark.parametrize('width_px', [4, 6, 8, 10, 12])
+def test_axis_aligned_width(width_px):
+    walls = detect(wall_sheet(width_px))
+    assert len(walls) == 1
+    assert walls[0].thickness == pytest.approx(width_px * SCALE, abs=0.01)
+
+
+@pytest.mark.parametrize('width_px', [6, 8, 10, 12])
+def test_diagonal_width(width_px):
+    walls = detect(wall_sheet(width_px, diagonal=True))
+    assert len(walls) == 1
+    assert walls[0].thickness == pytest.approx(width_px * SCALE, abs=SCALE + 0.01)
+
+
+def test_no_ink_defaults():
+    processor = AdvancedBlueprintProcessor(SCALE)
+    distance = np.zeros((100, 100), np.float32)
+    lines = np.array([[10, 50, 90, 50]], dtype=float)
+    assert processor.measure_wall_thickness(lines, distance)[0] == pytest.approx(0.2)
@@ -1,4 +1,3 @@
-
 import express from 'express';
 import cors from 'cors';
 import dotenv from 'dotenv';
@@ -6,7 +5,9 @@ import helmet from 'helmet';
 import morgan from 'morgan';
 import axios from 'axios';
 import { createClient } from '@supabase/supabase-js';
-import { exec } from 'child_process';
+import { spawn } from 'child_process';
+import readline from 'readline';
+import crypto from 'crypto';
 import fs from 'fs';
 import path from 'path';
 import { fileURLToPath } from 'url';
@@ -41,6 +42,223 @@ app.use((req, res, next) => {
     next();
 });
 
+// --- BIM WORKER ---
+// One long-lived Python process (with its own pool of warm converters) handles every
+// conversion, so requests no longer pay interpreter startup and OpenCV/NumPy imports.
+const BIM_SCRIPT_PATH = path.join(__dirname, '..', 'scripts', 'blueprint_to_3d_bim.py');
+const BIM_JOB_TIMEOUT_MS = 30000;
+// A worker that has not reported ready by then (stuck importing, hung interpreter) is killed
+const BIM_STARTUP_TIMEOUT_MS = 60000;
+const BIM_WORKERS = process.env.BIM_WORKERS || '';
+// Threads per conversion for running the detectors concurrently
+const BIM_THREADS = process.env.BIM_THREADS || '';
+// Repeat uploads of the same blueprint are answered from this content-addressed cache
+const BIM_CACHE_DIR = process.env.BIM_CACHE_DIR || path.join(__dirname, 'cache', 'bim');
+// 'npz' (typed columns, sliced without a JSON parse), 'json-stream' or 'json'
+const BIM_OUTPUT_FORMAT = process.env.BIM_OUTPUT_FORMAT || 'npz';
+// Per-stage metrics of every job; a .prom path gets the Prometheus text format, anything else JSON lines
+const BIM_METRICS = process.env.BIM_METRICS || '';
+// 'memory' hands the upload to the worker and gets the model and mesh back over the pipe;
+// 'files' round-trips them through temp files (and BIM_OUTPUT_FORMAT) as before
+const BIM_TRANSPORT = process.env.BIM_TRANSPORT || 'memory';
+
+let bimWorker = null;
+const bimPendingJobs = new Map();
+
+function startBimWorker(pythonCmds = ['python', 'python3']) {
+    const [pythonCmd, ...fallbacks] = pythonCmds;
+    const args = [BIM_SCRIPT_PATH, '--serve', '--timeout', String(BIM_JOB_TIMEOUT_MS / 1000),
+        '--cache-dir', BIM_CACHE_DIR];
+    if (BIM_WORKERS) args.push('--workers', BIM_WORKERS);
+    if (BIM_THREADS) args.push('--threads', BIM_THREADS);
+    if (BIM_METRICS) {
+        args.push('--metrics', BIM_METRICS,
+            '--metrics-format', BIM_METRICS.endsWith('.prom') ? 'prometheus' : 'jsonl');
+    }
+
+    console.log(`Starting BIM worker: ${pythonCmd} ${args.join(' ')}`);
+    const child = spawn(pythonCmd, args, { stdio: ['pipe', 'pipe', 'pipe'] });
+    const worker = { child, ready: null };
+    let settled = false;
+
+    worker.ready = new Promise((resolve, reject) => {
+        const startupTimer = setTimeout(() => {
+            fail(new Error(`BIM worker not ready after ${BIM_STARTUP_TIMEOUT_MS / 1000} s`));
+            child.kill();
+        }, BIM_STARTUP_TIMEOUT_MS);
+        const settle = () => {
+            settled = true;
+            clearTimeout(startupTimer);
+        };
+        function fail(err) {
+            if (settled) return;
+            settle();
+            if (bimWorker === worker) bimWorker = null;
+            reject(err);
+        }
+
+        child.once('error', (err) => {
+            // Try 'python' then 'python3'
+            if (err.code === 'ENOENT' && fallbacks.length > 0 && !settled) {
+                console.error(`BIM worker: ${pythonCmd} not found, trying ${fallbacks[0]}`);
+                settle();
+                bimWorker = startBimWorker(fallbacks);
+                bimWorker.ready.then(resolve, reject);
+                return;
+            }
+            fail(err);
+        });
+        // Exiting before 'ready' (missing OpenCV, import error, bad arguments) fails startup
+        child.on('exit', (code) => fail(new Error(`BIM worker exited with code ${code} before it was ready`)));
+
+        readline.createInterface({ input: child.stdout }).on('line', (line) => {
+            let message;
+            try {
+                message = JSON.parse(line);
+            } catch (e) {
+                console.log('BIM worker:', line);
+                return;
+            }
+            if (message.status === 'ready') {
+                console.log(`BIM worker ready with ${message.workers} processes`);
+                settle();
+                return resolve();
+            }
+            const job = bimPendingJobs.get(String(message.id));
+            if (job && message.status === 'progress') {
+                // Partial results of a streamed job; the final message follows
+                if (job.onProgress) job.onProgress(message);
+            } else if (job) {
+                bimPendingJobs.delete(String(message.id));
+                job.resolve(message);
+            }
+        });
+    });
+
+    child.stderr.on('data', (data) => console.error('BIM worker STDERR:', data.toString().trim()));
+    child.on('exit', (code) => {
+        console.error(`BIM worker exited with code ${code}`);
+        if (bimWorker && bimWorker.child === child) bimWorker = null;
+        for (const [id, job] of bimPendingJobs) {
+            job.resolve({ id, status: 'error', error: 'BIM worker exited' });
+        }
+        bimPendingJobs.clear();
+    });
+
+    return worker;
+}
+
+// onProgress, if given, receives the worker's progress events ({event: 'walls', walls: [...]}, ...)
+async function runBimJob(job, onProgress) {
+    if (!bimWorker) bimWorker = startBimWorker();
+    const worker = bimWorker;
+    try {
+        await worker.ready;
+    } catch (err) {
+        // The next request starts a fresh worker
+        if (bimWorker === worker) bimWorker = null;
+        return { id: String(job.id), status: 'error', error: `BIM worker failed to start: ${err.message}` };
+    }
+
+    return new Promise((resolve) => {
+        const id = String(job.id);
+        if (!bimWorker) return resolve({ id, status: 'error', error: 'BIM worker exited' });
+        bimPendingJobs.set(id, { resolve, onProgress });
+        bimWorker.child.stdin.write(JSON.stringify({ ...job, id }) + '\n');
+    });
+}
+
+function cancelBimJob(id) {
+    if (bimWorker && bimPendingJobs.has(String(id))) {
+        bimWorker.child.stdin.write(JSON.stringify({ op: 'cancel', id: String(id) }) + '\n');
+    }
+}
+
+// --- NPZ READER ---
+// Reads the uncompressed .npz written by export_to_npz: entries are located through the
+// zip central directory and exposed as typed arrays over the file buffer.
+const NPY_DTYPES = { '<f4': Float32Array, '<f8': Float64Array, '<i4': Int32Array, '|u1': Uint8Array };
+
+function parseNpy(bytes) {
+    const major = bytes[6];
+    const headerStart = major === 1 ? 10 : 12;
+    const headerLen = major === 1 ? bytes.readUInt16LE(8) : bytes.readUInt32LE(8);
+    const header = bytes.toString('latin1', headerStart, headerStart + headerLen);
+    const descr = /'descr':\s*'([^']+)'/.exec(header)[1];
+    const shape = /'shape':\s*\(([^)]*)\)/.exec(header)[1].split(',').filter(s => s.trim()).map(Number);
+    const Type = NPY_DTYPES[descr];
+    if (!Type) throw new Error(`Unsupported npy dtype ${descr}`);
+
+    const count = shape.reduce((a, b) => a * b, 1);
+    const offset = bytes.byteOffset + headerStart + headerLen;
+    // Typed arrays need aligned offsets; copy only when the entry is misaligned
+    const data = offset % Type.BYTES_PER_ELEMENT === 0
+        ? new Type(bytes.buffer, offset, count)
+        : new Type(bytes.buffer.slice(offset, offset + count * Type.BYTES_PER_ELEMENT));
+    return { data, shape };
+}
+
+function readNpz(filePath) {
+    const buf = fs.readFileSync(filePath);
+    const eocd = buf.lastIndexOf(Buffer.from([0x50, 0x4b, 0x05, 0x06]));
+    if (eocd < 0) throw new Error('Not a zip archive');
+
+    const arrays = {};
+    let ptr = buf.readUInt32LE(eocd + 16);
+    for (let i = buf.readUInt16LE(eocd + 10); i > 0; i--) {
+        if (buf.readUInt16LE(ptr + 10) !== 0) throw new Error('Compressed npz entries are not supported');
+        const size = buf.readUInt32LE(ptr + 20);
+        const nameLen = buf.readUInt16LE(ptr + 28);
+        const name = buf.toString('utf8', ptr + 46, ptr + 46 + nameLen);
+        const local = buf.readUInt32LE(ptr + 42);
+        const start = local + 30 + buf.readUInt16LE(local + 26) + buf.readUInt16LE(local + 28);
+        arrays[name.replace(/\.npy$/, '')] = parseNpy(buf.subarray(start, start + size));
+        ptr += 46 + nameLen + buf.readUInt16LE(ptr + 30) + buf.readUInt16LE(ptr + 32);
+    }
+    return arrays;
+}
+
+// Rebuild the JSON layout of export_to_json from the typed columns
+function readBimNpz(filePath) {
+    const a = readNpz(filePath);
+    const header = JSON.parse(Buffer.from(a.header.data.buffer, a.header.data.byteOffset,
+        a.header.data.length).toString('utf8'));
+    const round = (v) => Math.round(v * 1e4) / 1e4;
+    const point = (arr, i) => [round(arr[2 * i]), round(arr[2 * i + 1])];
+
+    const coords = a.wall_coords.data;
+    const walls = Array.from(a.wall_thickness.data, (thickness, i) => ({
+        start_point: point(coords, 2 * i),
+        end_point: point(coords, 2 * i + 1),
+        thickness: round(thickness),
+        height: round(a.wall_height.data[i])
+    }));
+
+    const offsets = a.room_offsets.data;
+    const rooms = header.room_names.map((name, i) => {
+        const corners = [];
+        for (let v = offsets[i]; v < offsets[i + 1]; v++) corners.push(point(a.room_vertices.data, v));
+        return { name, corners, area: round(a.room_areas.data[i]) };
+    });
+
+    const openings = (prefix) => Array.from(a[`${prefix}_widths`].data, (width, i) => ({
+        position: point(a[`${prefix}_positions`].data, i),
+        width: round(width),
+        ...(a[`${prefix}_heights`] ? { height: round(a[`${prefix}_heights`].data[i]) } : {}),
+        wall_index: a[`${prefix}_wall_index`].data[i]
+    }));
+
+    return {
+        walls,
+        rooms,
+        doors: header.has_doors ? openings('door') : null,
+        windows: header.has_windows ? openings('window') : null,
+        floors: header.floors,
+        floor_height: header.floor_height,
+        metadata: header.metadata
+    };
+}
+
 // --- ROUTES ---
 
 // 1. Health Check
@@ -109,14 +327,77 @@ app.get('/api/expenses', async (req, res) => {
 });
 
 // 5. BIM Converter Proxy
+// With {"stream": true} (or Accept: application/x-ndjson) the response is NDJSON: one line per
+// partial result as the detectors finish ({event: 'walls'|'rooms'|'openings'|'metrics', ...}),
+// then {event: 'result', ...model} or {event: 'error', error, details}.
 app.post('/api/bim/convert', async (req, res) => {
     console.log('========== BIM CONVERSION REQUEST RECEIVED ==========');
+    const stream = req.body?.stream === true || (req.get('Accept') || '').includes('application/x-ndjson');
+    const sendLine = (message) => res.write(JSON.stringify(message) + '\n');
+    const sendError = (status, body) => {
+        if (!stream) return res.status(status).json(body);
+        if (!res.headersSent) res.status(status);
+        sendLine({ event: 'error', ...body });
+        res.end();
+    };
     try {
-        const { image, scaleFactor = 0.05 } = req.body;
+        const { image, scaleFactor = 0.05, profile } = req.body;
         console.log('Image data length:', image ? image.length : 'NO IMAGE');
         console.log('Scale factor:', scaleFactor);
 
-        if (!image) return res.status(400).json({ error: 'No image data provided' });
+        if (!image) return sendError(400, { error: 'No image data provided' });
+
+        // Key of the job in bimPendingJobs, unique even for requests in the same millisecond
+        const requestId = crypto.randomUUID();
+        const base64Data = image.replace(/^data:image\/\w+;base64,/, "");
+        // Free the worker if the client gives up before the conversion finishes
+        res.on('close', () => {
+            if (!res.writableFinished) cancelBimJob(requestId);
+        });
+        if (stream) {
+            res.status(200).set({ 'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache' });
+            res.flushHeaders();
+        }
+        const jobOptions = {
+            id: requestId,
+            scale_factor: Number(scaleFactor),
+            stream,
+            // fast | balanced | accurate; the worker default applies when omitted
+            ...(profile ? { profile: String(profile) } : {})
+        };
+        const onProgress = stream ? ({ id, status, ...event }) => sendLine(event) : undefined;
+        const sendResult = (bimData) => {
+            console.log('Sending BIM response to client');
+            if (stream) {
+                sendLine({ event: 'result', ...bimData });
+                res.end();
+            } else {
+                res.json(bimData);
+            }
+            console.log('========== BIM CONVERSION COMPLETE ==========');
+        };
+        const sendFailure = (result) => {
+            console.error(`BIM Worker Error (${result.status}): ${result.error || ''}`);
+            return sendError(result.status === 'timeout' ? 504 : 500, {
+                error: result.status === 'timeout'
+                    ? 'BIM conversion timed out'
+                    : 'BIM engine failed. Python is required but not found or OpenCV is missing.',
+                details: result.error || result.status
+            });
+        };
+
+        if (BIM_TRANSPORT !== 'files') {
+            // No temp files: image bytes in, model and binary glTF back in the job result
+            console.log('Submitting in-memory BIM job:', requestId, 'base64 length:', base64Data.length);
+            const result = await runBimJob({ ...jobOptions, input_base64: base64Data, mesh: true }, onProgress);
+            console.log('BIM job finished:', result.status, result.elapsed_ms, 'ms');
+            if (result.status !== 'ok') return sendFailure(result);
+            const bimData = result.model;
+            if (result.mesh_base64) {
+                bimData.mesh = `data:model/gltf-binary;base64,${result.mesh_base64}`;
+            }
+            return sendResult(bimData);
+        }
 
         // Create temp directory if it doesn't exist
         const tempDir = path.join(__dirname, 'temp');
@@ -125,90 +406,80 @@ app.post('/api/bim/convert', async (req, res) => {
             fs.mkdirSync(tempDir);
         }
 
-        const requestId = Date.now();
         const inputPath = path.join(tempDir, `input_${requestId}.png`);
-        const outputPath = path.join(tempDir, `output_${requestId}.json`);
+        const outputPath = path.join(tempDir, `output_${requestId}.${BIM_OUTPUT_FORMAT === 'npz' ? 'npz' : 'json'}`);
+
+        const meshPath = path.join(tempDir, `mesh_${requestId}.glb`);
 
         console.log('Input path:', inputPath);
         console.log('Output path:', outputPath);
 
         // Save base64 image to file
         console.log('Decoding base64 image...');
-        const base64Data = image.replace(/^data:image\/\w+;base64,/, "");
         fs.writeFileSync(inputPath, base64Data, 'base64');
         console.log('Image saved successfully. File size:', fs.statSync(inputPath).size, 'bytes');
 
-        // Execute Python script
-        const scriptPath = path.join(__dirname, '..', 'scripts', 'blueprint_to_3d_bim.py');
-        console.log('Script path:', scriptPath);
-
-        // Try 'python' then 'python3'
-        const command = `python "${scriptPath}" "${inputPath}" "${outputPath}"`;
-
-        console.log(`Executing command: ${command}`);
-
-        exec(command, { timeout: 30000, maxBuffer: 10 * 1024 * 1024 }, (error, stdout, stderr) => {
-            console.log('Python execution completed');
-            console.log('STDOUT:', stdout);
-            console.log('STDERR:', stderr);
-
-            if (error) {
-                console.error(`BIM Exec Error (python): ${error.message}`);
-
-                // Try fallback to python3 if python failed
-                exec(`python3 "${scriptPath}" "${inputPath}" "${outputPath}"`, { timeout: 30000, maxBuffer: 10 * 1024 * 1024 }, (error3, stdout3, stderr3) => {
-                    console.log('Python3 execution completed');
-                    console.log('STDOUT3:', stdout3);
-                    console.log('STDERR3:', stderr3);
-
-                    if (error3) {
-                        console.error(`BIM Exec Error (python3): ${error3.message}`);
-                        return res.status(500).json({
-                            error: 'BIM engine failed. Python is required but not found or OpenCV is missing.',
-                            details: stderr3 || error3.message
-                        });
-                    }
-                    finalizeBimResponse();
-                });
-                return;
+        // Hand the job to the warm BIM worker
+        console.log('Submitting BIM job:', requestId);
+        const result = await runBimJob({
+            ...jobOptions,
+            input: inputPath,
+            output: outputPath,
+            output_format: BIM_OUTPUT_FORMAT,
+            mesh_output: meshPath
+        }, onProgress);
+        console.log('BIM job finished:', result);
+
+        if (result.status !== 'ok') {
+            try {
+                if (fs.existsSync(inputPath)) fs.unlinkSync(inputPath);
+                if (fs.existsSync(outputPath)) fs.unlinkSync(outputPath);
+                if (fs.existsSync(meshPath)) fs.unlinkSync(meshPath);
+            } catch (e) {
+                console.error("Cleanup error:", e);
             }
-            finalizeBimResponse();
-        });
+            return sendFailure(result);
+        }
+        finalizeBimResponse();
 
         function finalizeBimResponse() {
             console.log('Finalizing BIM response...');
 
             if (!fs.existsSync(outputPath)) {
                 console.error('Output file not found:', outputPath);
-                return res.status(500).json({ error: 'BIM engine did not produce an output file' });
+                return sendError(500, { error: 'BIM engine did not produce an output file' });
             }
 
             console.log('Output file exists. Size:', fs.statSync(outputPath).size, 'bytes');
 
             // Read results
-            const resultData = fs.readFileSync(outputPath, 'utf8');
-            console.log('Result data read. Parsing JSON...');
-            const bimData = JSON.parse(resultData);
+            const bimData = BIM_OUTPUT_FORMAT === 'npz'
+                ? readBimNpz(outputPath)
+                : JSON.parse(fs.readFileSync(outputPath, 'utf8'));
             console.log('BIM data parsed successfully. Rooms:', bimData.rooms?.length);
 
+            // Binary glTF of the extruded walls and slabs, loadable by the viewer as is
+            if (fs.existsSync(meshPath)) {
+                bimData.mesh = `data:model/gltf-binary;base64,${fs.readFileSync(meshPath).toString('base64')}`;
+            }
+
             // Cleanup
             try {
                 if (fs.existsSync(inputPath)) fs.unlinkSync(inputPath);
                 if (fs.existsSync(outputPath)) fs.unlinkSync(outputPath);
+                if (fs.existsSync(meshPath)) fs.unlinkSync(meshPath);
                 console.log('Temp files cleaned up');
             } catch (e) {
                 console.error("Cleanup error:", e);
             }
 
-            console.log('Sending BIM response to client');
-            res.json(bimData);
-            console.log('========== BIM CONVERSION COMPLETE ==========');
+            sendResult(bimData);
         }
     } catch (error) {
         console.error('========== BIM CONVERSION ERROR ==========');
         console.error('Error:', error);
         console.error('Stack:', error.stack);
-        res.status(500).json({ error: 'Server error during BIM conversion', details: error.message });
+        sendError(500, { error: 'Server error during BIM conversion', details: error.message });
     }
 });
 